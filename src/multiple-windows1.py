@@ -22,6 +22,7 @@ References:
 
 import argparse
 import logging
+import os
 import sys
 
 import config as conf
@@ -31,6 +32,11 @@ import time
 import threading
 
 from o3dgui import __version__
+from o3dgui.cloudio import CloudFile, is_mappable
+from o3dgui.geometry import IncrementalPointCloud
+from o3dgui.scheduler import UpdateScheduler
+from o3dgui.snapshot import ImageWriter, SnapshotRenderer, orbit_poses, pose_from_camera
+from o3dgui.timing import LatencyMonitor
 
 __author__ = "akiragishinichi"
 __copyright__ = "akiragishinichi"
@@ -85,6 +91,24 @@ def parse_args(args):
         version="O3dGui {ver}".format(ver=__version__),
     )
     parser.add_argument("--n", help="n-th Fibonacci number", type=int)
+    parser.add_argument(
+        "--animate",
+        help="jitter the cloud to exercise in-place geometry updates",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--snapshot-size",
+        help="snapshot resolution, WxH",
+        type=lambda text: tuple(int(value) for value in text.lower().split("x")),
+        default=(1920, 1080),
+    )
+    parser.add_argument(
+        "--snapshot-orbit",
+        help="render this many views around the cloud per snapshot instead of the current view",
+        type=int,
+        default=0,
+    )
+    parser.add_argument("--snapshot-dir", help="directory for snapshot images", default=".")
     parser.add_argument(
         "-v",
         "--verbose",
@@ -117,70 +141,136 @@ def setup_logging(loglevel):
 
 
 class MultiWinApp:
-    def __init__(self, *args, **kwargs):
+    def __init__(self, animate=False, snapshot_size=(1920, 1080), snapshot_orbit=0, snapshot_dir=".", *args, **kwargs):
         self.is_done = False
+        self.animate = animate
         self.cloud = None
+        self.live_cloud = None
+        self.scheduler = None
         self.main_vis = None
         self.n_snapshots = 0
-        self.snapshot_pos = None
+        self.snapshot_size = snapshot_size
+        self.snapshot_orbit = snapshot_orbit
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_renderer = None
+        self.snapshot_writer = None
+        self.latency = LatencyMonitor()
 
     def run(self):
         app = o3d.visualization.gui.Application.instance
         app.initialize()
 
         self.main_vis = o3d.visualization.O3DVisualizer("Open3D - Multi-Window Demo")
-        self.main_vis.add_action("Take snapshot in new window", self.on_snapshot)
+        self.main_vis.add_action("Take snapshot", self.on_snapshot)
         self.main_vis.set_on_close(self.on_main_window_closing)
+        self.scheduler = UpdateScheduler(lambda func: app.post_to_main_thread(self.main_vis, func))
 
         app.add_window(self.main_vis)
-        self.snapshot_pos = (self.main_vis.os_frame.x, self.main_vis.os_frame.y)
 
         threading.Thread(target=self.update_thread).start()
 
         app.run()
 
     def on_snapshot(self, vis):
-        pass
+        if self.live_cloud is None:
+            return
+        # Rendered offscreen from a second scene that keeps its own copy of
+        # the cloud; encoding and writing run on the writer's threads.
+        if self.snapshot_renderer is None:
+            self.snapshot_renderer = SnapshotRenderer(*self.snapshot_size, window=vis)
+            self.snapshot_writer = ImageWriter()
+            self.snapshot_renderer.set_points(*self.live_cloud.snapshot())
+        elif self.animate:
+            self.snapshot_renderer.set_points(*self.live_cloud.snapshot())
+
+        low, high = self.live_cloud.bounds()
+        view = pose_from_camera(vis.scene.camera, (low + high) / 2)
+        if self.snapshot_orbit:
+            radius = np.linalg.norm(view.eye - view.center)
+            poses = orbit_poses(view.center, radius, self.snapshot_orbit, up=view.up, fov=view.fov)
+        else:
+            poses = [view]
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        paths = [
+            os.path.join(self.snapshot_dir, f"snapshot_{self.n_snapshots + i:04d}.png") for i in range(len(poses))
+        ]
+        self.n_snapshots += len(poses)
+
+        with self.latency.measure("snapshot"):
+            futures = self.snapshot_renderer.render_batch(poses, paths, self.snapshot_writer)
+        for future in futures:
+            future.add_done_callback(self._on_snapshot_written)
+
+    def _on_snapshot_written(self, future):
+        if future.exception() is not None:
+            _logger.error("Snapshot failed: %s", future.exception())
+        else:
+            _logger.info("Snapshot written to %s", future.result())
 
     def on_main_window_closing(self):
         self.is_done = True
+        if self.snapshot_writer is not None:
+            self.snapshot_writer.close()
         return True
 
     def update_thread(self):
-        self.cloud = o3d.io.read_point_cloud(conf.CLOUD_PATH)
-        print(self.cloud)
-        bounds = self.cloud.get_axis_aligned_bounding_box()
+        with self.latency.measure("load_cloud"):
+            points, colors = self.read_cloud(conf.CLOUD_PATH)
+        _logger.info("Loaded %d points from %s", len(points), conf.CLOUD_PATH)
+        _logger.info("Latency: %s", self.latency.format_status())
+        bounds = o3d.geometry.AxisAlignedBoundingBox(
+            points.min(axis=0).astype(np.float64), points.max(axis=0).astype(np.float64))
         extent = bounds.get_extent()
 
+        self.live_cloud = IncrementalPointCloud(len(points), conf.CLOUD_NAME)
+        self.live_cloud.set(points, colors)
+
         def add_first_cloud():
-            mat = o3d.visualization.rendering.Material()
-            mat.shader = "defaultUnlit"
-            self.main_vis.add_geometry(conf.CLOUD_NAME, self.cloud, mat)
+            self.live_cloud.add_to(self.main_vis)
             self.main_vis.reset_camera_to_default()
             self.main_vis.setup_camera(60, bounds.get_center(), bounds.get_center() + [0, 0, -3], [0, -1, 0])
         
         o3d.visualization.gui.Application.instance.post_to_main_thread(self.main_vis, add_first_cloud)
 
+        rng = np.random.default_rng()
+        magnitude = (0.005 * extent).astype(np.float32)
+        displaced = np.empty_like(points)
         while not self.is_done:
             time.sleep(0.1)
+            if not self.animate:
+                continue
+
+            # Only the positions change: push them into the existing GPU
+            # buffers instead of remove_geometry + add_geometry.
+            with self.latency.measure("animate"):
+                np.multiply(rng.random(points.shape, dtype=np.float32) - 0.5, magnitude, out=displaced)
+                displaced += points
+                self.live_cloud.set(points=displaced)
+
+            if self.is_done:
+                break
 
-            # pts = np.asarray(self.cloud.points)
-            # magnitude = 0.005 * extent
-            # displacement = magnitude * (np.random.random_sample(pts.shape) - 0.5)
+            self.scheduler.submit("main_scene", self.update_cloud)
 
-            # new_pts = pts + displacement
-            # self.cloud.points = o3d.utility.Vector3dVector(new_pts)
+    def read_cloud(self, path):
+        """Read positions and colors as float32 arrays
 
-            # def update_cloud():
-            #     self.main_vis.remove_geometry(conf.CLOUD_NAME)
-            #     mat = o3d.visualization.rendering.Material()
-            #     mat.shader = "defaultUnlit"
-            #     self.main_vis.add_geometry(conf.CLOUD_NAME, self.cloud, mat)
+        Binary PLY/PCD files are memory-mapped and converted straight to the
+        float32 buffers the renderer wants; anything else goes through Open3D.
+        """
+        if is_mappable(path):
+            self.cloud = CloudFile(path)
+            colors = self.cloud.colors
+            if colors is not None:
+                colors = colors.astype(np.float32) * np.float32(1.0 / 255.0)
+            return np.asarray(self.cloud.xyz, dtype=np.float32), colors
 
-            # if self.is_done:
-            #     break
+        self.cloud = o3d.io.read_point_cloud(path)
+        colors = np.asarray(self.cloud.colors, dtype=np.float32) if self.cloud.has_colors() else None
+        return np.asarray(self.cloud.points, dtype=np.float32), colors
 
-            # o3d.visualization.gui.Application.instance.post_to_main_thread(self.main_vis, update_cloud)
+    def update_cloud(self, _=None):
+        self.live_cloud.push(self.main_vis.scene)
 
 def main(args):
     """Wrapper allowing :func:`fib` to be called with string arguments in a CLI fashion
@@ -199,7 +289,12 @@ def main(args):
     print("The {}-th Fibonacci number is {}".format(args.n, fib(args.n)))
 
     _logger.debug("Start MultiWinApp")
-    MultiWinApp().run()
+    MultiWinApp(
+        animate=args.animate,
+        snapshot_size=args.snapshot_size,
+        snapshot_orbit=args.snapshot_orbit,
+        snapshot_dir=args.snapshot_dir,
+    ).run()
 
     _logger.info("Script ends here")
 
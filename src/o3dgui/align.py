@@ -0,0 +1,309 @@
+"""
+Software alignment of depth and color frames.
+
+A depth pixel ``(u, v)`` with depth ``z`` lies at ``z * ray(u, v)`` in the
+depth camera; in the color camera it is at ``z * R ray(u, v) + t``. The
+rotated rays ``R ray`` only depend on the intrinsics and extrinsics, so
+:class:`DepthColorAligner` computes them once per configuration and aligning
+a frame is a handful of element-wise operations plus one gather (color to
+depth) or one ``np.minimum.at`` scatter (depth to color).
+
+:func:`align_color_to_depth_reference` is the straightforward per-frame
+version, kept for tests and benchmarks.
+"""
+
+import logging
+
+import numpy as np
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+_PIXEL = np.dtype((np.void, 3))
+
+
+def extrinsics_matrix(extrinsics):
+    """Rotation and translation of a Realsense-style extrinsics object
+
+    ``rs.extrinsics.rotation`` is a column-major 3x3 matrix in a flat list of
+    nine floats; plain ``(3, 3)`` arrays are taken as they are.
+
+    Returns:
+      Tuple[np.ndarray, np.ndarray]: (3, 3) rotation and (3,) translation
+    """
+    rotation = np.asarray(extrinsics.rotation, dtype=np.float64)
+    if rotation.shape == (9,):
+        rotation = rotation.reshape(3, 3).T
+    return rotation, np.asarray(extrinsics.translation, dtype=np.float64)
+
+
+def _intrinsics(intrinsics):
+    return (
+        int(intrinsics.width),
+        int(intrinsics.height),
+        float(intrinsics.fx),
+        float(intrinsics.fy),
+        float(intrinsics.ppx),
+        float(intrinsics.ppy),
+    )
+
+
+class DepthColorAligner:
+    """Align depth and color frames with cached per-pixel tables
+
+    Args:
+      depth_intrinsics: depth camera ``width``, ``height``, ``fx``, ``fy``,
+          ``ppx``, ``ppy``
+      color_intrinsics: same for the color camera
+      rotation (np.ndarray): (3, 3) rotation from depth to color camera
+      translation (np.ndarray): (3,) translation from depth to color, meters
+      depth_scale (float): meters per depth unit
+    """
+
+    def __init__(
+        self,
+        depth_intrinsics,
+        color_intrinsics,
+        rotation=None,
+        translation=None,
+        depth_scale=0.001,
+    ):
+        self.depth_intrinsics = _intrinsics(depth_intrinsics)
+        self.color_intrinsics = _intrinsics(color_intrinsics)
+        self.rotation = (
+            np.eye(3) if rotation is None else np.asarray(rotation, dtype=np.float64)
+        )
+        self.translation = (
+            np.zeros(3)
+            if translation is None
+            else np.asarray(translation, dtype=np.float64)
+        )
+        self.depth_scale = float(depth_scale)
+
+        width, height, fx, fy, cx, cy = self.depth_intrinsics
+        u = (np.arange(width, dtype=np.float64) - cx) / fx
+        v = (np.arange(height, dtype=np.float64) - cy) / fy
+        rays = np.empty((height, width, 3))
+        rays[..., 0] = u[None, :]
+        rays[..., 1] = v[:, None]
+        rays[..., 2] = 1.0
+        # Rotated rays with the depth scale folded in: X = depth * a + t
+        rotated = (rays @ self.rotation.T) * self.depth_scale
+        self._a = [
+            np.ascontiguousarray(rotated[..., i], dtype=np.float32) for i in range(3)
+        ]
+        self._t = self.translation.astype(np.float32)
+
+        shape = (height, width)
+        self._z = np.empty(shape, np.float32)
+        self._x = np.empty(shape, np.float32)
+        self._y = np.empty(shape, np.float32)
+        self._u = np.empty(shape, np.int32)
+        self._v = np.empty(shape, np.int32)
+        self._index = np.empty(shape, np.int32)
+        # Color pixels plus one black pixel that unseen depth pixels gather
+        color_width, color_height = self.color_intrinsics[:2]
+        self._sentinel = color_width * color_height
+        self._pixels = np.zeros(self._sentinel + 1, _PIXEL)
+        self._valid = np.empty(shape, bool)
+        self._scratch = np.empty(shape, bool)
+
+        # Without translation a pixel maps to the same place at any depth, so
+        # color-to-depth is a fixed gather.
+        self._static_index = None
+        if not self.translation.any():
+            self._project(
+                np.ones(shape, np.float32) / self.depth_scale, check_depth=False
+            )
+            self._static_index = self._index.copy()
+
+    @classmethod
+    def from_extrinsics(
+        cls, depth_intrinsics, color_intrinsics, extrinsics, depth_scale=0.001
+    ):
+        """Build from Realsense-style intrinsics and depth-to-color extrinsics"""
+        rotation, translation = extrinsics_matrix(extrinsics)
+        return cls(
+            depth_intrinsics, color_intrinsics, rotation, translation, depth_scale
+        )
+
+    @property
+    def is_identity(self):
+        """Whether the frames are already aligned, so nothing needs to be done"""
+        return (
+            self.depth_intrinsics == self.color_intrinsics
+            and np.allclose(self.rotation, np.eye(3))
+            and not self.translation.any()
+        )
+
+    def _project(self, depth, check_depth=True):
+        """Fill ``_index``/``_valid`` with the color pixel of every depth pixel"""
+        width, height, fx, fy, cx, cy = self.color_intrinsics
+        z, x, y = self._z, self._x, self._y
+        np.multiply(depth, self._a[2], out=z)
+        z += self._t[2]
+        np.multiply(depth, self._a[0], out=x)
+        x += self._t[0]
+        np.multiply(depth, self._a[1], out=y)
+        y += self._t[1]
+
+        np.greater(z, 0, out=self._valid)
+        if check_depth:
+            np.greater(depth, 0, out=self._scratch)
+            self._valid &= self._scratch
+        np.maximum(z, np.float32(1e-6), out=z)
+        # u = fx * x / z + cx, rounded to the nearest pixel
+        np.divide(x, z, out=x)
+        x *= np.float32(fx)
+        x += np.float32(cx + 0.5)
+        np.floor(x, out=x)
+        np.divide(y, z, out=y)
+        y *= np.float32(fy)
+        y += np.float32(cy + 0.5)
+        np.floor(y, out=y)
+        np.copyto(self._u, x, casting="unsafe")
+        np.copyto(self._v, y, casting="unsafe")
+
+        for coordinate, size in ((self._u, width), (self._v, height)):
+            np.greater_equal(coordinate, 0, out=self._scratch)
+            self._valid &= self._scratch
+            np.less(coordinate, size, out=self._scratch)
+            self._valid &= self._scratch
+        np.multiply(self._v, width, out=self._index)
+        self._index += self._u
+        np.logical_not(self._valid, out=self._scratch)
+        np.copyto(self._index, self._sentinel, where=self._scratch)
+
+    def color_to_depth(self, depth, color, out=None):
+        """Color frame resampled onto the depth pixels
+
+        Args:
+          depth (np.ndarray): (H, W) uint16 depth frame
+          color (np.ndarray): (Hc, Wc, 3) uint8 color frame
+          out (np.ndarray): optional (H, W, 3) uint8 output
+
+        Returns:
+          np.ndarray: the aligned color; black where no color pixel is seen
+        """
+        width, height = self.depth_intrinsics[:2]
+        if depth.shape != (height, width):
+            raise ValueError(
+                f"Depth frame is {depth.shape}, expected {(height, width)}"
+            )
+        color_width, color_height = self.color_intrinsics[:2]
+        if color.shape[:2] != (color_height, color_width):
+            raise ValueError(
+                f"Color frame is {color.shape}, expected {(color_height, color_width)}"
+            )
+        if out is None:
+            out = np.empty((height, width, 3), np.uint8)
+
+        if self._static_index is not None:
+            np.copyto(self._index, self._static_index)
+            np.equal(depth, 0, out=self._scratch)
+            np.copyto(self._index, self._sentinel, where=self._scratch)
+        else:
+            self._project(depth)
+        self._pixels[:-1] = np.ascontiguousarray(color).reshape(-1).view(_PIXEL)
+        np.take(
+            self._pixels,
+            self._index,
+            out=out.reshape(-1).view(_PIXEL).reshape(self._index.shape),
+        )
+        return out
+
+    def depth_to_color(self, depth, out=None):
+        """Depth frame re-projected into the color camera
+
+        When several depth pixels land on the same color pixel the nearest
+        one wins.
+
+        Args:
+          depth (np.ndarray): (H, W) uint16 depth frame
+          out (np.ndarray): optional (Hc, Wc) uint16 output
+
+        Returns:
+          np.ndarray: depth in color pixels, in the original depth units
+          (0 where no depth is known)
+        """
+        width, height = self.depth_intrinsics[:2]
+        if depth.shape != (height, width):
+            raise ValueError(
+                f"Depth frame is {depth.shape}, expected {(height, width)}"
+            )
+        color_width, color_height = self.color_intrinsics[:2]
+        if out is None:
+            out = np.empty((color_height, color_width), np.uint16)
+
+        self._project(depth)
+        # Depth along the color camera's axis, back in depth units
+        np.multiply(self._z, np.float32(1.0 / self.depth_scale), out=self._z)
+        np.rint(self._z, out=self._z)
+        np.minimum(self._z, np.float32(65534), out=self._z)
+        valid = self._valid.reshape(-1)
+        flat = out.reshape(-1)
+        flat.fill(65535)
+        np.minimum.at(
+            flat,
+            self._index.reshape(-1)[valid],
+            self._z.reshape(-1)[valid].astype(np.uint16),
+        )
+        flat[flat == 65535] = 0
+        return out
+
+
+def capture_aligner(capture, intrinsics, depth_scale=0.001):
+    """Aligner for a capture exposing ``color_intrinsics``/``extrinsics``
+
+    Returns:
+      DepthColorAligner: or ``None`` when the capture has no separate color
+      camera or its frames are already aligned
+    """
+    color_intrinsics = getattr(capture, "color_intrinsics", None)
+    if color_intrinsics is None:
+        return None
+    extrinsics = getattr(capture, "extrinsics", None)
+    if extrinsics is None:
+        aligner = DepthColorAligner(
+            intrinsics, color_intrinsics, depth_scale=depth_scale
+        )
+    else:
+        aligner = DepthColorAligner.from_extrinsics(
+            intrinsics, color_intrinsics, extrinsics, depth_scale
+        )
+    return None if aligner.is_identity else aligner
+
+
+def align_color_to_depth_reference(
+    depth,
+    color,
+    depth_intrinsics,
+    color_intrinsics,
+    rotation,
+    translation,
+    depth_scale=0.001,
+):
+    """Per-frame color-to-depth alignment without cached tables"""
+    width, height, fx, fy, cx, cy = _intrinsics(depth_intrinsics)
+    color_width, color_height, cfx, cfy, ccx, ccy = _intrinsics(color_intrinsics)
+    v, u = np.mgrid[0:height, 0:width]
+    z = depth.astype(np.float64) * depth_scale
+    points = np.stack([(u - cx) / fx * z, (v - cy) / fy * z, z], axis=-1)
+    points = points @ np.asarray(rotation).T + np.asarray(translation)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pu = np.floor(cfx * points[..., 0] / points[..., 2] + ccx + 0.5)
+        pv = np.floor(cfy * points[..., 1] / points[..., 2] + ccy + 0.5)
+    valid = (
+        (depth > 0)
+        & (points[..., 2] > 0)
+        & (pu >= 0)
+        & (pu < color_width)
+        & (pv >= 0)
+        & (pv < color_height)
+    )
+    out = np.zeros((height, width, 3), np.uint8)
+    out[valid] = color[pv[valid].astype(np.int64), pu[valid].astype(np.int64)]
+    return out
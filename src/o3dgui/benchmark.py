@@ -0,0 +1,567 @@
+"""
+Headless benchmarks for the capture-to-display pipeline.
+
+Every stage runs on replayed synthetic frames at several resolutions and
+reports per-frame latency percentiles and throughput as JSON, e.g.::
+
+    python -m o3dgui.benchmark --frames 200 --resolution 640x480 -o bench.json
+
+New stages are registered with :func:`stage`.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from o3dgui import __version__
+from o3dgui.align import DepthColorAligner, align_color_to_depth_reference
+from o3dgui.cloudexport import export_cloud
+from o3dgui.depthcodec import DepthCodec, DepthRecordingWriter
+from o3dgui.depthfilter import build_chain
+from o3dgui.depthvis import DepthColorizer
+from o3dgui.geometry import IncrementalPointCloud
+from o3dgui.pointcloud import DepthProjector
+from o3dgui.rawformat import RawRecordingReader, RawRecordingWriter
+from o3dgui.recorder import BLOCK, AsyncRecorder
+from o3dgui.replay import ReplayCapture, default_intrinsics, synthetic_frames
+from o3dgui.ringbuffer import FrameRingBuffer
+from o3dgui.roi import RegionOfInterest
+
+try:
+    import cv2
+except ImportError:  # pragma: no cover
+    cv2 = None
+
+try:
+    import open3d as o3d
+    import open3d.visualization.rendering as rendering
+except ImportError:  # pragma: no cover
+    o3d = None
+    rendering = None
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_RESOLUTIONS = ((320, 240), (640, 480), (1280, 720))
+DEFAULT_POINT_COUNTS = (100_000, 1_000_000, 5_000_000)
+
+STAGES = {}
+
+
+# ---- Python API ----
+
+
+def stage(name):
+    """Register a benchmark stage
+
+    The decorated function receives a :class:`Session` and returns a callable
+    that processes frame ``i``; it may return ``None`` when the stage cannot
+    run here (e.g. a missing optional dependency). A stage can register
+    cleanup with :meth:`Session.on_close`.
+    """
+
+    def register(setup):
+        STAGES[name] = setup
+        return setup
+
+    return register
+
+
+class Session:
+    """Synthetic frames recorded to a temporary ``.o3draw`` file
+
+    Args:
+      width (int): frame width
+      height (int): frame height
+      frames (int): number of distinct frames to record
+      workdir (str): directory for the recording and stage outputs
+    """
+
+    def __init__(self, width, height, frames, workdir):
+        self.width = width
+        self.height = height
+        self.workdir = workdir
+        self.path = os.path.join(workdir, f"session_{width}x{height}.o3draw")
+        streams = {
+            "color": ((height, width, 3), np.uint8),
+            "depth": ((height, width), np.uint16),
+        }
+        with RawRecordingWriter(self.path, streams) as writer:
+            for frame in synthetic_frames(width, height, count=frames):
+                writer.write(**frame)
+        self.reader = RawRecordingReader(self.path)
+        # Keep the frames resident so stages measure compute, not page faults.
+        self.color = np.array(self.reader.stream("color"))
+        self.depth = np.array(self.reader.stream("depth"))
+        self.intrinsics = default_intrinsics(width, height)
+        self._closers = []
+
+    def frame(self, i):
+        i %= len(self.depth)
+        return self.color[i], self.depth[i]
+
+    def on_close(self, func):
+        self._closers.append(func)
+
+    def close(self):
+        for func in reversed(self._closers):
+            func()
+        self.reader.close()
+
+
+@stage("acquisition")
+def _acquisition(session):
+    capture = ReplayCapture(session.reader, loop=True)
+    ring = FrameRingBuffer((session.height, session.width), np.uint16)
+    color = np.empty((session.height, session.width, 3), np.uint8)
+
+    def run(i):
+        _, _, depth = capture.read(color, return_depth=True)
+        ring.write(depth)
+        with ring.read_latest():
+            pass
+
+    return run
+
+
+@stage("bgr_to_rgb")
+def _bgr_to_rgb(session):
+    out = np.empty((session.height, session.width, 3), np.uint8)
+    if cv2 is not None:
+        return lambda i: cv2.cvtColor(session.frame(i)[0], cv2.COLOR_BGR2RGB, dst=out)
+    return lambda i: np.copyto(out, session.frame(i)[0][..., ::-1])
+
+
+@stage("depth_colormap")
+def _depth_colormap(session):
+    if cv2 is None:
+        return None
+
+    # Same as AppWindow's standardize_depth_image
+    def run(i, alpha=0.03, color_map=cv2.COLORMAP_JET):
+        depth = session.frame(i)[1]
+        return cv2.applyColorMap(cv2.convertScaleAbs(depth, alpha=alpha), color_map)
+
+    return run
+
+
+@stage("depth_colormap_lut")
+def _depth_colormap_lut(session):
+    colorizer = DepthColorizer(auto_range=True)
+    out = np.empty((session.height, session.width, 3), np.uint8)
+    return lambda i: colorizer.colorize(session.frame(i)[1], out=out)
+
+
+@stage("pointcloud")
+def _pointcloud(session):
+    projector = DepthProjector.from_intrinsics(session.intrinsics, depth_trunc=3.0)
+
+    def run(i):
+        color, depth = session.frame(i)
+        return projector.project(depth, color)
+
+    return run
+
+
+@stage("pointcloud_roi")
+def _pointcloud_roi(session):
+    # Central quarter of the frame at every other pixel, inside a 2 m box
+    w, h = session.width, session.height
+    roi = RegionOfInterest(
+        (w // 4, h // 4, w // 2, h // 2), [[-1.0, -1.0, 0.3], [1.0, 1.0, 2.3]], step=2
+    )
+    projector = DepthProjector.from_intrinsics(
+        roi.bind(session.intrinsics), depth_trunc=3.0, bounds=roi.bounds
+    )
+
+    def run(i):
+        color, depth = session.frame(i)
+        return projector.project(roi.crop(depth), roi.crop(color))
+
+    return run
+
+
+def _aligner_config(session):
+    # Color camera slightly offset and zoomed, like a D4xx's RGB sensor
+    depth = session.intrinsics
+    color = default_intrinsics(session.width, session.height)
+    color.fx *= 1.05
+    color.fy *= 1.05
+    rotation = np.array([[1.0, 0.002, 0.0], [-0.002, 1.0, 0.001], [0.0, -0.001, 1.0]])
+    return depth, color, rotation, np.array([0.015, 0.0, 0.0002])
+
+
+@stage("align_color_to_depth")
+def _align_color_to_depth(session):
+    aligner = DepthColorAligner(*_aligner_config(session))
+    out = np.empty((session.height, session.width, 3), np.uint8)
+
+    def run(i):
+        color, depth = session.frame(i)
+        return aligner.color_to_depth(depth, color, out=out)
+
+    return run
+
+
+@stage("align_color_to_depth_per_frame")
+def _align_color_to_depth_per_frame(session):
+    config = _aligner_config(session)
+
+    def run(i):
+        color, depth = session.frame(i)
+        return align_color_to_depth_reference(depth, color, *config)
+
+    return run
+
+
+@stage("align_depth_to_color")
+def _align_depth_to_color(session):
+    aligner = DepthColorAligner(*_aligner_config(session))
+    out = np.empty((session.height, session.width), np.uint16)
+    return lambda i: aligner.depth_to_color(session.frame(i)[1], out=out)
+
+
+def _filter_stage(name, spec):
+    @stage(name)
+    def _filter(session):
+        chain = build_chain(spec)
+        return lambda i: chain.process(session.frame(i)[1])
+
+    return _filter
+
+
+# Each filter on its own, then the usual chain (decimating first makes the
+# later filters cheaper)
+_filter_stage("filter_decimation", "decimation=2")
+_filter_stage("filter_spatial", "spatial")
+_filter_stage("filter_temporal", "temporal")
+_filter_stage("filter_chain", "decimation=2,spatial,temporal")
+
+
+@stage("recording")
+def _recording(session):
+    writer = RawRecordingWriter(
+        os.path.join(session.workdir, "recording.o3draw"),
+        {"color": ((session.height, session.width, 3), np.uint8)},
+    )
+    recorder = AsyncRecorder(
+        lambda frame: writer.write(color=frame), writer.close, maxsize=8, policy=BLOCK
+    )
+    session.on_close(recorder.close)
+    return lambda i: recorder.submit(session.frame(i)[0])
+
+
+@stage("depth_encode")
+def _depth_encode(session):
+    # One frame on the calling thread: the per-core encoding rate
+    codec = DepthCodec()
+    return lambda i: codec.encode(session.frame(i)[1])
+
+
+@stage("depth_encode_noisy")
+def _depth_encode_noisy(session):
+    # Sensor-like depth (sigma 3 noise, 5% holes) is much harder to compress
+    # than the smooth synthetic plane
+    depths = [
+        frame["depth"]
+        for frame in synthetic_frames(
+            session.width, session.height, count=4, noise=3.0, holes=0.05
+        )
+    ]
+    codec = DepthCodec()
+    ratio = depths[0].nbytes / len(codec.encode(depths[0]))
+    _logger.info(
+        "depth_encode_noisy %dx%d: %.2fx", session.width, session.height, ratio
+    )
+    return lambda i: codec.encode(depths[i % len(depths)])
+
+
+@stage("depth_recording")
+def _depth_recording(session):
+    writer = DepthRecordingWriter(
+        os.path.join(session.workdir, "recording.o3ddepth"),
+        (session.height, session.width),
+    )
+    session.on_close(writer.close)
+    return lambda i: writer.submit(session.frame(i)[1])
+
+
+@stage("export_cloud")
+def _export_cloud(session):
+    # Projected live clouds written one file per frame, as "Export live clouds"
+    projector = DepthProjector.from_intrinsics(session.intrinsics, depth_trunc=3.0)
+    directory = os.path.join(
+        session.workdir, f"export_{session.width}x{session.height}"
+    )
+    os.makedirs(directory, exist_ok=True)
+
+    def run(i):
+        color, depth = session.frame(i)
+        points, colors = projector.project(depth, color)
+        return export_cloud(
+            os.path.join(directory, f"cloud_{i % 8}.ply"), points, colors
+        )
+
+    return run
+
+
+def summarize(samples_ns):
+    """Latency summary of one stage
+
+    Args:
+      samples_ns (np.ndarray): per-frame latencies in nanoseconds
+
+    Returns:
+      dict: ``frames``, ``mean_ms``, ``p50_ms``, ``p95_ms``, ``p99_ms``,
+      ``max_ms`` and ``fps`` (frames per second at the mean latency)
+    """
+    ms = np.asarray(samples_ns, dtype=np.float64) / 1e6
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    mean = float(ms.mean())
+    return {
+        "frames": int(len(ms)),
+        "mean_ms": mean,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(ms.max()),
+        "fps": 1000.0 / mean if mean > 0 else float("inf"),
+    }
+
+
+def _meta():
+    return {
+        "version": __version__,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__ if cv2 is not None else None,
+        "open3d": o3d.__version__ if o3d is not None else None,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run_benchmarks(resolutions=DEFAULT_RESOLUTIONS, frames=100, warmup=5, stages=None):
+    """Run the registered stages
+
+    Args:
+      resolutions (List[Tuple[int, int]]): (width, height) pairs
+      frames (int): measured frames per stage and resolution
+      warmup (int): unmeasured frames run first
+      stages (List[str]): stage names, ``None`` for all of :data:`STAGES`
+
+    Returns:
+      dict: ``{"meta": {...}, "results": [{"stage", "width", "height", ...}]}``
+    """
+    names = list(STAGES) if stages is None else list(stages)
+    unknown = set(names) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stages: {sorted(unknown)}")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="o3dgui-bench-") as workdir:
+        for width, height in resolutions:
+            session = Session(width, height, min(frames, 30), workdir)
+            try:
+                for name in names:
+                    func = STAGES[name](session)
+                    if func is None:
+                        _logger.info("Skipping stage %s", name)
+                        continue
+                    for i in range(warmup):
+                        func(i)
+                    samples = np.empty(frames, dtype=np.int64)
+                    for i in range(frames):
+                        start = time.perf_counter_ns()
+                        func(i)
+                        samples[i] = time.perf_counter_ns() - start
+                    result = {"stage": name, "width": width, "height": height}
+                    result.update(summarize(samples))
+                    results.append(result)
+                    _logger.info(
+                        "%s %dx%d: %.3f ms", name, width, height, result["p50_ms"]
+                    )
+            finally:
+                session.close()
+
+    return {"meta": _meta(), "results": results}
+
+
+def run_geometry_benchmark(
+    point_counts=DEFAULT_POINT_COUNTS, repeats=10, size=(640, 480)
+):
+    """Compare in-place cloud updates with remove/add in an offscreen scene
+
+    Each sample moves every point, updates the scene and renders one frame so
+    the GPU upload is included. ``remove_add`` is the old MultiWinApp path
+    (fresh ``Vector3dVector``, ``remove_geometry`` then ``add_geometry``),
+    ``update_geometry`` is :class:`~o3dgui.geometry.IncrementalPointCloud`.
+
+    Args:
+      point_counts (List[int]): cloud sizes
+      repeats (int): measured updates per size and method
+      size (Tuple[int, int]): offscreen image size
+
+    Returns:
+      dict: ``{"meta": {...}, "results": [{"method", "points", ...}]}``
+    """
+    if o3d is None:
+        raise ImportError("The geometry benchmark needs open3d")
+    renderer = rendering.OffscreenRenderer(*size)
+    scene = renderer.scene
+    material = rendering.Material()
+    material.shader = "defaultUnlit"
+    rng = np.random.default_rng(0)
+
+    results = []
+    for n in point_counts:
+        points = rng.random((n, 3), dtype=np.float32)
+        colors = rng.random((n, 3), dtype=np.float32)
+        jitter = np.float32(0.001)
+
+        cloud = IncrementalPointCloud(n, "bench", material)
+        cloud.set(points, colors)
+        cloud.add_to(scene)
+        renderer.render_to_image()
+        samples = np.empty(repeats, dtype=np.int64)
+        for i in range(repeats):
+            points += jitter
+            start = time.perf_counter_ns()
+            cloud.set(points=points)
+            cloud.push(scene)
+            renderer.render_to_image()
+            samples[i] = time.perf_counter_ns() - start
+        scene.remove_geometry("bench")
+        results.append(dict(method="update_geometry", points=n, **summarize(samples)))
+
+        legacy = o3d.geometry.PointCloud()
+        legacy.colors = o3d.utility.Vector3dVector(colors.astype(np.float64))
+        scene.add_geometry("bench", legacy, material)
+        for i in range(repeats):
+            points += jitter
+            start = time.perf_counter_ns()
+            legacy.points = o3d.utility.Vector3dVector(points.astype(np.float64))
+            scene.remove_geometry("bench")
+            scene.add_geometry("bench", legacy, material)
+            renderer.render_to_image()
+            samples[i] = time.perf_counter_ns() - start
+        scene.remove_geometry("bench")
+        results.append(dict(method="remove_add", points=n, **summarize(samples)))
+        _logger.info("%d points: %s", n, results[-2:])
+
+    return {"meta": _meta(), "results": results}
+
+
+# ---- CLI ----
+
+
+def parse_resolution(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def parse_args(args):
+    """Parse command line parameters
+
+    Args:
+      args (List[str]): command line parameters as list of strings
+          (for example  ``["--help"]``).
+
+    Returns:
+      :obj:`argparse.Namespace`: command line parameters namespace
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the capture pipeline")
+    parser.add_argument(
+        "--version",
+        action="version",
+        version="O3dGui {ver}".format(ver=__version__),
+    )
+    parser.add_argument(
+        "-r",
+        "--resolution",
+        dest="resolutions",
+        type=parse_resolution,
+        action="append",
+        help="WIDTHxHEIGHT, may be repeated (default: 320x240, 640x480, 1280x720)",
+    )
+    parser.add_argument(
+        "-n", "--frames", type=int, default=100, help="frames per stage"
+    )
+    parser.add_argument(
+        "-s",
+        "--stage",
+        dest="stages",
+        action="append",
+        choices=sorted(STAGES),
+        help="stage to run, may be repeated (default: all)",
+    )
+    parser.add_argument(
+        "--geometry",
+        action="store_true",
+        help="benchmark in-place point-cloud updates against remove/add instead",
+    )
+    parser.add_argument(
+        "-p",
+        "--points",
+        dest="point_counts",
+        type=int,
+        action="append",
+        help="cloud size for --geometry, may be repeated (default: 100k, 1M, 5M)",
+    )
+    parser.add_argument("-o", "--output", help="write the JSON results to this file")
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        dest="loglevel",
+        help="set loglevel to INFO",
+        action="store_const",
+        const=logging.INFO,
+    )
+    return parser.parse_args(args)
+
+
+def main(args):
+    """Run the benchmarks and print (or save) the JSON results
+
+    Args:
+      args (List[str]): command line parameters as list of strings
+    """
+    args = parse_args(args)
+    logging.basicConfig(level=args.loglevel or logging.WARNING, stream=sys.stderr)
+    if args.geometry:
+        report = run_geometry_benchmark(
+            point_counts=args.point_counts or DEFAULT_POINT_COUNTS,
+            repeats=args.frames,
+        )
+    else:
+        report = run_benchmarks(
+            resolutions=args.resolutions or DEFAULT_RESOLUTIONS,
+            frames=args.frames,
+            stages=args.stages,
+        )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def run():
+    """Calls :func:`main` passing the CLI arguments extracted from :obj:`sys.argv`"""
+    main(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    run()
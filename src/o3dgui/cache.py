@@ -0,0 +1,276 @@
+"""
+On-disk cache of derived point-cloud data.
+
+Entries are directories of ``.npy`` arrays (memory-mapped on read) plus an
+``entry.json`` with metadata. They are keyed by a digest of the source file's
+content and the processing parameters, so edits to a file or different
+settings never hit a stale entry, while renaming or copying a file does not
+miss. The digests themselves are remembered per (path, size, mtime), so a
+reopened file is not hashed again.
+
+The cache is capped in size; the least recently used entries are evicted
+first.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+ENTRY_FILE = "entry.json"
+DIGEST_FILE = "digests.json"
+DEFAULT_MAX_BYTES = 4 << 30
+
+
+def default_cache_dir():
+    """``$O3DGUI_CACHE_DIR``, else ``~/.cache/o3dgui``"""
+    path = os.environ.get("O3DGUI_CACHE_DIR")
+    if path:
+        return path
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "o3dgui")
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """BLAKE2b digest of the content of ``path``"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _dir_size(path):
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_file(follow_symlinks=False):
+            total += entry.stat().st_size
+    return total
+
+
+class CacheEntry:
+    """A cached entry: arrays are memory-mapped on first access
+
+    Attributes:
+      path (str): entry directory
+      meta (dict): metadata stored with the entry
+    """
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self._arrays = {}
+
+    def __contains__(self, name):
+        return os.path.exists(os.path.join(self.path, name + ".npy"))
+
+    def __getitem__(self, name):
+        array = self._arrays.get(name)
+        if array is None:
+            file = os.path.join(self.path, name + ".npy")
+            if not os.path.exists(file):
+                raise KeyError(name)
+            array = self._arrays[name] = np.load(file, mmap_mode="r")
+        return array
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+
+class CloudCache:
+    """Size-capped LRU cache of derived arrays
+
+    Args:
+      root (str): cache directory, created on demand; defaults to
+          :func:`default_cache_dir`
+      max_bytes (int): total size above which old entries are evicted
+    """
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root or default_cache_dir()
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._digests = None
+        self.hits = 0
+        self.misses = 0
+
+    def known_digest(self, path):
+        """Remembered digest of ``path``, ``None`` if it would need hashing"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            known = self._load_digests().get(path)
+        if known is not None and known["stamp"] == [stat.st_size, stat.st_mtime_ns]:
+            return known["digest"]
+        return None
+
+    def digest(self, path):
+        """Content digest of ``path``, remembered per (path, size, mtime)"""
+        digest = self.known_digest(path)
+        if digest is not None:
+            return digest
+
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        digest = file_digest(path)
+        with self._lock:
+            self._load_digests()[path] = {
+                "stamp": [stat.st_size, stat.st_mtime_ns],
+                "digest": digest,
+            }
+            self._save_digests()
+        return digest
+
+    @staticmethod
+    def key(digest, **params):
+        """Entry key of a source digest and processing parameters"""
+        blob = json.dumps(
+            {"digest": digest, "params": params}, sort_keys=True, default=str
+        )
+        return hashlib.blake2b(blob.encode(), digest_size=16).hexdigest()
+
+    def _load_digests(self):
+        if self._digests is None:
+            try:
+                with open(os.path.join(self.root, DIGEST_FILE)) as f:
+                    self._digests = json.load(f)
+            except (OSError, ValueError):
+                self._digests = {}
+        return self._digests
+
+    def _save_digests(self):
+        os.makedirs(self.root, exist_ok=True)
+        temp = os.path.join(self.root, f".{DIGEST_FILE}.{uuid.uuid4().hex}")
+        with open(temp, "w") as f:
+            json.dump(self._digests, f)
+        os.replace(temp, os.path.join(self.root, DIGEST_FILE))
+
+    def _entry_path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        """The entry stored under ``key``, or ``None``; marks it as used"""
+        path = self._entry_path(key)
+        try:
+            with open(os.path.join(path, ENTRY_FILE)) as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        now = time.time()
+        try:
+            os.utime(os.path.join(path, ENTRY_FILE), (now, now))
+        except OSError:
+            pass
+        return CacheEntry(path, info.get("meta", {}))
+
+    def put_dir(self, key, write, meta=None):
+        """Store an entry whose files are written by ``write(directory)``
+
+        The directory only becomes visible once ``write`` returned, so readers
+        never see a half-written entry.
+
+        Returns:
+          :obj:`CacheEntry`: the stored entry
+        """
+        os.makedirs(self.root, exist_ok=True)
+        temp = os.path.join(self.root, f".tmp-{key}-{uuid.uuid4().hex}")
+        os.makedirs(temp)
+        try:
+            write(temp)
+            with open(os.path.join(temp, ENTRY_FILE), "w") as f:
+                json.dump({"key": key, "meta": meta or {}, "created": time.time()}, f)
+            path = self._entry_path(key)
+            with self._lock:
+                if os.path.exists(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                os.replace(temp, path)
+        except BaseException:
+            shutil.rmtree(temp, ignore_errors=True)
+            raise
+        self.evict(keep=key)
+        return CacheEntry(path, meta or {})
+
+    def put(self, key, arrays, meta=None):
+        """Store ``arrays`` (a dict of name to array) and ``meta``"""
+
+        def write(directory):
+            for name, array in arrays.items():
+                if array is not None:
+                    np.save(
+                        os.path.join(directory, name + ".npy"),
+                        np.ascontiguousarray(array),
+                    )
+
+        return self.put_dir(key, write, meta)
+
+    def get_or_create(self, key, compute, meta=None):
+        """Entry under ``key``, storing ``compute()`` arrays on a miss"""
+        entry = self.get(key)
+        if entry is None:
+            entry = self.put(key, compute(), meta)
+        return entry
+
+    def remove(self, key):
+        shutil.rmtree(self._entry_path(key), ignore_errors=True)
+
+    def entries(self):
+        """(last use, size, key) of every entry, least recently used first"""
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for item in os.scandir(self.root):
+            if not item.is_dir() or item.name.startswith("."):
+                continue
+            try:
+                used = os.stat(os.path.join(item.path, ENTRY_FILE)).st_mtime
+                found.append((used, _dir_size(item.path), item.name))
+            except OSError:
+                continue
+        found.sort()
+        return found
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until under ``max_bytes``
+
+        Returns:
+          int: number of evicted entries
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            _logger.debug("Evicting cache entry %s (%d bytes)", key, size)
+            self.remove(key)
+            total -= size
+            evicted += 1
+        return evicted
+
+    def clear(self):
+        for _, _, key in self.entries():
+            self.remove(key)
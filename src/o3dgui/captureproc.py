@@ -0,0 +1,361 @@
+"""
+Capture and per-frame processing in a separate process.
+
+:class:`CaptureProcess` starts a worker process that opens the capture,
+runs a frame pipeline (by default :class:`DepthPipeline`: depth colormap and
+back-projection) and writes the results straight into a
+:class:`~o3dgui.sharedring.SharedFrameRing`. The GUI process only maps the
+ring and displays what it finds there, so capture and NumPy work no longer
+compete with the GUI thread for the GIL.
+
+The control channel is a ``multiprocessing.Pipe`` carrying small messages
+only: the worker announces its stream layout, the parent answers with the
+shared block's name, and then sends ``pause``/``resume``/``stop``.
+"""
+
+import logging
+import multiprocessing
+
+import numpy as np
+
+from o3dgui.align import capture_aligner
+from o3dgui.depthfilter import build_chain
+from o3dgui.depthvis import DepthColorizer
+from o3dgui.pointcloud import DepthProjector
+from o3dgui.rawformat import RawRecordingReader
+from o3dgui.replay import ReplayCapture, default_intrinsics, synthetic_frames
+from o3dgui.sharedring import SharedFrameRing
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+class RealsenseSource:
+    """Depth + color Realsense pipeline with the replay capture interface"""
+
+    def __init__(self, serial=None, width=640, height=480, fps=30):
+        import pyrealsense2 as rs
+
+        self.pipeline = rs.pipeline()
+        config = rs.config()
+        if serial:
+            config.enable_device(serial)
+        config.enable_stream(rs.stream.depth, width, height, rs.format.z16, fps)
+        config.enable_stream(rs.stream.color, width, height, rs.format.rgb8, fps)
+        profile = self.pipeline.start(config)
+        depth_profile = profile.get_stream(rs.stream.depth).as_video_stream_profile()
+        color_profile = profile.get_stream(rs.stream.color).as_video_stream_profile()
+        self.intrinsics = depth_profile.get_intrinsics()
+        self.color_intrinsics = color_profile.get_intrinsics()
+        self.extrinsics = depth_profile.get_extrinsics_to(color_profile)
+        self.depth_scale = profile.get_device().first_depth_sensor().get_depth_scale()
+        self.camera_is_open = True
+
+    def read(self, image=None, return_depth=False):
+        frames = self.pipeline.wait_for_frames()
+        depth_frame, color_frame = frames.get_depth_frame(), frames.get_color_frame()
+        if not depth_frame or not color_frame:
+            return (False, None, None) if return_depth else (False, None)
+        color = np.asarray(color_frame.get_data())
+        if return_depth:
+            return True, color, np.asarray(depth_frame.get_data())
+        return True, color
+
+    def isOpened(self):
+        return self.camera_is_open
+
+    def release(self):
+        self.camera_is_open = False
+        self.pipeline.stop()
+
+
+def open_source(source, fps=30):
+    """Open a capture from a picklable description
+
+    Args:
+      source (str): ``"synthetic"``, a ``.o3draw`` path, ``"realsense"`` or
+          ``"realsense:<serial>"``
+      fps (float): replay rate of recorded and synthetic sources
+    """
+    if source == "synthetic":
+        return ReplayCapture(synthetic_frames(), fps=fps)
+    if source.startswith("realsense"):
+        _, _, serial = source.partition(":")
+        return RealsenseSource(serial or None)
+    return ReplayCapture(RawRecordingReader(source), fps=fps, loop=True)
+
+
+class DepthPipeline:
+    """Default per-frame work: copy color, colorize depth, back-project
+
+    Args:
+      intrinsics: depth intrinsics (``width``, ``height``, ``fx``, ...)
+      depth_scale (float): meters per depth unit
+      depth_trunc (float): ignore depth beyond this distance, in meters
+      aligner (DepthColorAligner): resamples color onto the depth pixels
+          before back-projection; ``None`` when they are already aligned
+      depth_filter (DepthFilterChain): applied to depth first; with
+          decimation, ``intrinsics`` and ``aligner`` describe its output
+      roi (RegionOfInterest): bound region cropped before the filters;
+          ``intrinsics`` and ``aligner`` then describe the crop
+    """
+
+    def __init__(
+        self,
+        intrinsics,
+        depth_scale=0.001,
+        depth_trunc=3.0,
+        aligner=None,
+        depth_filter=None,
+        roi=None,
+    ):
+        self.projector = DepthProjector.from_intrinsics(
+            intrinsics,
+            depth_scale=depth_scale,
+            depth_trunc=depth_trunc,
+            bounds=roi.bounds if roi else None,
+        )
+        self.colorizer = DepthColorizer(auto_range=True)
+        self.width, self.height = intrinsics.width, intrinsics.height
+        self.aligner = None if aligner is None or aligner.is_identity else aligner
+        self.depth_filter = depth_filter
+        self.roi = roi
+        self._aligned = np.empty((self.height, self.width, 3), np.uint8)
+
+    def streams(self, color_shape):
+        n_points = self.width * self.height
+        return {
+            "color": (color_shape, "u1"),
+            "depth_vis": ((self.height, self.width, 3), "u1"),
+            "points": ((n_points, 3), "f4"),
+            "colors": ((n_points, 3), "f4"),
+        }
+
+    def process(self, color, depth, out):
+        """Fill the slot arrays in ``out``; returns the number of points"""
+        np.copyto(out["color"], color)
+        if self.roi is not None:
+            depth = self.roi.crop(depth)
+        if self.depth_filter is not None:
+            depth = self.depth_filter.process(depth)
+        self.colorizer.colorize(depth, out=out["depth_vis"])
+        if self.aligner is not None:
+            color = self.aligner.color_to_depth(depth, color, out=self._aligned)
+        else:
+            if self.roi is not None:
+                color = self.roi.crop(color)
+            if self.depth_filter is not None:
+                color = self.depth_filter.decimate(color)
+        points, colors = self.projector.project(depth, color)
+        count = len(points)
+        out["points"][:count] = points
+        if colors is not None:
+            out["colors"][:count] = colors
+        return count
+
+
+def _worker_main(source, fps, conn, lock, event, slots, depth_filters=None, roi=None):
+    capture = ring = None
+    try:
+        capture = open_source(source, fps)
+        ok, color, depth = capture.read(return_depth=True)
+        if not ok:
+            raise RuntimeError(f"Cannot read from {source}")
+        intrinsics = getattr(capture, "intrinsics", None) or default_intrinsics(
+            depth.shape[1], depth.shape[0]
+        )
+        depth_scale = getattr(capture, "depth_scale", 0.001)
+        if roi is not None:
+            intrinsics = roi.bind(intrinsics)
+        depth_filter = build_chain(depth_filters) if depth_filters else None
+        if depth_filter is not None:
+            intrinsics = depth_filter.scale_intrinsics(intrinsics)
+        pipeline = DepthPipeline(
+            intrinsics,
+            depth_scale,
+            aligner=capture_aligner(capture, intrinsics, depth_scale),
+            depth_filter=depth_filter,
+            roi=roi,
+        )
+        streams = pipeline.streams(color.shape)
+        conn.send(
+            (
+                "ready",
+                {
+                    "streams": streams,
+                    "intrinsics": {
+                        name: getattr(intrinsics, name)
+                        for name in ("width", "height", "fx", "fy", "ppx", "ppy")
+                    },
+                },
+            )
+        )
+        message, name = conn.recv()
+        if message != "ring":
+            return
+        ring = SharedFrameRing.attach(name, streams, lock, event, slots)
+
+        paused = False
+        while True:
+            while conn.poll(0 if not paused else 0.1):
+                command = conn.recv()
+                if command == "stop":
+                    return
+                paused = command == "pause"
+            if paused:
+                continue
+            if color is None:
+                ok, color, depth = capture.read(return_depth=True)
+                if not ok:
+                    if not capture.isOpened():
+                        conn.send(("ended", None))
+                        return
+                    continue
+            slot, out = ring.acquire()
+            count = pipeline.process(color, depth, out)
+            ring.publish(slot, count)
+            color = depth = None
+    except Exception as error:
+        _logger.exception("Capture process failed")
+        conn.send(("error", repr(error)))
+    finally:
+        if ring is not None:
+            ring.close()
+        if capture is not None:
+            capture.release()
+
+
+class CaptureProcess:
+    """Capture + processing worker process feeding a shared ring
+
+    Args:
+      source (str): see :func:`open_source`
+      fps (float): rate of recorded and synthetic sources
+      slots (int): ring slots
+      start_method (str): ``multiprocessing`` start method
+      depth_filters (str): :func:`~o3dgui.depthfilter.build_chain` spec run
+          on the depth in the worker
+      roi (RegionOfInterest): region cropped in the worker, bound there
+    """
+
+    def __init__(
+        self,
+        source,
+        fps=30,
+        slots=3,
+        start_method="spawn",
+        depth_filters=None,
+        roi=None,
+    ):
+        self.source = source
+        self.depth_filters = depth_filters
+        self.roi = roi
+        self.fps = fps
+        self.slots = slots
+        self._context = multiprocessing.get_context(start_method)
+        self._lock = self._context.Lock()
+        self._event = self._context.Event()
+        self._conn = None
+        self._process = None
+        self.ring = None
+        self.info = None
+        self.error = None
+        self.ended = False
+
+    def start(self, timeout=30.0):
+        """Start the worker and wait until it published its layout"""
+        self._conn, child = self._context.Pipe()
+        self._process = self._context.Process(
+            target=_worker_main,
+            args=(
+                self.source,
+                self.fps,
+                child,
+                self._lock,
+                self._event,
+                self.slots,
+                self.depth_filters,
+                self.roi,
+            ),
+            name="CaptureProcess",
+            daemon=True,
+        )
+        self._process.start()
+        child.close()
+        if not self._conn.poll(timeout):
+            self.stop()
+            raise TimeoutError("Capture process did not start")
+        message, payload = self._conn.recv()
+        if message != "ready":
+            self.stop()
+            raise RuntimeError(f"Capture process failed: {payload}")
+        self.info = payload
+        self.ring = SharedFrameRing.create(
+            payload["streams"], self._lock, self._event, self.slots
+        )
+        self._conn.send(("ring", self.ring.name))
+        return self
+
+    def poll(self):
+        """Handle worker messages; returns ``False`` once it is gone"""
+        try:
+            while self._conn is not None and self._conn.poll():
+                message, payload = self._conn.recv()
+                if message == "error":
+                    self.error = payload
+                elif message == "ended":
+                    self.ended = True
+        except (EOFError, OSError):
+            pass
+        return self._process is not None and self._process.is_alive()
+
+    def _send(self, command):
+        if self._conn is not None:
+            try:
+                self._conn.send(command)
+            except (BrokenPipeError, OSError):
+                pass
+
+    def pause(self):
+        self._send("pause")
+
+    def resume(self):
+        self._send("resume")
+
+    def stop(self, timeout=5.0):
+        self._send("stop")
+        if self._process is not None:
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join()
+            self._process = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def frames(self, timeout=1.0):
+        """Iterate over ``(sequence, views, meta)`` until the worker ends
+
+        The views are only valid until the next iteration.
+        """
+        while True:
+            if self.ring.wait(timeout):
+                with self.ring.read_latest() as frame:
+                    if frame[1] is not None:
+                        yield frame
+                continue
+            if not self.poll() or self.ended:
+                return
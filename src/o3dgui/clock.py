@@ -0,0 +1,111 @@
+"""
+Deadline-based frame pacing.
+
+Frames are scheduled against absolute deadlines ``start + k * period`` taken
+from :func:`time.perf_counter`, so the time spent processing a frame is not
+added on top of the frame period. When a deadline has already passed by more
+than a full period, the missed frames are skipped instead of being caught up
+in a burst.
+"""
+
+import logging
+import math
+import time
+from collections import deque
+
+import numpy as np
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+class FrameClock:
+    """Pace a loop at a fixed frame rate
+
+    Call :meth:`wait` once per iteration, before producing the frame.
+
+    Args:
+      fps (float): target frame rate
+      history (int): number of recent ticks kept for the statistics
+      clock (Callable[[], float]): monotonic time source, defaults to
+          :func:`time.perf_counter`
+      sleep (Callable[[float], None]): sleep function, defaults to
+          :func:`time.sleep`
+    """
+
+    def __init__(self, fps, history=120, clock=time.perf_counter, sleep=time.sleep):
+        if fps <= 0:
+            raise ValueError("fps must be positive")
+        self.fps = float(fps)
+        self.period = 1.0 / self.fps
+        self._clock = clock
+        self._sleep = sleep
+        self._ticks = deque(maxlen=max(2, history))
+        self._deadline = None
+        self.frames = 0
+        self.skipped = 0
+
+    def reset(self):
+        """Forget the schedule; the next :meth:`wait` starts a new one"""
+        self._deadline = None
+        self._ticks.clear()
+
+    def wait(self):
+        """Sleep until the next deadline
+
+        Returns:
+          int: number of frames skipped because their deadline was missed
+        """
+        now = self._clock()
+        if self._deadline is None:
+            self._deadline = now
+
+        skipped = 0
+        late = now - self._deadline
+        if late < 0:
+            self._sleep(-late)
+            now = self._clock()
+        elif late >= self.period:
+            skipped = int(math.floor(late / self.period))
+            self._deadline += skipped * self.period
+            self.skipped += skipped
+
+        self._ticks.append(now)
+        self.frames += 1
+        self._deadline += self.period
+        return skipped
+
+    @property
+    def achieved_fps(self):
+        """Frame rate measured over the recent ticks (0 until two ticks)"""
+        if len(self._ticks) < 2:
+            return 0.0
+        span = self._ticks[-1] - self._ticks[0]
+        if span <= 0:
+            return 0.0
+        return (len(self._ticks) - 1) / span
+
+    @property
+    def jitter(self):
+        """Standard deviation of the recent tick intervals, in seconds"""
+        if len(self._ticks) < 3:
+            return 0.0
+        return float(np.std(np.diff(np.asarray(self._ticks))))
+
+    def stats(self):
+        """Summary of the pacing
+
+        Returns:
+          dict: ``target_fps``, ``achieved_fps``, ``jitter_ms``, ``frames`` and
+          ``skipped``
+        """
+        return {
+            "target_fps": self.fps,
+            "achieved_fps": self.achieved_fps,
+            "jitter_ms": self.jitter * 1000.0,
+            "frames": self.frames,
+            "skipped": self.skipped,
+        }
@@ -0,0 +1,511 @@
+"""
+Streaming export of point clouds to binary PLY and PCD.
+
+:class:`CloudWriter` writes the header up front and then converts the cloud
+chunk by chunk into one reusable record buffer, so memory stays constant
+whatever the size of the cloud; the source arrays may well be memory-mapped
+(:class:`~o3dgui.cloudio.CloudFile`, :class:`~o3dgui.lod.LodCloud`). Chunks
+are several MB and written unbuffered, which keeps the disk streaming
+sequentially. A ``.gz`` suffix (``cloud.ply.gz``) selects the compressed
+variant: the same file through a gzip stream.
+
+:class:`ExportJob` runs one export on a worker thread with progress and
+cancellation; :class:`FrameCloudExporter` writes the live clouds of a time
+window to one file per frame.
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from o3dgui.loader import CancelToken, LoadCancelled
+from o3dgui.recorder import BLOCK, DROP
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+COMPRESSED_SUFFIX = ".gz"
+CHUNK_POINTS = 1 << 18
+
+_PLY_NAMES = {"f4": "float", "u1": "uchar"}
+
+
+def export_format(path):
+    """Cloud format and compression of an export path
+
+    Returns:
+      Tuple[str, bool]: ``"ply"`` or ``"pcd"`` and whether it is gzipped
+    """
+    base = path.lower()
+    compressed = base.endswith(COMPRESSED_SUFFIX)
+    if compressed:
+        base = base[: -len(COMPRESSED_SUFFIX)]
+    extension = os.path.splitext(base)[1]
+    if extension not in (".ply", ".pcd"):
+        raise ValueError(f"Cannot export to {path}: use .ply, .pcd, .ply.gz or .pcd.gz")
+    return extension[1:], compressed
+
+
+def record_dtype(kind, colors=False, normals=False):
+    """Per-point record of an exported file
+
+    PLY stores colors as three ``uchar``; PCD packs them into one 4-byte
+    ``rgb`` field (``0x00RRGGBB``, stored as a float like PCL does).
+    """
+    fields = [("x", "<f4"), ("y", "<f4"), ("z", "<f4")]
+    if normals:
+        names = (
+            ("nx", "ny", "nz")
+            if kind == "ply"
+            else ("normal_x", "normal_y", "normal_z")
+        )
+        fields += [(name, "<f4") for name in names]
+    if colors:
+        fields += (
+            [("red", "u1"), ("green", "u1"), ("blue", "u1")]
+            if kind == "ply"
+            else [("rgb", "<u4")]
+        )
+    return np.dtype(fields)
+
+
+def _ply_header(count, dtype):
+    lines = ["ply", "format binary_little_endian 1.0", f"element vertex {count}"]
+    lines += [
+        f"property {_PLY_NAMES[dtype[name].str[1:]]} {name}" for name in dtype.names
+    ]
+    lines.append("end_header")
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+def _pcd_header(count, dtype):
+    names = dtype.names
+    lines = [
+        "# .PCD v0.7 - Point Cloud Data file format",
+        "VERSION 0.7",
+        "FIELDS " + " ".join(names),
+        "SIZE " + " ".join("4" for _ in names),
+        # The packed color is declared as a float, like PCL writes it
+        "TYPE " + " ".join("F" for _ in names),
+        "COUNT " + " ".join("1" for _ in names),
+        f"WIDTH {count}",
+        "HEIGHT 1",
+        "VIEWPOINT 0 0 0 1 0 0 0",
+        f"POINTS {count}",
+        "DATA binary",
+    ]
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+def _to_u8(values, out):
+    """Colors in [0, 1] (floats) or 0..255 (integers) into a uint8 array"""
+    if values.dtype == np.uint8:
+        np.copyto(out, values)
+    else:
+        scaled = np.multiply(values, 255.0, dtype=np.float32)
+        np.clip(scaled, 0, 255, out=scaled)
+        np.add(scaled, 0.5, out=scaled)
+        np.copyto(out, scaled, casting="unsafe")
+
+
+class CloudWriter:
+    """Writes a cloud of known size to PLY/PCD chunk by chunk
+
+    The file is written as ``<path>.part`` and renamed on :meth:`close`, so a
+    failed or cancelled export never leaves a truncated cloud behind.
+
+    Args:
+      path (str): ``.ply``, ``.pcd``, ``.ply.gz`` or ``.pcd.gz``
+      count (int): total number of points that will be written
+      colors (bool): write colors
+      normals (bool): write normals
+      chunk_points (int): points converted and written at once
+      level (int): gzip level of the compressed variant
+    """
+
+    def __init__(
+        self,
+        path,
+        count,
+        colors=False,
+        normals=False,
+        chunk_points=CHUNK_POINTS,
+        level=1,
+    ):
+        self.path = path
+        self.kind, compressed = export_format(path)
+        self.count = int(count)
+        self.dtype = record_dtype(self.kind, colors, normals)
+        self.colors, self.normals = bool(colors), bool(normals)
+        self.written = 0
+        self.bytes_written = 0
+        self._buffer = np.empty(max(1, min(chunk_points, self.count)), self.dtype)
+        # (N, 3) views of each attribute group, filled with one copy per chunk
+        self._xyz = self._group("x", "<f4")
+        self._normals = self._group(self.dtype.names[3], "<f4") if normals else None
+        if colors and self.kind == "ply":
+            self._rgb = self._group("red", "u1")
+        elif colors:
+            self._rgb = np.empty((len(self._buffer), 3), np.uint8)
+        else:
+            self._rgb = None
+        # wbits=31 writes a gzip container instead of a raw zlib stream
+        self._compressor = (
+            zlib.compressobj(level, zlib.DEFLATED, 31) if compressed else None
+        )
+        self._part = path + ".part"
+        self._file = open(self._part, "wb", buffering=0)
+        header = _ply_header if self.kind == "ply" else _pcd_header
+        self._write_bytes(header(self.count, self.dtype))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _write_bytes(self, data):
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+    def _group(self, first, dtype):
+        return np.ndarray(
+            (len(self._buffer), 3),
+            dtype=dtype,
+            buffer=self._buffer,
+            offset=self.dtype.fields[first][1],
+            strides=(self.dtype.itemsize, np.dtype(dtype).itemsize),
+        )
+
+    def _fill(self, records, points, colors, normals):
+        n = len(records)
+        np.copyto(self._xyz[:n], points, casting="same_kind")
+        if self.normals:
+            np.copyto(self._normals[:n], normals, casting="same_kind")
+        if not self.colors:
+            return
+        rgb = self._rgb[:n]
+        _to_u8(colors, rgb)
+        if self.kind == "pcd":
+            packed = records["rgb"]
+            np.left_shift(rgb[:, 0], 16, out=packed, dtype=np.uint32)
+            packed |= rgb[:, 1].astype(np.uint32) << 8
+            packed |= rgb[:, 2]
+
+    def write(self, points, colors=None, normals=None):
+        """Append points (and their colors/normals) to the file
+
+        Args:
+          points (np.ndarray): (N, 3) positions
+          colors (np.ndarray): (N, 3) colors, floats in [0, 1] or uint8;
+              required when the writer was created with ``colors``
+          normals (np.ndarray): (N, 3) normals, likewise
+        """
+        n = len(points)
+        if (colors is None) == self.colors or (normals is None) == self.normals:
+            raise ValueError(
+                "The attributes do not match the ones declared for the file"
+            )
+        if self.written + n > self.count:
+            raise ValueError(
+                f"Writing {self.written + n} points into a file declared for "
+                f"{self.count}"
+            )
+        size = len(self._buffer)
+        for start in range(0, n, size):
+            stop = min(start + size, n)
+            records = self._buffer[: stop - start]
+            self._fill(
+                records,
+                points[start:stop],
+                None if colors is None else colors[start:stop],
+                None if normals is None else normals[start:stop],
+            )
+            self._write_bytes(records.view(np.uint8))
+        self.written += n
+
+    def close(self):
+        """Finish the file; raises ``ValueError`` if points are missing"""
+        if self._file is None:
+            return
+        if self.written != self.count:
+            self.abort()
+            raise ValueError(
+                f"Only {self.written} of {self.count} points were written to "
+                f"{self.path}"
+            )
+        if self._compressor is not None:
+            tail = self._compressor.flush()
+            self._file.write(tail)
+            self.bytes_written += len(tail)
+        self._file.close()
+        self._file = None
+        os.replace(self._part, self.path)
+
+    def abort(self):
+        """Drop the partial file"""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        os.remove(self._part)
+
+
+def export_cloud(
+    path,
+    points,
+    colors=None,
+    normals=None,
+    chunk_points=CHUNK_POINTS,
+    progress=None,
+    token=None,
+):
+    """Write a cloud to ``path`` in chunks
+
+    Args:
+      path (str): see :class:`CloudWriter`
+      points (np.ndarray): (N, 3) positions, possibly memory-mapped
+      colors (np.ndarray): optional (N, 3) colors
+      normals (np.ndarray): optional (N, 3) normals
+      chunk_points (int): points per chunk
+      progress (Callable[[float], None]): called after every chunk
+      token (CancelToken): checked between chunks
+
+    Returns:
+      int: bytes written
+    """
+    n = len(points)
+    with CloudWriter(
+        path, n, colors is not None, normals is not None, chunk_points
+    ) as writer:
+        for start in range(0, n, chunk_points):
+            if token is not None:
+                token.check()
+            stop = min(start + chunk_points, n)
+            writer.write(
+                points[start:stop],
+                None if colors is None else colors[start:stop],
+                None if normals is None else normals[start:stop],
+            )
+            if progress is not None:
+                progress(stop / max(n, 1))
+    return writer.bytes_written
+
+
+class ExportJob:
+    """Runs :func:`export_cloud` on a worker thread
+
+    Callbacks are invoked on the worker thread.
+
+    Args:
+      path (str): output path
+      points, colors, normals (np.ndarray): the cloud, see
+          :func:`export_cloud`; they must not change during the export
+      on_progress (Callable[[float], None]): fraction written
+      on_done (Callable[[str], None]): called with ``path`` once renamed
+      on_error (Callable[[Exception], None]): called when writing failed
+    """
+
+    def __init__(
+        self,
+        path,
+        points,
+        colors=None,
+        normals=None,
+        on_progress=None,
+        on_done=None,
+        on_error=None,
+    ):
+        self.path = path
+        self.token = CancelToken()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(points, colors, normals, on_progress, on_done, on_error),
+            name="ExportJob",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _run(self, points, colors, normals, on_progress, on_done, on_error):
+        try:
+            start = time.perf_counter()
+            size = export_cloud(
+                self.path,
+                points,
+                colors,
+                normals,
+                progress=on_progress,
+                token=self.token,
+            )
+            elapsed = time.perf_counter() - start
+            _logger.info(
+                "Exported %s: %.1f MB in %.2f s", self.path, size / 1e6, elapsed
+            )
+            if on_done is not None:
+                on_done(self.path)
+        except LoadCancelled:
+            _logger.debug("Export to %s cancelled", self.path)
+        except Exception as error:
+            _logger.exception("Export to %s failed", self.path)
+            if on_error is not None:
+                on_error(error)
+
+    @property
+    def busy(self):
+        return self._thread.is_alive()
+
+    def cancel(self):
+        self.token.cancel()
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+
+
+class FrameCloudExporter:
+    """Writes live clouds to one file per frame for a time window
+
+    :meth:`submit` copies the cloud and queues it for a writer thread; it
+    accepts frames for ``duration`` seconds from construction and then
+    finishes the export.
+
+    Args:
+      directory (str): output directory, created if needed
+      duration (float): length of the time window, in seconds
+      pattern (str): file name of frame ``i``; its extension picks the format
+      maxsize (int): clouds waiting to be written
+      policy (str): :data:`~o3dgui.recorder.DROP` or
+          :data:`~o3dgui.recorder.BLOCK` when the queue is full
+      clock (Callable[[], float]): monotonic clock
+      on_done (Callable[[FrameCloudExporter], None]): called on the writer
+          thread once the last file is written
+    """
+
+    def __init__(
+        self,
+        directory,
+        duration,
+        pattern="cloud_{:06d}.ply",
+        maxsize=8,
+        policy=DROP,
+        clock=time.monotonic,
+        on_done=None,
+    ):
+        if policy not in (DROP, BLOCK):
+            raise ValueError(f"Unknown policy: {policy}")
+        export_format(pattern)
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.pattern = pattern
+        self.policy = policy
+        self.clock = clock
+        self.deadline = clock() + duration
+        self._on_done = on_done
+        self.maxsize = maxsize
+        # Clouds waiting for the writer; _closed is only read and set under
+        # the lock, so a cloud is either queued before the end or rejected
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._closed = False
+        self.frames_submitted = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.bytes_written = 0
+        self.error = None
+        self._thread = threading.Thread(
+            target=self._run, name="FrameCloudExporter", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def finished(self):
+        """Whether the window is over and every queued cloud was written"""
+        return self._closed and not self._thread.is_alive()
+
+    def submit(self, points, colors=None):
+        """Queue a copy of a live cloud
+
+        Returns:
+          bool: ``True`` if queued; ``False`` if dropped or the window is over
+        """
+        if self._closed:
+            return False
+        if self.clock() > self.deadline:
+            self.close(wait=False)
+            return False
+        frame = (np.array(points), None if colors is None else np.array(colors))
+        with self._condition:
+            if self.policy == BLOCK:
+                while self._full() and not self._closed:
+                    self._condition.wait()
+            if self._closed:
+                return False
+            if self._full():
+                self.frames_dropped += 1
+                return False
+            self._pending.append(frame)
+            self.frames_submitted += 1
+            self._condition.notify_all()
+        return True
+
+    def _full(self):
+        # Like queue.Queue, a maxsize below 1 means no limit
+        return 0 < self.maxsize <= len(self._pending)
+
+    def _run(self):
+        index = 0
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    break
+                frame = self._pending.popleft()
+                self._condition.notify_all()
+            if self.error is not None:
+                continue
+            path = os.path.join(self.directory, self.pattern.format(index))
+            index += 1
+            try:
+                size = export_cloud(path, *frame)
+            except Exception as error:
+                _logger.exception("Exporting %s failed", path)
+                self.error = error
+                continue
+            with self._lock:
+                self.frames_written += 1
+                self.bytes_written += size
+        _logger.info(
+            "Exported %d clouds (%.1f MB) to %s, %d dropped",
+            self.frames_written,
+            self.bytes_written / 1e6,
+            self.directory,
+            self.frames_dropped,
+        )
+        if self._on_done is not None:
+            self._on_done(self)
+
+    def close(self, wait=True):
+        """End the window early; queued clouds are still written
+
+        Never blocks on the queue, so it is safe from the capture and GUI
+        threads; ``wait`` joins the writer thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if wait:
+            self._thread.join()
@@ -0,0 +1,292 @@
+"""
+Memory-mapped reader for binary PLY and PCD point clouds.
+
+Only the header is parsed; the body is mapped with :func:`numpy.memmap` and
+exposed as a structured array. Field views such as :attr:`CloudFile.xyz`,
+:attr:`CloudFile.colors` and :attr:`CloudFile.normals` are strided views into
+the mapping, so opening a multi-GB scan takes milliseconds and only the pages
+that are actually touched get read from disk.
+
+ASCII files and compressed PCD (``DATA binary_compressed``) are not mappable;
+:func:`is_mappable` tells whether a file can be opened here, otherwise fall
+back to ``open3d.io.read_point_cloud``.
+"""
+
+import logging
+import os
+
+import numpy as np
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+_PLY_TYPES = {
+    "char": "i1",
+    "int8": "i1",
+    "uchar": "u1",
+    "uint8": "u1",
+    "short": "i2",
+    "int16": "i2",
+    "ushort": "u2",
+    "uint16": "u2",
+    "int": "i4",
+    "int32": "i4",
+    "uint": "u4",
+    "uint32": "u4",
+    "float": "f4",
+    "float32": "f4",
+    "double": "f8",
+    "float64": "f8",
+}
+
+_XYZ = ("x", "y", "z")
+_NORMALS = (("nx", "ny", "nz"), ("normal_x", "normal_y", "normal_z"))
+_RGB = (("red", "green", "blue"), ("r", "g", "b"))
+
+# Headers are a few hundred bytes; give up past this so that sniffing a
+# large file of another format does not read all of it
+_HEADER_LIMIT = 64 * 1024
+# First header line of a PCD file
+_PCD_SIGNATURE = (b"#", b"VERSION", b"FIELDS")
+
+
+class UnsupportedCloudFormat(ValueError):
+    """The file is valid but cannot be memory-mapped (ASCII, compressed, ...)"""
+
+
+def _read_header(f, terminator):
+    lines = []
+    while True:
+        line = f.readline(_HEADER_LIMIT - f.tell() + 1)
+        if f.tell() > _HEADER_LIMIT:
+            raise ValueError(f"No end of header in the first {_HEADER_LIMIT} bytes")
+        if not line:
+            raise ValueError("Unexpected end of file in header")
+        text = line.decode("ascii", errors="replace").strip()
+        lines.append(text)
+        if terminator(text):
+            return lines, f.tell()
+
+
+def _parse_ply(f):
+    lines, offset = _read_header(f, lambda text: text == "end_header")
+    if not lines or lines[0] != "ply":
+        raise ValueError("Not a PLY file")
+
+    byte_order = None
+    elements = []  # [name, count, [(prop, dtype)]]
+    for text in lines[1:]:
+        words = text.split()
+        if not words or words[0] in ("comment", "obj_info"):
+            continue
+        if words[0] == "format":
+            fmt = words[1]
+            if fmt == "ascii":
+                raise UnsupportedCloudFormat("ASCII PLY cannot be memory-mapped")
+            byte_order = {"binary_little_endian": "<", "binary_big_endian": ">"}[fmt]
+        elif words[0] == "element":
+            elements.append([words[1], int(words[2]), []])
+        elif words[0] == "property":
+            if words[1] == "list":
+                elements[-1][2].append((words[-1], None))
+            else:
+                elements[-1][2].append((words[2], _PLY_TYPES[words[1]]))
+
+    # Skip fixed-size elements stored before the vertices
+    for name, count, props in elements:
+        if any(dtype is None for _, dtype in props):
+            if name == "vertex":
+                raise UnsupportedCloudFormat("List properties on vertices")
+            raise UnsupportedCloudFormat(
+                f"Variable-size element {name!r} before vertices"
+            )
+        dtype = np.dtype([(prop, byte_order + t) for prop, t in props])
+        if name == "vertex":
+            return dtype, count, offset, "ply"
+        offset += dtype.itemsize * count
+    raise ValueError("PLY file has no vertex element")
+
+
+def _parse_pcd(f):
+    lines, offset = _read_header(f, lambda text: text.startswith("DATA"))
+    header = {}
+    for text in lines:
+        if not text or text.startswith("#"):
+            continue
+        key, _, value = text.partition(" ")
+        header[key.upper()] = value.split()
+    if "FIELDS" not in header:
+        raise ValueError("Not a PCD file")
+
+    data = header["DATA"][0].lower()
+    if data != "binary":
+        raise UnsupportedCloudFormat(f"PCD DATA {data} cannot be memory-mapped")
+
+    fields = header["FIELDS"]
+    sizes = [int(v) for v in header["SIZE"]]
+    types = header["TYPE"]
+    counts = [int(v) for v in header.get("COUNT", ["1"] * len(fields))]
+    spec = []
+    for i, (name, size, kind, count) in enumerate(zip(fields, sizes, types, counts)):
+        code = {"F": "f", "I": "i", "U": "u"}[kind.upper()]
+        dtype = np.dtype(f"<{code}{size}")
+        if name == "_":
+            name = f"_pad{i}"
+        spec.append((name, dtype) if count == 1 else (name, dtype, (count,)))
+    n_points = int(header.get("POINTS", [0])[0]) or (
+        int(header["WIDTH"][0]) * int(header["HEIGHT"][0])
+    )
+    return np.dtype(spec), n_points, offset, "pcd"
+
+
+def _parse(path):
+    with open(path, "rb") as f:
+        first = f.readline(_HEADER_LIMIT).lstrip()
+        f.seek(0)
+        if first[:3] == b"ply":
+            return _parse_ply(f)
+        if first.upper().startswith(_PCD_SIGNATURE):
+            return _parse_pcd(f)
+        raise ValueError(f"{path} is neither a PLY nor a PCD file")
+
+
+def is_mappable(path):
+    """Whether ``path`` is a binary PLY/PCD that :class:`CloudFile` can map"""
+    try:
+        _parse(path)
+    except (ValueError, KeyError, IndexError, OSError):
+        return False
+    return True
+
+
+class CloudFile:
+    """Binary PLY/PCD file mapped as a structured array
+
+    Args:
+      path (str): ``.ply`` or ``.pcd`` file with binary data
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.dtype, self.count, self.offset, self.format = _parse(path)
+        needed = self.offset + self.dtype.itemsize * self.count
+        size = os.path.getsize(path)
+        if size < needed:
+            raise ValueError(f"{path} is truncated ({size} < {needed} bytes)")
+
+        if self.count:
+            self._raw = np.memmap(
+                path, dtype=np.uint8, mode="r", offset=0, shape=(needed,)
+            )
+        else:
+            self._raw = np.zeros(needed, dtype=np.uint8)
+        self.data = np.ndarray(
+            (self.count,), dtype=self.dtype, buffer=self._raw, offset=self.offset
+        )
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def fields(self):
+        return self.dtype.names
+
+    def _group(self, names):
+        """(N, k) view over k consecutive same-typed fields, or ``None``"""
+        if not all(name in self.dtype.fields for name in names):
+            return None
+        dtypes = [self.dtype.fields[name][0] for name in names]
+        offsets = [self.dtype.fields[name][1] for name in names]
+        base = dtypes[0]
+        if any(d != base for d in dtypes) or base.shape:
+            return None
+        if any(b - a != base.itemsize for a, b in zip(offsets, offsets[1:])):
+            return None
+        return np.ndarray(
+            (self.count, len(names)),
+            dtype=base,
+            buffer=self._raw,
+            offset=self.offset + offsets[0],
+            strides=(self.dtype.itemsize, base.itemsize),
+        )
+
+    @property
+    def xyz(self):
+        """(N, 3) positions, a view into the file when x, y, z are adjacent"""
+        view = self._group(_XYZ)
+        if view is None:
+            return np.stack([self.data[name] for name in _XYZ], axis=1)
+        return view
+
+    @property
+    def normals(self):
+        """(N, 3) normals or ``None``"""
+        for names in _NORMALS:
+            view = self._group(names)
+            if view is not None:
+                return view
+        return None
+
+    @property
+    def colors(self):
+        """(N, 3) uint8 RGB or ``None``
+
+        PLY ``red/green/blue`` bytes and PCD packed ``rgb``/``rgba`` fields are
+        both returned as views without copying.
+        """
+        for names in _RGB:
+            view = self._group(names)
+            if view is not None and view.dtype == np.uint8:
+                return view
+        for name in ("rgb", "rgba"):
+            if name in self.dtype.fields:
+                dtype, offset = self.dtype.fields[name][:2]
+                if dtype.itemsize != 4:
+                    return None
+                # Packed 0x00RRGGBB little-endian: bytes are B, G, R, (A);
+                # walk them backwards from R.
+                return np.ndarray(
+                    (self.count, 3),
+                    dtype=np.uint8,
+                    buffer=self._raw,
+                    offset=self.offset + offset + 2,
+                    strides=(self.dtype.itemsize, -1),
+                )
+        return None
+
+    def subsample(self, max_points):
+        """Strided preview that touches at most ``max_points`` records
+
+        Returns:
+          Tuple[np.ndarray, np.ndarray]: (M, 3) float32 positions and (M, 3)
+          float32 colors in [0, 1] (``None`` without colors)
+        """
+        stride = max(1, -(-self.count // max(1, max_points)))
+        xyz = np.ascontiguousarray(self.xyz[::stride], dtype=np.float32)
+        colors = self.colors
+        if colors is not None:
+            colors = colors[::stride].astype(np.float32) * np.float32(1.0 / 255.0)
+        return xyz, colors
+
+    def bounds(self, chunk=1 << 22):
+        """Axis-aligned bounds, computed in chunks to bound memory use
+
+        Returns:
+          Tuple[np.ndarray, np.ndarray]: min and max corners (float64)
+        """
+        xyz = self.xyz
+        lo = np.full(3, np.inf)
+        hi = np.full(3, -np.inf)
+        for start in range(0, self.count, chunk):
+            block = xyz[start : start + chunk]
+            lo = np.minimum(lo, np.nanmin(block, axis=0))
+            hi = np.maximum(hi, np.nanmax(block, axis=0))
+        return lo, hi
+
+    def close(self):
+        # The mapping is released once the last view into it goes away.
+        self.data = None
+        self._raw = None
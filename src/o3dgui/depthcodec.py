@@ -0,0 +1,512 @@
+"""
+Lossless compression of uint16 depth frames.
+
+Holes (depth 0) are stored as a bit mask. Every valid pixel is predicted from
+the previous valid pixel in raster order, so a hole does not cost two large
+jumps; the residuals are zigzag-mapped so that small negative and positive
+steps both become small numbers, and their low and high bytes are split into
+two planes. On real depth the high plane is almost all zeros and the low
+plane has little entropy, so a fast general-purpose backend does the rest:
+zstd when installed, zlib otherwise. lz4 is faster still but has no entropy
+coder, so it only pays off on very smooth depth and has to be asked for.
+
+Each encoded frame carries its own header and is decodable on its own, so a
+:class:`DepthRecordingReader` can seek to any frame. :class:`DepthRecordingWriter`
+encodes on a thread pool (the backends and NumPy release the GIL) and writes
+the frames in order from a writer thread.
+
+Recording layout::
+
+    b"O3DDEPTH" | uint32 header length | JSON header
+    (uint32 size | float64 timestamp | frame) ...
+    int64 offsets[N] | uint64 N | b"O3DDIDX1"
+
+The trailing index is only written on close; without it (e.g. after a crash)
+the reader rebuilds it by walking the records.
+"""
+
+import concurrent.futures
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from o3dgui.recorder import BLOCK, DROP
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover
+    lz4_frame = None
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+EXTENSION = ".o3ddepth"
+MAGIC = b"O3DDEPTH"
+INDEX_MAGIC = b"O3DDIDX1"
+FRAME_MAGIC = b"O3DZ"
+
+# magic, version, backend, predictor, reserved, height, width
+_FRAME_HEADER = struct.Struct("<4sBBBBII")
+_RECORD_HEADER = struct.Struct("<Id")
+_INDEX_FOOTER = struct.Struct("<Q8s")
+
+# Frames of the first version, predicted from the left neighbour holes
+# included, are still decoded
+_PREDICTOR_LEFT = 1
+_PREDICTOR_VALID = 2
+_STOP = object()
+
+
+class _Zlib:
+    id = 1
+    default_level = 1
+
+    @staticmethod
+    def compress(data, level):
+        # Residuals rarely repeat as strings: run-length matches plus Huffman
+        # compress them better than a full LZ77 search, and faster
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 15, 9, zlib.Z_RLE)
+        return compressor.compress(data) + compressor.flush()
+
+    @staticmethod
+    def decompress(data, size):
+        return zlib.decompress(data, bufsize=size)
+
+
+class _Zstd:
+    id = 2
+    default_level = 3
+    # Compressor objects are not thread-safe: one per thread
+    _local = threading.local()
+
+    @classmethod
+    def compress(cls, data, level):
+        compressors = cls._local.__dict__.setdefault("compressors", {})
+        if level not in compressors:
+            compressors[level] = zstandard.ZstdCompressor(level=level)
+        return compressors[level].compress(data)
+
+    @classmethod
+    def decompress(cls, data, size):
+        if not hasattr(cls._local, "decompressor"):
+            cls._local.decompressor = zstandard.ZstdDecompressor()
+        return cls._local.decompressor.decompress(data, max_output_size=size)
+
+
+class _Lz4:
+    id = 3
+    default_level = 0
+
+    @staticmethod
+    def compress(data, level):
+        return lz4_frame.compress(data, compression_level=level)
+
+    @staticmethod
+    def decompress(data, size):
+        return lz4_frame.decompress(data)
+
+
+BACKENDS = {"zlib": _Zlib}
+if zstandard is not None:
+    BACKENDS["zstd"] = _Zstd
+if lz4_frame is not None:
+    BACKENDS["lz4"] = _Lz4
+_BY_ID = {backend.id: backend for backend in BACKENDS.values()}
+
+
+def default_backend():
+    """zstd when installed, zlib otherwise"""
+    for name in ("zstd", "zlib"):
+        if name in BACKENDS:
+            return name
+
+
+def encode_residuals(depth):
+    """Zigzag-mapped left-neighbour residuals of a (H, W) uint16 frame"""
+    depth = np.ascontiguousarray(depth, dtype=np.uint16)
+    residuals = np.empty_like(depth)
+    # uint16 arithmetic wraps, which the decoder's running sums undo
+    np.subtract(depth[:, 1:], depth[:, :-1], out=residuals[:, 1:])
+    residuals[0, 0] = depth[0, 0]
+    np.subtract(depth[1:, 0], depth[:-1, 0], out=residuals[1:, 0])
+    return _zigzag(residuals)
+
+
+def decode_residuals(zigzag, out=None):
+    """Inverse of :func:`encode_residuals`"""
+    residuals = _unzigzag(zigzag)
+    np.cumsum(residuals[:, 0], out=residuals[:, 0], dtype=np.uint16)
+    return np.cumsum(residuals, axis=1, dtype=np.uint16, out=out)
+
+
+def _zigzag(residuals):
+    signed = residuals.view(np.int16)
+    zigzag = np.left_shift(signed, 1)
+    zigzag ^= signed >> 15
+    return zigzag.view(np.uint16)
+
+
+def _unzigzag(zigzag):
+    residuals = zigzag >> 1
+    residuals ^= np.negative(zigzag & 1, dtype=np.uint16)
+    return residuals
+
+
+def encode_valid(depth):
+    """Hole mask and zigzag-mapped residuals of the valid pixels
+
+    Returns:
+      Tuple[np.ndarray, np.ndarray]: (H, W) bool mask of the non-zero pixels
+      and their residuals against the previous valid pixel in raster order
+    """
+    depth = np.ascontiguousarray(depth, dtype=np.uint16)
+    mask = depth != 0
+    values = depth[mask]
+    residuals = np.empty_like(values)
+    if len(values):
+        residuals[0] = values[0]
+        np.subtract(values[1:], values[:-1], out=residuals[1:])
+    return mask, _zigzag(residuals)
+
+
+def decode_valid(mask, zigzag, out=None):
+    """Inverse of :func:`encode_valid`"""
+    values = np.cumsum(_unzigzag(zigzag), dtype=np.uint16)
+    if out is None:
+        out = np.zeros(mask.shape, np.uint16)
+    else:
+        out[...] = 0
+    out[mask] = values
+    return out
+
+
+class DepthCodec:
+    """Encodes uint16 depth frames to self-contained byte strings
+
+    Args:
+      backend (str): ``"zstd"``, ``"lz4"`` or ``"zlib"``; default is
+          :func:`default_backend`
+      level (int): backend compression level, default is a fast one
+    """
+
+    def __init__(self, backend=None, level=None):
+        self.backend = backend or default_backend()
+        if self.backend not in BACKENDS:
+            raise ValueError(
+                f"Depth compression backend {self.backend!r} is not available"
+            )
+        self._backend = BACKENDS[self.backend]
+        self.level = self._backend.default_level if level is None else level
+
+    def encode(self, depth):
+        """Compress one (H, W) uint16 frame
+
+        Returns:
+          bytes: frame header and payload
+        """
+        if depth.ndim != 2:
+            raise ValueError(f"Expected a (H, W) depth frame, got shape {depth.shape}")
+        height, width = depth.shape
+        mask, zigzag = encode_valid(depth)
+        planes = zigzag.view(np.uint8).reshape(-1, 2).T
+        # Hole mask, low bytes, then high bytes
+        payload = self._backend.compress(
+            np.packbits(mask).tobytes() + np.ascontiguousarray(planes).tobytes(),
+            self.level,
+        )
+        header = _FRAME_HEADER.pack(
+            FRAME_MAGIC, 1, self._backend.id, _PREDICTOR_VALID, 0, height, width
+        )
+        return header + payload
+
+    @staticmethod
+    def decode(data, out=None):
+        """Decompress a frame produced by :meth:`encode`
+
+        Args:
+          data (bytes): encoded frame
+          out (np.ndarray): optional (H, W) uint16 output
+
+        Returns:
+          np.ndarray: the depth frame
+        """
+        magic, version, backend_id, predictor, _, height, width = (
+            _FRAME_HEADER.unpack_from(data)
+        )
+        if (
+            magic != FRAME_MAGIC
+            or version != 1
+            or predictor
+            not in (
+                _PREDICTOR_LEFT,
+                _PREDICTOR_VALID,
+            )
+        ):
+            raise ValueError("Not a depth frame of a supported version")
+        backend = _BY_ID.get(backend_id)
+        if backend is None:
+            raise ValueError(
+                f"Depth frame needs compression backend {backend_id}, "
+                "which is not installed"
+            )
+        size = 2 * height * width
+        mask_size = 0
+        if predictor == _PREDICTOR_VALID:
+            mask_size = (height * width + 7) // 8
+        raw = backend.decompress(
+            memoryview(data)[_FRAME_HEADER.size :], mask_size + size
+        )
+        if predictor == _PREDICTOR_LEFT:
+            planes = np.frombuffer(raw, np.uint8, count=size).reshape(2, -1)
+            zigzag = np.empty((height, width), np.uint16)
+        else:
+            bits = np.frombuffer(raw, np.uint8, count=mask_size)
+            mask = np.unpackbits(bits, count=height * width).view(np.bool_)
+            mask = mask.reshape(height, width)
+            planes = np.frombuffer(raw, np.uint8, offset=mask_size).reshape(2, -1)
+            zigzag = np.empty(planes.shape[1], np.uint16)
+        interleaved = zigzag.view(np.uint8).reshape(-1, 2)
+        interleaved[:, 0] = planes[0]
+        interleaved[:, 1] = planes[1]
+        if predictor == _PREDICTOR_LEFT:
+            return decode_residuals(zigzag, out=out)
+        return decode_valid(mask, zigzag, out=out)
+
+
+class DepthRecordingWriter:
+    """Record compressed depth frames, encoding them on a thread pool
+
+    :meth:`submit` copies the frame and hands it to the pool; a writer thread
+    appends the encoded frames in submission order.
+
+    Args:
+      path (str): output file, conventionally ending in :data:`EXTENSION`
+      shape (Tuple[int, int]): (H, W) of the frames
+      fps (float): nominal frame rate stored in the header
+      metadata (dict): extra JSON-serializable values stored in the header
+      codec (DepthCodec): defaults to ``DepthCodec()``
+      workers (int): encoder threads
+      max_pending (int): frames submitted but not yet written
+      policy (str): :data:`~o3dgui.recorder.DROP` or
+          :data:`~o3dgui.recorder.BLOCK` when ``max_pending`` is reached
+    """
+
+    def __init__(
+        self,
+        path,
+        shape,
+        fps=30,
+        metadata=None,
+        codec=None,
+        workers=None,
+        max_pending=None,
+        policy=BLOCK,
+    ):
+        if policy not in (DROP, BLOCK):
+            raise ValueError(f"Unknown policy: {policy}")
+        self.path = path
+        self.shape = tuple(shape)
+        self.codec = codec or DepthCodec()
+        self.policy = policy
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.error = None
+
+        header = {
+            "version": 1,
+            "fps": fps,
+            "shape": list(self.shape),
+            "backend": self.codec.backend,
+            "metadata": metadata or {},
+        }
+        payload = json.dumps(header).encode("utf-8")
+        self._file = open(path, "wb", buffering=1 << 20)
+        self._file.write(MAGIC + struct.pack("<I", len(payload)) + payload)
+        self._offsets = []
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            self.workers, thread_name_prefix="DepthEncoder"
+        )
+        self._pending = queue.Queue(max_pending or 2 * self.workers + 2)
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="DepthRecordingWriter", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, depth, timestamp=None):
+        """Queue a copy of ``depth`` for encoding
+
+        Returns:
+          bool: ``True`` if queued, ``False`` if dropped
+        """
+        if self._closed:
+            raise RuntimeError("DepthRecordingWriter is closed")
+        if depth.shape != self.shape:
+            raise ValueError(f"Expected depth of shape {self.shape}, got {depth.shape}")
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        if self.policy == DROP and self._pending.full():
+            self.frames_dropped += 1
+            return False
+        future = self._executor.submit(
+            self.codec.encode, np.array(depth, dtype=np.uint16)
+        )
+        self._pending.put((timestamp, future))
+        return True
+
+    def _run(self):
+        while True:
+            item = self._pending.get()
+            if item is _STOP:
+                return
+            timestamp, future = item
+            try:
+                data = future.result()
+                if self.error is None:
+                    self._offsets.append(self._file.tell())
+                    self._file.write(_RECORD_HEADER.pack(len(data), timestamp))
+                    self._file.write(data)
+                    self.frames_written += 1
+                    self.bytes_in += 2 * self.shape[0] * self.shape[1]
+                    self.bytes_out += len(data)
+            except Exception as error:
+                _logger.exception("DepthRecordingWriter: writing failed")
+                self.error = error
+
+    @property
+    def ratio(self):
+        """Raw size over compressed size of the frames written so far"""
+        return self.bytes_in / self.bytes_out if self.bytes_out else 0.0
+
+    def close(self):
+        """Write the queued frames and the index, then close the file"""
+        if self._closed:
+            return
+        self._closed = True
+        self._pending.put(_STOP)
+        self._thread.join()
+        self._executor.shutdown()
+        self._file.write(np.asarray(self._offsets, dtype="<i8").tobytes())
+        self._file.write(_INDEX_FOOTER.pack(len(self._offsets), INDEX_MAGIC))
+        self._file.close()
+
+    def stats(self):
+        return {
+            "written": self.frames_written,
+            "dropped": self.frames_dropped,
+            "ratio": round(self.ratio, 2),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DepthRecordingReader:
+    """Random access to a compressed depth recording
+
+    Frames are decoded on access. The reader can be passed to
+    :class:`~o3dgui.replay.ReplayCapture`, which then replays depth only.
+
+    Args:
+      path (str): recording written by :class:`DepthRecordingWriter`
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a depth recording")
+        (length,) = struct.unpack("<I", self._file.read(4))
+        self.header = json.loads(self._file.read(length).decode("utf-8"))
+        self.fps = self.header["fps"]
+        self.metadata = self.header.get("metadata", {})
+        self.shape = tuple(self.header["shape"])
+        self.streams = {"depth": (self.shape, np.dtype("<u2"))}
+        self._lock = threading.Lock()
+        self.offsets = self._read_index(len(MAGIC) + 4 + length)
+        self._timestamps = None
+
+    def _read_index(self, start):
+        size = os.path.getsize(self.path)
+        if size >= start + _INDEX_FOOTER.size:
+            self._file.seek(size - _INDEX_FOOTER.size)
+            count, magic = _INDEX_FOOTER.unpack(self._file.read(_INDEX_FOOTER.size))
+            if magic == INDEX_MAGIC:
+                self._file.seek(size - _INDEX_FOOTER.size - 8 * count)
+                return np.frombuffer(self._file.read(8 * count), dtype="<i8")
+
+        # No index: walk the records, ignoring a truncated last one
+        offsets = []
+        offset = start
+        while offset + _RECORD_HEADER.size <= size:
+            self._file.seek(offset)
+            length, _ = _RECORD_HEADER.unpack(self._file.read(_RECORD_HEADER.size))
+            if offset + _RECORD_HEADER.size + length > size:
+                break
+            offsets.append(offset)
+            offset += _RECORD_HEADER.size + length
+        _logger.warning("%s has no index; recovered %d frames", self.path, len(offsets))
+        return np.asarray(offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def read_raw(self, index):
+        """Timestamp and encoded bytes of frame ``index``"""
+        with self._lock:
+            self._file.seek(int(self.offsets[index]))
+            length, timestamp = _RECORD_HEADER.unpack(
+                self._file.read(_RECORD_HEADER.size)
+            )
+            return timestamp, self._file.read(length)
+
+    def decode(self, index, out=None):
+        """Depth frame ``index``, decoded into ``out`` if given"""
+        return DepthCodec.decode(self.read_raw(index)[1], out=out)
+
+    def __getitem__(self, index):
+        """Frame ``index`` as ``{"timestamp": float, "depth": array}``"""
+        timestamp, data = self.read_raw(index)
+        return {"timestamp": timestamp, "depth": DepthCodec.decode(data)}
+
+    @property
+    def timestamps(self):
+        if self._timestamps is None:
+            self._timestamps = np.array([self.read_raw(i)[0] for i in range(len(self))])
+        return self._timestamps
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def depth_path(path):
+    """Depth recording stored next to the raw recording ``path``"""
+    return os.path.splitext(path)[0] + EXTENSION
@@ -0,0 +1,183 @@
+"""
+Depth visualization through a precomputed lookup table.
+
+Every possible z16 value is mapped to a color once, so colorizing a frame is a
+single gather into a reused output buffer. The table is only rebuilt when the
+depth range or the colormap changes; with auto-ranging the range follows
+running percentiles of the scene and is quantized so that it does not trigger
+a rebuild on every frame.
+"""
+
+import logging
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:  # pragma: no cover
+    cv2 = None
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+LUT_SIZE = 1 << 16
+
+_PIXEL = np.dtype((np.void, 3))
+
+
+def _jet(t):
+    # Same piecewise-linear definition as MATLAB/OpenCV "jet"
+    r = np.clip(1.5 - np.abs(4 * t - 3), 0, 1)
+    g = np.clip(1.5 - np.abs(4 * t - 2), 0, 1)
+    b = np.clip(1.5 - np.abs(4 * t - 1), 0, 1)
+    return np.stack([r, g, b], axis=-1)
+
+
+_NUMPY_COLORMAPS = {
+    "jet": _jet,
+    "gray": lambda t: np.repeat(t[:, np.newaxis], 3, axis=1),
+}
+
+
+def colormap_table(colormap="jet"):
+    """256-entry RGB table of a colormap
+
+    Args:
+      colormap (Union[str, int]): ``"jet"`` or ``"gray"``, or any
+          ``cv2.COLORMAP_*`` id when OpenCV is installed
+
+    Returns:
+      np.ndarray: (256, 3) uint8 RGB table
+    """
+    if isinstance(colormap, str):
+        if colormap not in _NUMPY_COLORMAPS:
+            raise ValueError(f"Unknown colormap: {colormap}")
+        t = np.linspace(0.0, 1.0, 256)
+        return np.round(255 * _NUMPY_COLORMAPS[colormap](t)).astype(np.uint8)
+    if cv2 is None:
+        raise ValueError("OpenCV colormaps need cv2")
+    ramp = np.arange(256, dtype=np.uint8).reshape(256, 1)
+    return cv2.applyColorMap(ramp, colormap)[:, 0, ::-1].copy()
+
+
+class DepthColorizer:
+    """Colorize z16 depth frames with a 65536-entry lookup table
+
+    Args:
+      near (int): depth (in depth units) mapped to the first color
+      far (int): depth mapped to the last color
+      colormap (Union[str, int]): see :func:`colormap_table`
+      auto_range (bool): follow running percentiles of the valid depth
+          instead of a fixed ``near``/``far``
+      percentiles (Tuple[float, float]): percentiles used for auto-ranging
+      smoothing (float): weight of the newest frame in the running range
+      quantum (int): auto range is rounded to multiples of this many depth
+          units, so small fluctuations do not rebuild the table
+      stride (int): pixel stride used when sampling frames for auto-ranging
+      bgr (bool): produce BGR instead of RGB output
+    """
+
+    def __init__(
+        self,
+        near=300,
+        far=3000,
+        colormap="jet",
+        auto_range=False,
+        percentiles=(2.0, 98.0),
+        smoothing=0.1,
+        quantum=50,
+        stride=8,
+        bgr=False,
+    ):
+        self.colormap = colormap
+        self.auto_range = auto_range
+        self.percentiles = percentiles
+        self.smoothing = smoothing
+        self.quantum = quantum
+        self.stride = stride
+        self.bgr = bgr
+        self._running = None
+        self.rebuilds = 0
+        self._lut = None
+        self._range = None
+        self.set_range(near, far)
+
+    @property
+    def range(self):
+        """Current ``(near, far)`` in depth units"""
+        return self._range
+
+    @property
+    def lut(self):
+        return self._lut
+
+    def set_range(self, near, far):
+        """Change the mapped depth range (rebuilds the table if it changed)"""
+        near, far = int(near), int(far)
+        if far <= near:
+            far = near + 1
+        if (near, far) != self._range:
+            self._range = (near, far)
+            self._build()
+
+    def set_colormap(self, colormap):
+        """Change the colormap (rebuilds the table if it changed)"""
+        if colormap != self.colormap:
+            self.colormap = colormap
+            self._build()
+
+    def _build(self):
+        near, far = self._range
+        table = colormap_table(self.colormap)
+        if self.bgr:
+            table = table[:, ::-1]
+        values = np.arange(LUT_SIZE, dtype=np.float32)
+        index = np.clip((values - near) * (255.0 / (far - near)), 0, 255)
+        lut = table[index.astype(np.uint8)]
+        lut[0] = 0  # no depth
+        self._lut = np.ascontiguousarray(lut)
+        # Gathering whole 3-byte pixels is about 3x faster than np.take on
+        # the (N, 3) table along axis 0.
+        self._lut_pixels = self._lut.view(_PIXEL)[:, 0]
+        self.rebuilds += 1
+
+    def update_range(self, depth):
+        """Fold the percentiles of ``depth`` into the running auto range"""
+        sample = depth[:: self.stride, :: self.stride]
+        sample = sample[sample > 0]
+        if sample.size == 0:
+            return
+        low, high = np.percentile(sample, self.percentiles)
+        if self._running is None:
+            self._running = np.array([low, high], dtype=np.float64)
+        else:
+            self._running += self.smoothing * (np.array([low, high]) - self._running)
+        q = self.quantum
+        near = np.floor(self._running[0] / q) * q
+        far = np.ceil(self._running[1] / q) * q
+        self.set_range(near, far)
+
+    def colorize(self, depth, out=None):
+        """Colorize a depth frame
+
+        Args:
+          depth (np.ndarray): (H, W) uint16 depth
+          out (np.ndarray): optional (H, W, 3) uint8 buffer to write into
+
+        Returns:
+          np.ndarray: (H, W, 3) uint8 image
+        """
+        if depth.dtype != np.uint16:
+            raise ValueError(f"Expected uint16 depth, got {depth.dtype}")
+        if self.auto_range:
+            self.update_range(depth)
+        if out is None:
+            out = np.empty(depth.shape + (3,), dtype=np.uint8)
+        if out.flags.c_contiguous and out.dtype == np.uint8:
+            np.take(self._lut_pixels, depth, out=out.view(_PIXEL)[..., 0])
+        else:
+            np.take(self._lut, depth, axis=0, out=out)
+        return out
@@ -0,0 +1,150 @@
+"""
+In-place point-cloud updates for Open3D scenes.
+
+Removing and re-adding a geometry makes the renderer throw away and rebuild
+its GPU buffers. :class:`IncrementalPointCloud` instead owns a preallocated
+tensor point cloud whose attributes are NumPy buffers shared with Open3D, and
+pushes only the attributes that changed with ``Scene.update_geometry``.
+"""
+
+import logging
+import threading
+
+import numpy as np
+
+try:
+    import open3d as o3d
+    import open3d.visualization.rendering as rendering
+except ImportError:  # pragma: no cover
+    o3d = None
+    rendering = None
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+def _require_open3d():
+    if o3d is None:
+        raise ImportError("open3d is required to render point clouds")
+
+
+class IncrementalPointCloud:
+    """Fixed-capacity point cloud updated in place in a scene
+
+    Call :meth:`set` from any thread, and :meth:`add_to` once and then
+    :meth:`push` on the GUI thread. Points beyond the current count are
+    collapsed onto the last valid point, so a varying number of points never
+    changes the size of the GPU buffers.
+
+    Args:
+      capacity (int): maximum number of points
+      name (str): geometry name in the scene
+      material (rendering.Material): defaults to an unlit point material
+    """
+
+    def __init__(self, capacity, name="__cloud__", material=None):
+        self.capacity = int(capacity)
+        self.name = name
+        self.material = material
+        self.positions = np.zeros((self.capacity, 3), dtype=np.float32)
+        self.colors = np.full((self.capacity, 3), 0.5, dtype=np.float32)
+        self.count = 0
+        # Entries past _extent are already collapsed onto the last point
+        self._extent = self.capacity
+        self._lock = threading.Lock()
+        self._dirty_positions = False
+        self._dirty_colors = False
+        self._tensor_cloud = None
+        self.pushes = 0
+
+    def set(self, points=None, colors=None):
+        """Copy new positions and/or colors into the shared buffers
+
+        Args:
+          points (np.ndarray): (N, 3) positions; ``N`` may change between calls
+              but not exceed the capacity
+          colors (np.ndarray): (N, 3) colors in [0, 1]
+        """
+        with self._lock:
+            if points is not None:
+                n = len(points)
+                if n > self.capacity:
+                    raise ValueError(f"{n} points exceed the capacity {self.capacity}")
+                self.positions[:n] = points
+                if n < self._extent:
+                    self.positions[n : self._extent] = points[-1] if n else 0.0
+                self._extent = self.count = n
+                self._dirty_positions = True
+            if colors is not None:
+                n = len(colors)
+                if n > self.capacity:
+                    raise ValueError(f"{n} colors exceed the capacity {self.capacity}")
+                self.colors[:n] = colors
+                self._dirty_colors = True
+
+    def bounds(self):
+        """(min, max) corners of the valid points, ``None`` when empty"""
+        with self._lock:
+            if self.count == 0:
+                return None
+            valid = self.positions[: self.count]
+            return valid.min(axis=0), valid.max(axis=0)
+
+    def snapshot(self):
+        """Copies of the valid positions and colors"""
+        with self._lock:
+            return self.positions[: self.count].copy(), self.colors[: self.count].copy()
+
+    def tensor_cloud(self):
+        """``o3d.t.geometry.PointCloud`` sharing memory with the buffers"""
+        _require_open3d()
+        if self._tensor_cloud is None:
+            cloud = o3d.t.geometry.PointCloud()
+            cloud.point.positions = o3d.core.Tensor.from_numpy(self.positions)
+            cloud.point.colors = o3d.core.Tensor.from_numpy(self.colors)
+            self._tensor_cloud = cloud
+        return self._tensor_cloud
+
+    def _material(self):
+        if self.material is None:
+            material = rendering.Material()
+            material.shader = "defaultUnlit"
+            self.material = material
+        return self.material
+
+    def add_to(self, scene):
+        """Add the cloud to ``scene`` (GUI thread)
+
+        Args:
+          scene: ``rendering.Open3DScene`` or ``O3DVisualizer``
+        """
+        _require_open3d()
+        with self._lock:
+            scene.add_geometry(self.name, self.tensor_cloud(), self._material())
+            self._dirty_positions = self._dirty_colors = False
+
+    def push(self, scene):
+        """Upload the changed attributes to ``scene`` in place (GUI thread)
+
+        Args:
+          scene: the ``rendering.Open3DScene`` the cloud was added to
+
+        Returns:
+          bool: whether anything was uploaded
+        """
+        _require_open3d()
+        with self._lock:
+            flags = 0
+            if self._dirty_positions:
+                flags |= rendering.Scene.UPDATE_POINTS_FLAG
+            if self._dirty_colors:
+                flags |= rendering.Scene.UPDATE_COLORS_FLAG
+            if not flags:
+                return False
+            scene.scene.update_geometry(self.name, self.tensor_cloud(), flags)
+            self._dirty_positions = self._dirty_colors = False
+            self.pushes += 1
+            return True
@@ -0,0 +1,160 @@
+"""
+Background, cancellable loading of point-cloud files.
+
+:class:`CloudLoader` runs one load at a time on a worker thread. It first
+delivers a cheap strided preview, then the full cloud, reporting progress in
+between; starting a new load or calling :meth:`CloudLoader.cancel` abandons
+the current one, and results of abandoned loads are never delivered.
+"""
+
+import logging
+import threading
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+class LoadCancelled(Exception):
+    """Raised inside a load job once it has been cancelled"""
+
+
+class CancelToken:
+    """Cancellation flag handed to the reader functions"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        """Raise :class:`LoadCancelled` if the load was cancelled"""
+        if self._event.is_set():
+            raise LoadCancelled()
+
+
+class CloudLoader:
+    """Load clouds on a worker thread with preview, progress and cancellation
+
+    All callbacks are invoked on the worker thread; wrap them (e.g. with
+    :class:`~o3dgui.scheduler.UpdateScheduler`) to touch the GUI.
+
+    Args:
+      read_full (Callable): ``read_full(path, token, progress)`` returning the
+          loaded cloud; may call ``progress(fraction, message)`` and
+          ``token.check()``
+      read_preview (Callable): optional ``read_preview(path, token)``
+          returning a quick low-resolution cloud, or ``None`` to skip it
+      make_preview (Callable): optional ``make_preview(cloud)`` deriving a
+          preview from the full cloud when ``read_preview`` is not available
+      on_preview (Callable): ``on_preview(path, preview)``
+      on_done (Callable): ``on_done(path, cloud)``
+      on_progress (Callable): ``on_progress(path, fraction, message)``
+      on_error (Callable): ``on_error(path, exception)``
+    """
+
+    def __init__(
+        self,
+        read_full,
+        read_preview=None,
+        make_preview=None,
+        on_preview=None,
+        on_done=None,
+        on_progress=None,
+        on_error=None,
+    ):
+        self._read_full = read_full
+        self._read_preview = read_preview
+        self._make_preview = make_preview
+        self._on_preview = on_preview
+        self._on_done = on_done
+        self._on_progress = on_progress
+        self._on_error = on_error
+        self._lock = threading.Lock()
+        self._token = None
+        self._thread = None
+
+    @property
+    def busy(self):
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def load(self, path):
+        """Start loading ``path``, cancelling any load in progress
+
+        Returns:
+          :obj:`CancelToken`: token of the new load
+        """
+        token = CancelToken()
+        with self._lock:
+            if self._token is not None:
+                self._token.cancel()
+            self._token = token
+            self._thread = threading.Thread(
+                target=self._run, args=(path, token), name="CloudLoader", daemon=True
+            )
+            self._thread.start()
+        return token
+
+    def cancel(self):
+        """Abandon the current load, if any"""
+        with self._lock:
+            if self._token is not None:
+                self._token.cancel()
+                self._token = None
+
+    def wait(self, timeout=None):
+        """Wait for the current worker thread to finish"""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _deliver(self, token, callback, *args):
+        # Deliver only while this load is still the current one.
+        with self._lock:
+            current = token is self._token and not token.cancelled
+        if current and callback is not None:
+            callback(*args)
+        return current
+
+    def _run(self, path, token):
+        def progress(fraction, message=""):
+            token.check()
+            self._deliver(token, self._on_progress, path, fraction, message)
+
+        try:
+            progress(0.0, "Loading")
+            previewed = False
+            if self._read_preview is not None:
+                preview = self._read_preview(path, token)
+                if preview is not None:
+                    previewed = self._deliver(token, self._on_preview, path, preview)
+                    progress(0.1, "Preview ready")
+
+            cloud = self._read_full(path, token, progress)
+            token.check()
+
+            if not previewed and self._make_preview is not None:
+                preview = self._make_preview(cloud)
+                if preview is not None:
+                    self._deliver(token, self._on_preview, path, preview)
+
+            progress(1.0, "Done")
+            with self._lock:
+                if token is not self._token or token.cancelled:
+                    raise LoadCancelled()
+                self._token = None
+            if self._on_done is not None:
+                self._on_done(path, cloud)
+        except LoadCancelled:
+            _logger.debug("Load of %s cancelled", path)
+        except Exception as error:
+            _logger.exception("Loading %s failed", path)
+            self._deliver(token, self._on_error, path, error)
@@ -0,0 +1,510 @@
+"""
+Out-of-core octree level of detail for very large point clouds.
+
+:func:`build_lod` sorts a cloud into octree nodes: every node keeps a random
+sample of at most ``node_points`` of the points in its cell that coarser
+nodes did not already take, so the union of the nodes down to any depth is a
+roughly uniform subsample. The build streams over the input in chunks, so
+the source can be a memory-mapped scan larger than memory. Points are
+written node by node to ``.npy`` files in a directory (the GUI keeps it in
+the :class:`~o3dgui.cache.CloudCache`, keyed by the source's content), and
+:class:`LodCloud` memory-maps them back, so only the nodes that get drawn
+are ever read.
+
+:meth:`LodCloud.select` picks the nodes worth drawing from a camera position
+under a point budget, and :class:`LodStreamer` does the selection and the
+gathering on a worker thread whenever the camera moves.
+"""
+
+import heapq
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+NODE_DTYPE = np.dtype(
+    [("depth", "<i4"), ("cell", "<i8"), ("start", "<i8"), ("count", "<i8")]
+)
+
+# Per-point build state besides the depth a point was assigned to
+_UNASSIGNED = 255
+_DROPPED = 254
+
+
+def _cells(xyz, origin, size, depth):
+    """Linear cell index of every point in the 2^depth grid"""
+    n = 1 << depth
+    ijk = np.floor((xyz - origin) * (n / size)).astype(np.int64)
+    np.clip(ijk, 0, n - 1, out=ijk)
+    return (ijk[:, 0] * n + ijk[:, 1]) * n + ijk[:, 2]
+
+
+def _uniform(index, depth, seed):
+    """Reproducible uniform [0, 1) value per point index and depth
+
+    A splitmix64 hash stands in for a random permutation, which would have
+    to hold an index per point in memory.
+    """
+    z = index.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    z += np.uint64((seed << 8 | depth) * 0xD1B54A32D192ED03 & 0xFFFFFFFFFFFFFFFF)
+    z ^= z >> np.uint64(30)
+    z *= np.uint64(0xBF58476D1CE4E5B9)
+    z ^= z >> np.uint64(27)
+    z *= np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return (z >> np.uint64(11)) * (1.0 / (1 << 53))
+
+
+def _rank_in_groups(keys):
+    """Position of every element within its run of equal sorted ``keys``"""
+    if not len(keys):
+        return np.empty(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return np.arange(len(keys)) - np.repeat(starts, np.diff(np.r_[starts, len(keys)]))
+
+
+def _add_counts(cells, counts, new_cells):
+    """Merge the histogram of ``new_cells`` into the sorted ``cells``/``counts``"""
+    new, new_counts = np.unique(new_cells, return_counts=True)
+    if cells is None:
+        return new, new_counts
+    merged, inverse = np.unique(np.concatenate([cells, new]), return_inverse=True)
+    weights = np.concatenate([counts, new_counts])
+    return merged, np.bincount(inverse, weights, len(merged)).astype(np.int64)
+
+
+def _chunks(count, chunk_points):
+    for start in range(0, count, chunk_points):
+        yield start, min(start + chunk_points, count)
+
+
+def _node_table(levels):
+    if not levels:
+        return np.empty(0, dtype=NODE_DTYPE)
+    nodes = np.empty(sum(len(cells) for cells, _ in levels), dtype=NODE_DTYPE)
+    nodes["depth"] = np.repeat(np.arange(len(levels)), [len(c) for c, _ in levels])
+    nodes["cell"] = np.concatenate([cells for cells, _ in levels])
+    nodes["count"] = np.concatenate([counts for _, counts in levels])
+    nodes["start"] = np.cumsum(nodes["count"]) - nodes["count"]
+    return nodes
+
+
+def build_lod(
+    xyz,
+    colors=None,
+    path=None,
+    node_points=20000,
+    max_depth=12,
+    progress=None,
+    token=None,
+    chunk_points=1 << 20,
+    seed=0,
+):
+    """Build the octree and write it to ``path``
+
+    The input is only ever read ``chunk_points`` points at a time, once per
+    octree depth, so it may be a memory-mapped file far larger than memory.
+    The depth each point ends up at is tracked in a temporary one-byte-per-
+    point file in ``path``, and the output files are memory-mapped too.
+
+    A node takes each point of its cell with probability ``node_points``
+    over the number of points left in the cell, capped at ``node_points``,
+    so nodes are random samples of their cells.
+
+    Args:
+      xyz (np.ndarray): (N, 3) positions; may be a memory-mapped view
+      colors (np.ndarray): optional (N, 3) uint8 colors
+      path (str): output directory
+      node_points (int): maximum number of points kept per node
+      max_depth (int): depth of the leaves, which keep all remaining points
+      progress (Callable): optional ``progress(fraction)``
+      token (o3dgui.loader.CancelToken): checked between octree depths
+      chunk_points (int): points read at a time
+      seed (int): seed of the sampling, for reproducible builds
+
+    Returns:
+      :obj:`LodCloud`: the written LOD, memory-mapped
+    """
+    count = len(xyz)
+    os.makedirs(path, exist_ok=True)
+    state_path = os.path.join(path, "depth.tmp")
+    state = np.memmap(state_path, dtype=np.uint8, mode="w+", shape=(max(count, 1),))
+    try:
+        lo, hi, remaining = _bounds(xyz, state, chunk_points)
+        size = float(max((hi - lo).max(), 1e-9))
+        levels = _assign_depths(
+            xyz,
+            state,
+            lo,
+            size,
+            remaining,
+            node_points,
+            max_depth,
+            seed,
+            chunk_points,
+            progress,
+            token,
+        )
+        if token is not None:
+            token.check()
+        nodes = _node_table(levels)
+        _write_nodes(xyz, colors, state, levels, nodes, path, lo, size, chunk_points)
+    finally:
+        del state
+        os.remove(state_path)
+    if progress is not None:
+        progress(1.0)
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "origin": lo.tolist(),
+        "size": size,
+        "bounds": [lo.tolist(), hi.tolist()],
+        "node_points": node_points,
+        "max_depth": max_depth,
+    }
+    # Written last: a directory without meta.json is an interrupted build.
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return LodCloud(path)
+
+
+def _bounds(xyz, state, chunk_points):
+    # Bounds of the finite points; the others are marked as dropped
+    lo, hi = np.full(3, np.inf), np.full(3, -np.inf)
+    remaining = 0
+    for start, end in _chunks(len(xyz), chunk_points):
+        chunk = np.asarray(xyz[start:end], dtype=np.float64)
+        finite = np.isfinite(chunk).all(axis=1)
+        state[start:end] = np.where(finite, _UNASSIGNED, _DROPPED)
+        if finite.all():
+            lo = np.minimum(lo, chunk.min(axis=0))
+            hi = np.maximum(hi, chunk.max(axis=0))
+        elif finite.any():
+            lo = np.minimum(lo, chunk[finite].min(axis=0))
+            hi = np.maximum(hi, chunk[finite].max(axis=0))
+        remaining += int(finite.sum())
+    if not remaining:
+        lo = hi = np.zeros(3)
+    # Round-trip through float32, the type the points are stored as
+    return (
+        lo.astype(np.float32).astype(np.float64),
+        hi.astype(np.float32).astype(np.float64),
+        remaining,
+    )
+
+
+def _assign_depths(
+    xyz,
+    state,
+    origin,
+    size,
+    remaining,
+    node_points,
+    max_depth,
+    seed,
+    chunk_points,
+    progress,
+    token,
+):
+    """Record the depth of every point in ``state``, one pass per depth
+
+    Returns:
+      List[Tuple[np.ndarray, np.ndarray]]: sorted cells and point counts of
+      the nodes of each depth
+    """
+    total = max(remaining, 1)
+    # Everything starts in the root cell
+    cells = np.zeros(1 if remaining else 0, dtype=np.int64)
+    counts = np.array([remaining] if remaining else [], dtype=np.int64)
+    levels = []
+    for depth in range(max_depth + 1):
+        if not len(cells):
+            break
+        if token is not None:
+            token.check()
+        leaf = depth == max_depth
+        probability = node_points / counts
+        taken = np.zeros(len(cells), dtype=np.int64)
+        next_cells = next_counts = None
+        for start, end in _chunks(len(xyz), chunk_points):
+            chunk_state = state[start:end]
+            left = np.flatnonzero(chunk_state == _UNASSIGNED)
+            if not len(left):
+                continue
+            points = np.asarray(xyz[start:end], dtype=np.float64)[left]
+            slot = np.searchsorted(cells, _cells(points, origin, size, depth))
+            if leaf:
+                take = np.arange(len(left))
+            else:
+                candidates = np.flatnonzero(
+                    _uniform(start + left, depth, seed) < probability[slot]
+                )
+                # Sampled candidates, admitted while their node has room
+                candidates = candidates[np.argsort(slot[candidates], kind="stable")]
+                room = node_points - taken[slot[candidates]]
+                take = candidates[_rank_in_groups(slot[candidates]) < room]
+            taken += np.bincount(slot[take], minlength=len(cells))
+            chunk_state[left[take]] = depth
+            if not leaf:
+                rest = np.ones(len(left), dtype=bool)
+                rest[take] = False
+                next_cells, next_counts = _add_counts(
+                    next_cells,
+                    next_counts,
+                    _cells(points[rest], origin, size, depth + 1),
+                )
+        used = taken > 0
+        levels.append((cells[used], taken[used]))
+        remaining -= int(taken.sum())
+        if progress is not None:
+            progress(0.9 * (1.0 - remaining / total))
+        if next_cells is None:
+            break
+        cells, counts = next_cells, next_counts
+    return levels
+
+
+def _write_nodes(xyz, colors, state, levels, nodes, path, origin, size, chunk_points):
+    # Scatter every chunk's points straight to their node in the output files
+    total = int(nodes["count"].sum())
+    points_out = np.lib.format.open_memmap(
+        os.path.join(path, "points.npy"), mode="w+", dtype=np.float32, shape=(total, 3)
+    )
+    colors_out = None
+    if colors is not None:
+        colors_out = np.lib.format.open_memmap(
+            os.path.join(path, "colors.npy"),
+            mode="w+",
+            dtype=np.uint8,
+            shape=(total, 3),
+        )
+    np.save(os.path.join(path, "nodes.npy"), nodes)
+    if total:
+        first_node = np.cumsum([0] + [len(cells) for cells, _ in levels])
+        filled = np.zeros(len(nodes), dtype=np.int64)
+        for start, end in _chunks(len(xyz), chunk_points):
+            chunk_state = state[start:end]
+            kept = np.flatnonzero(chunk_state != _DROPPED)
+            if not len(kept):
+                continue
+            depths = chunk_state[kept]
+            points = np.asarray(xyz[start:end], dtype=np.float64)[kept]
+            node = np.empty(len(kept), dtype=np.int64)
+            for depth in np.unique(depths):
+                at = depths == depth
+                cells = _cells(points[at], origin, size, int(depth))
+                node[at] = first_node[depth] + np.searchsorted(levels[depth][0], cells)
+            order = np.argsort(node, kind="stable")
+            sorted_node = node[order]
+            target = (
+                nodes["start"][sorted_node]
+                + filled[sorted_node]
+                + _rank_in_groups(sorted_node)
+            )
+            filled += np.bincount(node, minlength=len(nodes))
+            points_out[target] = points[order]
+            if colors_out is not None:
+                colors_out[target] = np.asarray(colors[start:end], dtype=np.uint8)[
+                    kept
+                ][order]
+    for out in (points_out, colors_out):
+        if out is not None:
+            out.flush()
+
+
+class LodCloud:
+    """Memory-mapped octree written by :func:`build_lod`
+
+    Args:
+      path (str): LOD directory
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.nodes = np.load(os.path.join(path, "nodes.npy"))
+        self.points = np.load(os.path.join(path, "points.npy"), mmap_mode="r")
+        colors_path = os.path.join(path, "colors.npy")
+        self.colors = (
+            np.load(colors_path, mmap_mode="r") if os.path.exists(colors_path) else None
+        )
+        self.origin = np.asarray(self.meta["origin"])
+        self.size = float(self.meta["size"])
+        self._index = {
+            (int(depth), int(cell)): i
+            for i, (depth, cell) in enumerate(
+                zip(self.nodes["depth"], self.nodes["cell"])
+            )
+        }
+
+    def __len__(self):
+        return len(self.points)
+
+    @property
+    def bounds(self):
+        lo, hi = self.meta["bounds"]
+        return np.asarray(lo), np.asarray(hi)
+
+    def node_box(self, i):
+        """(min, max) corners of node ``i``"""
+        depth, cell = int(self.nodes["depth"][i]), int(self.nodes["cell"][i])
+        n = 1 << depth
+        ijk = np.array([cell // (n * n), (cell // n) % n, cell % n])
+        edge = self.size / n
+        lo = self.origin + ijk * edge
+        return lo, lo + edge
+
+    def children(self, i):
+        """Indices of the existing children of node ``i``"""
+        depth, cell = int(self.nodes["depth"][i]), int(self.nodes["cell"][i])
+        n = 1 << depth
+        x, y, z = cell // (n * n), (cell // n) % n, cell % n
+        m = 2 * n
+        found = []
+        for dx in (0, 1):
+            for dy in (0, 1):
+                for dz in (0, 1):
+                    key = (depth + 1, ((2 * x + dx) * m + 2 * y + dy) * m + 2 * z + dz)
+                    index = self._index.get(key)
+                    if index is not None:
+                        found.append(index)
+        return found
+
+    def select(self, eye, budget, min_size=0.002):
+        """Nodes to draw from camera position ``eye`` within ``budget`` points
+
+        Nodes are refined in order of their angular size (cell edge over
+        distance), so detail goes to what is close to the camera first;
+        cells smaller than ``min_size`` radians are not refined further.
+
+        Returns:
+          List[int]: selected node indices, coarse to fine
+        """
+        eye = np.asarray(eye, dtype=np.float64)
+        roots = np.flatnonzero(self.nodes["depth"] == 0)
+        heap = [(-self._priority(i, eye), int(i)) for i in roots]
+        heapq.heapify(heap)
+        selected, total = [], 0
+        while heap:
+            _, i = heapq.heappop(heap)
+            count = int(self.nodes["count"][i])
+            if total + count > budget:
+                continue
+            selected.append(i)
+            total += count
+            for child in self.children(i):
+                priority = self._priority(child, eye)
+                if priority >= min_size:
+                    heapq.heappush(heap, (-priority, child))
+        return selected
+
+    def _priority(self, i, eye):
+        lo, hi = self.node_box(i)
+        nearest = np.clip(eye, lo, hi)
+        distance = float(np.linalg.norm(eye - nearest))
+        edge = hi[0] - lo[0]
+        return edge / max(distance, edge * 0.5, 1e-12)
+
+    def gather(self, nodes, points_out, colors_out=None):
+        """Copy the points of ``nodes`` into the output buffers
+
+        Returns:
+          int: number of points written
+        """
+        total = 0
+        for i in nodes:
+            start, count = int(self.nodes["start"][i]), int(self.nodes["count"][i])
+            if total + count > len(points_out):
+                break
+            points_out[total : total + count] = self.points[start : start + count]
+            if colors_out is not None and self.colors is not None:
+                np.multiply(
+                    self.colors[start : start + count],
+                    np.float32(1.0 / 255.0),
+                    out=colors_out[total : total + count],
+                )
+            total += count
+        return total
+
+    def close(self):
+        self.points = self.colors = None
+
+
+class LodStreamer:
+    """Keeps a point buffer filled with the nodes visible from the camera
+
+    :meth:`update_camera` is cheap and may be called on every camera change;
+    selection and gathering run on a worker thread, only for the latest
+    camera position, and ``on_ready(count)`` is called after each refill.
+
+    Args:
+      lod (LodCloud): octree to stream from
+      cloud (o3dgui.geometry.IncrementalPointCloud): destination buffer; its
+          capacity is the point budget
+      on_ready (Callable): ``on_ready(count)`` after the buffer was refilled
+      min_size (float): see :meth:`LodCloud.select`
+    """
+
+    def __init__(self, lod, cloud, on_ready=None, min_size=0.002):
+        self.lod = lod
+        self.cloud = cloud
+        self.on_ready = on_ready
+        self.min_size = min_size
+        self.selected = []
+        self._points = np.empty((cloud.capacity, 3), dtype=np.float32)
+        self._colors = np.empty((cloud.capacity, 3), dtype=np.float32)
+        self._eye = None
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name="LodStreamer", daemon=True
+        )
+        self._thread.start()
+
+    def update_camera(self, eye):
+        with self._condition:
+            self._eye = np.asarray(eye, dtype=np.float64)
+            self._condition.notify()
+
+    def refresh(self, eye):
+        """Select and gather synchronously; returns the number of points"""
+        self.selected = self.lod.select(eye, self.cloud.capacity, self.min_size)
+        count = self.lod.gather(self.selected, self._points, self._colors)
+        self.cloud.set(
+            self._points[:count],
+            self._colors[:count] if self.lod.colors is not None else None,
+        )
+        return count
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._stopped or self._eye is not None)
+                if self._stopped:
+                    return
+                eye, self._eye = self._eye, None
+            try:
+                count = self.refresh(eye)
+            except Exception:
+                _logger.exception("LOD refresh failed")
+                continue
+            if self.on_ready is not None:
+                self.on_ready(count)
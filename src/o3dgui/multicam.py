@@ -0,0 +1,228 @@
+"""
+Synchronized capture from several cameras.
+
+:class:`CaptureManager` reads every source on its own thread and stamps each
+frame on arrival with one shared monotonic clock. :class:`FrameMatcher`
+groups frames from all sources whose timestamps lie within a tolerance into a
+:class:`FrameSet`, and a single consumer takes the framesets with
+:meth:`CaptureManager.get`.
+
+A source is anything with the ``RealsenseCapture`` interface:
+``read(return_depth=...)``, ``isOpened()`` and ``release()``, so
+:class:`~o3dgui.replay.ReplayCapture` works for tests and offline runs.
+"""
+
+import collections
+import logging
+import threading
+import time
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+Frame = collections.namedtuple("Frame", "source sequence timestamp color depth")
+Frame.__doc__ = "One frame of one source, stamped with the shared clock"
+
+FrameSet = collections.namedtuple("FrameSet", "timestamp skew frames")
+FrameSet.__doc__ = """Frames of all sources captured within the tolerance
+
+``timestamp`` is the mean of the frame timestamps, ``skew`` the spread
+between the earliest and latest frame and ``frames`` maps source names to
+:class:`Frame`.
+"""
+
+
+class FrameMatcher:
+    """Groups frames of several sources by timestamp
+
+    Frames of each source must be pushed in timestamp order. Whenever every
+    source has a frame queued, the oldest heads are compared: if they all lie
+    within ``tolerance`` they form a frameset, otherwise the oldest head
+    cannot match anything anymore and is dropped.
+
+    Args:
+      names (Iterable[str]): source names
+      tolerance (float): maximum spread of a frameset, in seconds
+      maxlen (int): frames kept per source while waiting for the others
+    """
+
+    def __init__(self, names, tolerance, maxlen=8):
+        self.names = list(names)
+        self.tolerance = tolerance
+        self._queues = {name: collections.deque(maxlen=maxlen) for name in self.names}
+        self.matched = 0
+        self.unmatched = dict.fromkeys(self.names, 0)
+
+    def push(self, frame):
+        """Queue ``frame`` and return the framesets it completed"""
+        queue = self._queues[frame.source]
+        if len(queue) == queue.maxlen:
+            self.unmatched[frame.source] += 1
+        queue.append(frame)
+
+        framesets = []
+        while all(self._queues.values()):
+            heads = [self._queues[name][0] for name in self.names]
+            earliest = min(heads, key=lambda head: head.timestamp)
+            latest = max(head.timestamp for head in heads)
+            if latest - earliest.timestamp <= self.tolerance:
+                for name in self.names:
+                    self._queues[name].popleft()
+                timestamp = sum(head.timestamp for head in heads) / len(heads)
+                framesets.append(
+                    FrameSet(
+                        timestamp,
+                        latest - earliest.timestamp,
+                        dict(zip(self.names, heads)),
+                    )
+                )
+                self.matched += 1
+            else:
+                self._queues[earliest.source].popleft()
+                self.unmatched[earliest.source] += 1
+        return framesets
+
+
+class CaptureManager:
+    """Runs several captures and delivers matched framesets
+
+    Args:
+      sources (Dict[str, object]): captures by name
+      tolerance (float): maximum timestamp spread within a frameset, in
+          seconds; keep it below half the frame period
+      with_depth (bool): read depth frames as well
+      queue_size (int): framesets kept for the consumer; the oldest is
+          dropped when the consumer falls behind
+      clock (Callable[[], float]): shared monotonic clock
+    """
+
+    # Pause after a failed read on a source that is still open, so a camera
+    # that keeps timing out does not spin a core
+    RETRY_DELAY = 0.005
+
+    def __init__(
+        self,
+        sources,
+        tolerance=0.010,
+        with_depth=True,
+        queue_size=4,
+        clock=time.monotonic,
+    ):
+        self.sources = dict(sources)
+        self.with_depth = with_depth
+        self.clock = clock
+        self.matcher = FrameMatcher(self.sources, tolerance)
+        self.frames_read = dict.fromkeys(self.sources, 0)
+        self.framesets_dropped = 0
+        self._ready = collections.deque(maxlen=queue_size)
+        self._condition = threading.Condition()
+        self._running = False
+        self._ended = set()
+        self._threads = []
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._ended.clear()
+        self._threads = [
+            threading.Thread(
+                target=self._capture, args=(name,), name=f"Capture-{name}", daemon=True
+            )
+            for name in self.sources
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, release=True):
+        """Stop the capture threads and optionally release the sources"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if release:
+            for source in self.sources.values():
+                source.release()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def finished(self):
+        """Whether a source ended, so no more framesets can be completed"""
+        return bool(self._ended)
+
+    def _read(self, source):
+        result = source.read(return_depth=self.with_depth)
+        # Sources without depth support return (ok, color) regardless
+        ok, color = result[0], result[1]
+        depth = result[2] if len(result) > 2 else None
+        return ok, color, depth
+
+    def _capture(self, name):
+        source = self.sources[name]
+        sequence = 0
+        while self._running:
+            ok, color, depth = self._read(source)
+            timestamp = self.clock()
+            if not ok:
+                if not source.isOpened():
+                    _logger.info("Capture %s ended", name)
+                    with self._condition:
+                        self._ended.add(name)
+                        self._condition.notify_all()
+                    return
+                time.sleep(self.RETRY_DELAY)
+                continue
+
+            frame = Frame(name, sequence, timestamp, color, depth)
+            sequence += 1
+            with self._condition:
+                self.frames_read[name] += 1
+                framesets = self.matcher.push(frame)
+                for frameset in framesets:
+                    if len(self._ready) == self._ready.maxlen:
+                        self.framesets_dropped += 1
+                    self._ready.append(frameset)
+                if framesets:
+                    self._condition.notify_all()
+
+    def get(self, timeout=None):
+        """Next frameset, oldest first
+
+        Returns:
+          :obj:`FrameSet`: or ``None`` on timeout, after :meth:`stop`, or once
+          a source ended and all framesets were taken
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._ready or not self._running or self._ended, timeout
+            )
+            if self._ready:
+                return self._ready.popleft()
+            return None
+
+    def __iter__(self):
+        while True:
+            frameset = self.get()
+            if frameset is None:
+                return
+            yield frameset
+
+    def stats(self):
+        with self._condition:
+            return {
+                "read": dict(self.frames_read),
+                "matched": self.matcher.matched,
+                "unmatched": dict(self.matcher.unmatched),
+                "dropped": self.framesets_dropped,
+            }
@@ -0,0 +1,166 @@
+"""
+Back-projection of depth frames into point clouds.
+
+The per-pixel viewing rays only depend on the camera intrinsics and the frame
+size, so they are computed once and every incoming depth frame is turned into
+XYZ coordinates with a single NumPy multiply into a reused buffer.
+"""
+
+import logging
+
+import numpy as np
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+class DepthProjector:
+    """Back-project z16 depth frames into XYZ (+RGB) points
+
+    Args:
+      width (int): depth frame width in pixels
+      height (int): depth frame height in pixels
+      fx (float): focal length along x in pixels
+      fy (float): focal length along y in pixels
+      cx (float): principal point x in pixels
+      cy (float): principal point y in pixels
+      depth_scale (float): meters per depth unit, defaults to 0.001
+      depth_trunc (float): points farther than this (meters) are dropped,
+          ``None`` keeps everything
+      bounds (Tuple[np.ndarray, np.ndarray]): ``(min, max)`` corners of a box
+          in meters; points outside it are dropped, ``None`` keeps everything
+    """
+
+    def __init__(
+        self,
+        width,
+        height,
+        fx,
+        fy,
+        cx,
+        cy,
+        depth_scale=0.001,
+        depth_trunc=None,
+        bounds=None,
+    ):
+        self.width = int(width)
+        self.height = int(height)
+        self.depth_scale = float(depth_scale)
+        self.depth_trunc = depth_trunc
+        self.bounds = (
+            None
+            if bounds is None
+            else np.asarray(bounds, dtype=np.float32).reshape(2, 3)
+        )
+        self._inside = np.empty((self.height, self.width), dtype=bool)
+
+        # Ray table: (x, y, 1) per pixel, with the depth scale folded in so a
+        # raw uint16 frame can be multiplied in directly.
+        u = (np.arange(self.width, dtype=np.float32) - cx) / fx
+        v = (np.arange(self.height, dtype=np.float32) - cy) / fy
+        rays = np.empty((self.height, self.width, 3), dtype=np.float32)
+        rays[..., 0] = u[np.newaxis, :]
+        rays[..., 1] = v[:, np.newaxis]
+        rays[..., 2] = 1.0
+        rays *= self.depth_scale
+        self._rays = rays
+
+        self._xyz = np.empty_like(rays)
+        # Output buffers; the valid points are gathered into their heads.
+        n_pixels = self.width * self.height
+        self._points = np.empty((n_pixels, 3), dtype=np.float32)
+        self._colors_u8 = np.empty((n_pixels, 3), dtype=np.uint8)
+        self._colors = np.empty((n_pixels, 3), dtype=np.float32)
+        if depth_trunc is None:
+            self._max_raw = None
+        else:
+            self._max_raw = depth_trunc / self.depth_scale
+
+    @classmethod
+    def from_intrinsics(
+        cls, intrinsics, depth_scale=0.001, depth_trunc=None, bounds=None
+    ):
+        """Build a projector from a ``pyrealsense2.intrinsics`` object
+
+        Args:
+          intrinsics: object exposing ``width``, ``height``, ``fx``, ``fy``,
+              ``ppx`` and ``ppy``
+          depth_scale (float): meters per depth unit
+          depth_trunc (float): far clipping distance in meters, or ``None``
+          bounds (Tuple[np.ndarray, np.ndarray]): optional box, see above
+
+        Returns:
+          :obj:`DepthProjector`: projector for that camera
+        """
+        return cls(
+            intrinsics.width,
+            intrinsics.height,
+            intrinsics.fx,
+            intrinsics.fy,
+            intrinsics.ppx,
+            intrinsics.ppy,
+            depth_scale=depth_scale,
+            depth_trunc=depth_trunc,
+            bounds=bounds,
+        )
+
+    def valid_mask(self, depth):
+        """Pixels holding a usable depth sample
+
+        Args:
+          depth (np.ndarray): (H, W) uint16 depth frame
+
+        Returns:
+          np.ndarray: (H, W) boolean mask
+        """
+        mask = depth > 0
+        if self._max_raw is not None:
+            mask &= depth <= self._max_raw
+        return mask
+
+    def project(self, depth, color=None):
+        """Back-project a depth frame
+
+        The results are written into buffers owned by the projector, so the
+        returned arrays are only valid until the next call.
+
+        Args:
+          depth (np.ndarray): (H, W) uint16 depth frame, may be a strided view
+              (e.g. a :class:`~o3dgui.roi.RegionOfInterest` crop)
+          color (np.ndarray): optional (H, W, 3) uint8 image registered to the
+              depth frame
+
+        Returns:
+          Tuple[np.ndarray, np.ndarray]: (N, 3) float32 points in meters and
+          (N, 3) float32 colors in [0, 1] (``None`` without ``color``)
+        """
+        if depth.shape != (self.height, self.width):
+            raise ValueError(
+                f"Depth frame shape {depth.shape} does not match projector "
+                f"{(self.height, self.width)}"
+            )
+        np.multiply(self._rays, depth[..., np.newaxis], out=self._xyz)
+
+        # np.take into preallocated buffers is several times faster than
+        # boolean-mask indexing, which allocates on every call.
+        mask = self.valid_mask(depth)
+        if self.bounds is not None:
+            for axis in range(3):
+                coordinate = self._xyz[..., axis]
+                mask &= np.greater_equal(
+                    coordinate, self.bounds[0, axis], out=self._inside
+                )
+                mask &= np.less_equal(
+                    coordinate, self.bounds[1, axis], out=self._inside
+                )
+        index = np.flatnonzero(mask)
+        n = len(index)
+        points = np.take(self._xyz.reshape(-1, 3), index, axis=0, out=self._points[:n])
+        colors = None
+        if color is not None:
+            rgb = np.take(color.reshape(-1, 3), index, axis=0, out=self._colors_u8[:n])
+            colors = np.multiply(rgb, np.float32(1.0 / 255.0), out=self._colors[:n])
+        return points, colors
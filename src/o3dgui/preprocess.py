@@ -0,0 +1,464 @@
+"""
+Chunked, multi-process preprocessing of loaded point clouds.
+
+:class:`Preprocessor` runs up to three passes, each split into spatial chunks
+that are processed in a process pool:
+
+1. voxel-grid downsampling (centroid of the points and colors per voxel);
+2. statistical outlier removal (mean distance to the ``k`` nearest
+   neighbours, thresholded at ``mean + std_ratio * std`` over the whole
+   cloud);
+3. normal estimation (smallest eigenvector of the neighbourhood covariance,
+   oriented towards a viewpoint).
+
+Neighbourhoods are the ``k`` nearest points within ``radius``, like Open3D's
+hybrid search. Chunks carry a halo of ``radius`` around them, so every point
+sees the neighbours it would see without chunking, and results are merged in
+a fixed order: the output does not depend on the number of workers.
+"""
+
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+
+import numpy as np
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+CHUNKS_PER_AXIS = 4
+
+_OFFSETS = np.array(
+    [(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)]
+)
+_COLUMNS = np.array([(i, j, 0) for i in (-1, 0, 1) for j in (-1, 0, 1)])
+
+
+def _linear(ijk, dims):
+    return (ijk[:, 0] * dims[1] + ijk[:, 1]) * dims[2] + ijk[:, 2]
+
+
+def knn_pairs(points, n_query, radius, k, block=16384):
+    """k nearest neighbours within ``radius`` of the first ``n_query`` points
+
+    Points are bucketed in a grid of ``radius`` cells. Sorted by cell, the
+    three cells along z of every (x, y) column are contiguous, so the 27
+    neighbouring cells of a query are 9 ranges; their candidates are padded
+    into a matrix and the ``k`` nearest picked with ``argpartition``.
+
+    Args:
+      points (np.ndarray): (N, 3) points; the first ``n_query`` are queried
+      radius (float): search radius
+      k (int): maximum number of neighbours, the query point included
+
+    Returns:
+      Tuple[np.ndarray, np.ndarray, np.ndarray]: query index, neighbour index
+      and squared distance of every pair, sorted by query then distance
+    """
+    points = np.asarray(points, dtype=np.float64)
+    origin = points.min(axis=0) - radius
+    ijk = np.floor((points - origin) / radius).astype(np.int64)
+    dims = ijk.max(axis=0) + 2
+    keys = _linear(ijk, dims)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    sorted_points = points[order]
+    r2 = radius * radius
+
+    queries, neighbours, distances = [], [], []
+    for start in range(0, n_query, block):
+        stop = min(start + block, n_query)
+        n = stop - start
+        q_ijk = ijk[start:stop]
+        lo = np.empty((n, 9), dtype=np.int64)
+        hi = np.empty((n, 9), dtype=np.int64)
+        for column, offset in enumerate(_COLUMNS):
+            cell = _linear(q_ijk + offset, dims)
+            lo[:, column] = np.searchsorted(sorted_keys, cell - 1, "left")
+            hi[:, column] = np.searchsorted(sorted_keys, cell + 1, "right")
+        counts = (hi - lo).ravel()
+        per_query = counts.reshape(n, 9).sum(axis=1)
+        width = max(int(per_query.max()), 1)
+
+        # Flat candidate list, query-major, scattered into a padded matrix
+        total = int(per_query.sum())
+        within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidate = np.repeat(lo.ravel(), counts) + within
+        row_start = np.cumsum(per_query) - per_query
+        row = np.repeat(np.arange(n), per_query)
+        flat = np.arange(total) + row * width - np.repeat(row_start, per_query)
+        squared = np.zeros(total)
+        for axis in range(3):
+            delta = sorted_points[candidate, axis] - points[start:stop, axis][row]
+            squared += delta * delta
+        squared[squared > r2] = np.inf
+        d = np.full(n * width, np.inf)
+        d[flat] = squared
+        d = d.reshape(n, width)
+
+        # Positions within a row map back to the flat candidate list
+        position = np.broadcast_to(np.arange(width), (n, width))
+        if width > k:
+            position = np.argpartition(d, k - 1, axis=1)[:, :k]
+            d = np.take_along_axis(d, position, axis=1)
+        by_distance = np.argsort(d, axis=1, kind="stable")
+        d = np.take_along_axis(d, by_distance, axis=1)
+        position = np.take_along_axis(position, by_distance, axis=1)
+
+        valid = np.isfinite(d)
+        queries.append(np.broadcast_to(np.arange(start, stop)[:, None], d.shape)[valid])
+        neighbours.append(order[candidate[(row_start[:, None] + position)[valid]]])
+        distances.append(d[valid])
+
+    if not queries:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0)
+    return (
+        np.concatenate(queries),
+        np.concatenate(neighbours),
+        np.concatenate(distances),
+    )
+
+
+def voxel_downsample(points, colors, origin, voxel_size):
+    """Centroid of the points (and colors) in every occupied voxel
+
+    Returns:
+      Tuple[np.ndarray, np.ndarray, np.ndarray]: sorted voxel keys, centroids
+      and mean colors (``None`` without colors)
+    """
+    ijk = np.floor((points - origin) / voxel_size).astype(np.int64)
+    keys = _linear(ijk, np.full(3, 1 << 20, dtype=np.int64))
+    unique, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    centroids = np.empty((len(unique), 3))
+    for axis in range(3):
+        centroids[:, axis] = np.bincount(inverse, points[:, axis], len(unique)) / counts
+    mean_colors = None
+    if colors is not None:
+        mean_colors = np.empty((len(unique), colors.shape[1]))
+        for axis in range(colors.shape[1]):
+            mean_colors[:, axis] = (
+                np.bincount(inverse, colors[:, axis], len(unique)) / counts
+            )
+    return unique, centroids, mean_colors
+
+
+def mean_neighbour_distance(points, n_query, radius, k):
+    """Mean distance to the ``k`` nearest neighbours (``inf`` when isolated)"""
+    q, _, d = knn_pairs(points, n_query, radius, k + 1)
+    # The nearest "neighbour" of every point is itself
+    first = np.r_[True, q[1:] != q[:-1]] if len(q) else np.empty(0, dtype=bool)
+    q, d = q[~first], d[~first]
+    counts = np.bincount(q, minlength=n_query)
+    sums = np.bincount(q, np.sqrt(d), minlength=n_query)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.inf)
+
+
+def estimate_normals(points, n_query, radius, k, viewpoint=(0.0, 0.0, 0.0)):
+    """Normals of the first ``n_query`` points, oriented towards ``viewpoint``"""
+    points = np.asarray(points, dtype=np.float64)
+    q, p, _ = knn_pairs(points, n_query, radius, k)
+    # Relative to the query point: exact whatever else is in the chunk
+    offsets = points[p] - points[q]
+    counts = np.bincount(q, minlength=n_query).astype(np.float64)
+    safe = np.maximum(counts, 1.0)
+    mean = (
+        np.stack([np.bincount(q, offsets[:, a], n_query) for a in range(3)], axis=1)
+        / safe[:, None]
+    )
+    covariance = np.empty((n_query, 3, 3))
+    for a in range(3):
+        for b in range(a, 3):
+            value = (
+                np.bincount(q, offsets[:, a] * offsets[:, b], n_query) / safe
+                - mean[:, a] * mean[:, b]
+            )
+            covariance[:, a, b] = covariance[:, b, a] = value
+
+    normals = np.zeros((n_query, 3))
+    normals[:, 2] = 1.0
+    enough = counts >= 3
+    if enough.any():
+        _, vectors = np.linalg.eigh(covariance[enough])
+        normals[enough] = vectors[:, :, 0]
+    towards = np.asarray(viewpoint, dtype=np.float64) - points[:n_query]
+    flip = (normals * towards).sum(axis=1) < 0
+    normals[flip] *= -1
+    return normals
+
+
+def _voxel_task(args):
+    points, colors, origin, voxel_size = args
+    return voxel_downsample(points, colors, origin, voxel_size)
+
+
+def _outlier_task(args):
+    points, n_core, radius, k = args
+    return mean_neighbour_distance(points, n_core, radius, k)
+
+
+def _normal_task(args):
+    points, n_core, radius, k, viewpoint = args
+    return estimate_normals(points, n_core, radius, k, viewpoint)
+
+
+def estimate_radius(points, neighbours, iterations=3):
+    """Search radius holding about ``neighbours`` points around each point
+
+    Adjusts a grid until its occupied cells hold ``neighbours`` points on
+    average, assuming points lie on surfaces (density grows with area).
+    """
+    points = np.asarray(points)
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    extent = float(max((hi - lo).max(), 1e-9))
+    cell = extent / max(np.sqrt(len(points)), 1.0)
+    for _ in range(iterations):
+        ijk = np.floor((points - lo) / cell).astype(np.int64)
+        occupied = len(np.unique(_linear(ijk, ijk.max(axis=0) + 1)))
+        per_cell = len(points) / max(occupied, 1)
+        cell *= np.sqrt(neighbours / per_cell)
+        cell = min(cell, extent)
+    return float(cell)
+
+
+class Preprocessor:
+    """Voxel downsampling, outlier removal and normals over spatial chunks
+
+    Every pass is off by default; see :attr:`enabled`.
+
+    Args:
+      voxel_size (float): voxel edge; ``None`` skips downsampling
+      outlier_neighbors (int): ``k`` of the outlier test; 0 skips it
+      outlier_std_ratio (float): points with a mean neighbour distance over
+          ``mean + ratio * std`` are removed
+      normal_neighbors (int): ``k`` of the normal estimation; 0 skips it
+      radius (float): neighbour search radius; estimated from the cloud
+          when ``None``
+      viewpoint (Tuple[float, float, float]): normals face this point
+      chunk_size (float): chunk edge; by default the longest side of the
+          cloud is cut into ``CHUNKS_PER_AXIS`` chunks
+      workers (int): processes; 0 or 1 runs in the calling process
+    """
+
+    def __init__(
+        self,
+        voxel_size=None,
+        outlier_neighbors=0,
+        outlier_std_ratio=2.0,
+        normal_neighbors=0,
+        radius=None,
+        viewpoint=(0.0, 0.0, 0.0),
+        chunk_size=None,
+        workers=None,
+    ):
+        self.voxel_size = voxel_size
+        self.outlier_neighbors = outlier_neighbors
+        self.outlier_std_ratio = outlier_std_ratio
+        self.normal_neighbors = normal_neighbors
+        self.radius = radius
+        self.viewpoint = tuple(viewpoint)
+        self.chunk_size = chunk_size
+        self.workers = os.cpu_count() if workers is None else workers
+        self._executor = None
+
+    @property
+    def enabled(self):
+        """Whether any pass runs; when not, :meth:`run` is not worth calling"""
+        return (
+            bool(self.voxel_size)
+            or self.outlier_neighbors > 0
+            or self.normal_neighbors > 0
+        )
+
+    def params(self):
+        """Parameters that affect the output, e.g. for cache keys"""
+        return {
+            "voxel_size": self.voxel_size,
+            "outlier_neighbors": self.outlier_neighbors,
+            "outlier_std_ratio": self.outlier_std_ratio,
+            "normal_neighbors": self.normal_neighbors,
+            "radius": self.radius,
+            "viewpoint": list(self.viewpoint),
+        }
+
+    def _map(self, func, tasks):
+        if self.workers <= 1 or len(tasks) <= 1:
+            return map(func, tasks)
+        if self._executor is None:
+            # spawn: forking a process that runs GUI and capture threads is unsafe
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor.map(func, tasks)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _chunk_size(self, extent, radius):
+        if self.chunk_size is not None:
+            size = self.chunk_size
+        else:
+            size = extent / CHUNKS_PER_AXIS
+        size = max(size, 2 * radius if radius else 0.0, 1e-9)
+        if self.voxel_size:
+            size = np.ceil(size / self.voxel_size) * self.voxel_size
+        return float(size)
+
+    @staticmethod
+    def _chunks(cells):
+        """Chunk keys and member indices, members in ascending order"""
+        dims = cells.max(axis=0) + 1
+        keys = _linear(cells, dims)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        stops = np.r_[starts[1:], len(order)]
+        return {tuple(cells[order[a]]): order[a:b] for a, b in zip(starts, stops)}
+
+    def _halo_tasks(self, points, origin, chunk_size, radius):
+        """Per chunk: core indices, and indices of core plus halo"""
+        cells = np.floor((points - origin) / chunk_size).astype(np.int64)
+        chunks = self._chunks(cells)
+        tasks = []
+        for cell, core in chunks.items():
+            lo = origin + np.asarray(cell) * chunk_size - radius
+            hi = lo + chunk_size + 2 * radius
+            halo = []
+            for offset in _OFFSETS:
+                if not offset.any():
+                    continue
+                members = chunks.get(tuple(np.asarray(cell) + offset))
+                if members is None:
+                    continue
+                near = ((points[members] >= lo) & (points[members] <= hi)).all(axis=1)
+                halo.append(members[near])
+            tasks.append((core, np.concatenate([core] + halo)))
+        return tasks
+
+    def run(self, points, colors=None, progress=None):
+        """Run the enabled passes
+
+        Args:
+          points (np.ndarray): (N, 3) positions
+          colors (np.ndarray): optional (N, 3) colors
+          progress (Callable): optional ``progress(fraction)``
+
+        Returns:
+          dict: ``points``, ``colors`` (or ``None``) and ``normals`` (or
+          ``None``) as float64 arrays
+        """
+        points = np.asarray(points, dtype=np.float64)
+        colors = None if colors is None else np.asarray(colors, dtype=np.float64)
+        finite = np.isfinite(points).all(axis=1)
+        if not finite.all():
+            points = points[finite]
+            colors = None if colors is None else colors[finite]
+        if not len(points):
+            return {"points": points, "colors": colors, "normals": None}
+
+        passes = [
+            bool(self.voxel_size),
+            self.outlier_neighbors > 0,
+            self.normal_neighbors > 0,
+        ]
+        done = [0]
+
+        def report():
+            done[0] += 1
+            if progress is not None:
+                progress(done[0] / max(sum(passes), 1))
+
+        origin = points.min(axis=0)
+        extent = float((points.max(axis=0) - origin).max())
+
+        if self.voxel_size:
+            points, colors = self._downsample(points, colors, origin, extent)
+            report()
+
+        radius = self.radius
+        if radius is None and (self.outlier_neighbors > 0 or self.normal_neighbors > 0):
+            k = max(self.outlier_neighbors, self.normal_neighbors)
+            radius = estimate_radius(points, k)
+            if self.voxel_size:
+                radius = max(radius, 1.5 * self.voxel_size)
+
+        if self.outlier_neighbors > 0 and len(points):
+            distances = self._per_point(
+                _outlier_task,
+                points,
+                origin,
+                extent,
+                radius,
+                (radius, self.outlier_neighbors),
+            )
+            finite_distances = distances[np.isfinite(distances)]
+            if len(finite_distances):
+                limit = (
+                    finite_distances.mean()
+                    + self.outlier_std_ratio * finite_distances.std()
+                )
+                keep = distances <= limit
+                _logger.debug("Removing %d outliers", int((~keep).sum()))
+                points = points[keep]
+                colors = None if colors is None else colors[keep]
+            report()
+
+        normals = None
+        if self.normal_neighbors > 0 and len(points):
+            normals = self._per_point(
+                _normal_task,
+                points,
+                origin,
+                extent,
+                radius,
+                (radius, self.normal_neighbors, self.viewpoint),
+            )
+            report()
+
+        return {"points": points, "colors": colors, "normals": normals}
+
+    def _downsample(self, points, colors, origin, extent):
+        voxel = np.floor((points - origin) / self.voxel_size).astype(np.int64)
+        per_chunk = max(int(round(self._chunk_size(extent, 0.0) / self.voxel_size)), 1)
+        chunks = self._chunks(voxel // per_chunk)
+        tasks = [
+            (
+                points[members],
+                None if colors is None else colors[members],
+                origin,
+                self.voxel_size,
+            )
+            for members in chunks.values()
+        ]
+        results = list(self._map(_voxel_task, tasks))
+        # Voxel keys are global, so sorting by them makes the output
+        # independent of how the cloud was chunked.
+        order = np.argsort(
+            np.concatenate([keys for keys, _, _ in results]), kind="stable"
+        )
+        points = np.concatenate([centroids for _, centroids, _ in results])[order]
+        if colors is not None:
+            colors = np.concatenate([mean_colors for _, _, mean_colors in results])[
+                order
+            ]
+        return points, colors
+
+    def _per_point(self, task, points, origin, extent, radius, args):
+        chunk_size = self._chunk_size(extent, radius)
+        halo_tasks = self._halo_tasks(points, origin, chunk_size, radius)
+        results = self._map(
+            task, [(points[indices], len(core)) + args for core, indices in halo_tasks]
+        )
+        output = None
+        for (core, _), values in zip(halo_tasks, results):
+            if output is None:
+                output = np.empty((len(points),) + values.shape[1:], dtype=values.dtype)
+            output[core] = values
+        return output
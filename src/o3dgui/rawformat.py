@@ -0,0 +1,276 @@
+"""
+Raw frame container for recorded sessions.
+
+A recording is a small JSON header followed by fixed-stride records, one per
+frame, each holding a timestamp and the raw bytes of every stream (e.g. rgb8
+color and z16 depth). Writing is plain sequential I/O and reading maps the
+records as a NumPy structured array, so any frame can be accessed in O(1)
+without decoding and only the touched pages are read from disk.
+
+Layout::
+
+    b"O3DRAW01" | uint32 header length | JSON header | padding to HEADER_ALIGN
+    record 0 | record 1 | ...
+"""
+
+import json
+import logging
+import os
+import struct
+import time
+
+import numpy as np
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+MAGIC = b"O3DRAW01"
+HEADER_ALIGN = 4096
+EXTENSION = ".o3draw"
+
+
+def record_dtype(streams):
+    """Structured dtype of one frame record
+
+    Args:
+      streams (dict): ``{name: (shape, dtype)}`` in record order
+
+    Returns:
+      np.dtype: packed dtype with a ``timestamp`` field and one field per stream
+    """
+    fields = [("timestamp", "<f8")]
+    for name, (shape, dtype) in streams.items():
+        if name == "timestamp":
+            raise ValueError("'timestamp' is reserved")
+        fields.append((name, np.dtype(dtype).newbyteorder("<"), tuple(shape)))
+    return np.dtype(fields)
+
+
+class RawRecordingWriter:
+    """Append frames to a raw recording
+
+    Args:
+      path (str): output file, conventionally ending in :data:`EXTENSION`
+      streams (dict): ``{name: (shape, dtype)}``, e.g.
+          ``{"color": ((480, 640, 3), np.uint8), "depth": ((480, 640), np.uint16)}``
+      fps (float): nominal frame rate stored in the header
+      metadata (dict): extra JSON-serializable values stored in the header
+      buffer_size (int): size of the write buffer in bytes
+    """
+
+    def __init__(self, path, streams, fps=30, metadata=None, buffer_size=1 << 22):
+        self.path = path
+        self.streams = {
+            name: (tuple(shape), np.dtype(dtype).newbyteorder("<"))
+            for name, (shape, dtype) in streams.items()
+        }
+        self.dtype = record_dtype(self.streams)
+        self._record = np.zeros((), dtype=self.dtype)
+        self.frames = 0
+
+        header = {
+            "version": 1,
+            "fps": fps,
+            "streams": [
+                {"name": name, "shape": list(shape), "dtype": dtype.str}
+                for name, (shape, dtype) in self.streams.items()
+            ],
+            "metadata": metadata or {},
+        }
+        payload = json.dumps(header).encode("utf-8")
+        head = MAGIC + struct.pack("<I", len(payload)) + payload
+        self.header_size = -(-len(head) // HEADER_ALIGN) * HEADER_ALIGN
+
+        self._file = open(path, "wb", buffering=buffer_size)
+        self._file.write(head.ljust(self.header_size, b"\0"))
+
+    def write(self, timestamp=None, **frames):
+        """Append one frame
+
+        Args:
+          timestamp (float): capture time in seconds, defaults to
+              :func:`time.perf_counter`
+          **frames (np.ndarray): one array per stream
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        if frames.keys() != self.streams.keys():
+            raise ValueError(
+                f"Expected streams {sorted(self.streams)}, got {sorted(frames)}"
+            )
+        for name, (shape, _) in self.streams.items():
+            frame = frames[name]
+            if frame.shape != shape:
+                raise ValueError(f"{name}: expected shape {shape}, got {frame.shape}")
+        # Validated first and written whole: a rejected frame leaves no
+        # partial record that would misalign every later one
+        record = self._record
+        record["timestamp"] = timestamp
+        for name, frame in frames.items():
+            record[name] = frame
+        self._file.write(record.data)
+        self.frames += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RawRecordingReader:
+    """Memory-mapped random access to a raw recording
+
+    Indexing returns views into the mapped file; nothing is copied or read
+    from disk until the pixels are actually used.
+
+    Args:
+      path (str): recording written by :class:`RawRecordingWriter`
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a raw recording")
+            (length,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(length).decode("utf-8"))
+        self.header = header
+        self.fps = header["fps"]
+        self.metadata = header.get("metadata", {})
+        self.streams = {
+            s["name"]: (tuple(s["shape"]), np.dtype(s["dtype"]))
+            for s in header["streams"]
+        }
+        self.dtype = record_dtype(self.streams)
+        self.header_size = -(-(len(MAGIC) + 4 + length) // HEADER_ALIGN) * HEADER_ALIGN
+
+        # A truncated trailing record (e.g. after a crash) is ignored.
+        count = (os.path.getsize(path) - self.header_size) // self.dtype.itemsize
+        if count > 0:
+            self.records = np.memmap(
+                path,
+                dtype=self.dtype,
+                mode="r",
+                offset=self.header_size,
+                shape=(count,),
+            )
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        """Frame ``index`` as ``{"timestamp": float, stream: view, ...}``"""
+        record = self.records[index]
+        frame = {name: record[name] for name in self.streams}
+        frame["timestamp"] = float(record["timestamp"])
+        return frame
+
+    def stream(self, name):
+        """All frames of one stream as a (N, ...) memory-mapped view"""
+        return self.records[name]
+
+    @property
+    def timestamps(self):
+        return self.records["timestamp"]
+
+    def close(self):
+        # The mapping is released once the last view into it goes away.
+        self.records = np.zeros(0, dtype=self.dtype)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Property ids shared with OpenCV's ``cv2.CAP_PROP_*`` so callers can use
+# either without this module depending on cv2.
+CAP_PROP_FRAME_WIDTH = 3
+CAP_PROP_FRAME_HEIGHT = 4
+CAP_PROP_FPS = 5
+CAP_PROP_FRAME_COUNT = 7
+CAP_PROP_POS_FRAMES = 1
+
+
+class RawVideoCapture:
+    """``cv2.VideoCapture``-like playback of one stream of a raw recording
+
+    Supports seeking with ``set(CAP_PROP_POS_FRAMES, index)``. Frames come
+    straight from the memory map, so playback is only bounded by how fast the
+    caller consumes them. When the recording has a ``"depth"`` stream,
+    ``read(return_depth=True)`` returns the matching depth frame as well.
+
+    Args:
+      path (str): raw recording
+      stream (str): stream to play back, defaults to ``"color"``
+    """
+
+    def __init__(self, path, stream="color"):
+        self._reader = RawRecordingReader(path)
+        if stream not in self._reader.streams:
+            raise ValueError(f"{path} has no stream {stream!r}")
+        self.streams = tuple(self._reader.streams)
+        self.depth_scale = self._reader.metadata.get("depth_scale", 0.001)
+        self._frames = self._reader.stream(stream)
+        self._depth = self._reader.stream("depth") if "depth" in self.streams else None
+        self._position = 0
+
+    def isOpened(self):
+        return self._reader is not None
+
+    def grab(self):
+        if self._reader is None or self._position >= len(self._frames):
+            return False
+        self._position += 1
+        return True
+
+    def read(self, image=None, return_depth=False):
+        if return_depth and self._depth is None:
+            raise ValueError("The recording has no depth stream")
+        if self._reader is None or self._position >= len(self._frames):
+            return (False, None, None) if return_depth else (False, None)
+        position = self._position
+        frame = self._frames[position]
+        self._position += 1
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+        else:
+            image = np.array(frame)
+        if return_depth:
+            return True, image, np.array(self._depth[position])
+        return True, image
+
+    def get(self, prop):
+        shape = self._frames.shape
+        values = {
+            CAP_PROP_FRAME_WIDTH: shape[2] if len(shape) > 2 else 0,
+            CAP_PROP_FRAME_HEIGHT: shape[1] if len(shape) > 1 else 0,
+            CAP_PROP_FPS: self._reader.fps if self._reader else 0,
+            CAP_PROP_FRAME_COUNT: len(self._frames),
+            CAP_PROP_POS_FRAMES: self._position,
+        }
+        return float(values.get(prop, 0))
+
+    def set(self, prop, value):
+        if prop != CAP_PROP_POS_FRAMES:
+            return False
+        self._position = min(max(int(value), 0), len(self._frames))
+        return True
+
+    def release(self):
+        if self._reader is not None:
+            self._frames = self._frames[:0]
+            self._depth = None
+            self._reader.close()
+            self._reader = None
@@ -0,0 +1,160 @@
+"""
+Background recording of frames.
+
+Encoding (e.g. ``cv2.VideoWriter.write`` with MJPG) runs on a dedicated writer
+thread fed by a bounded queue, so the capture loop only pays for one copy of
+the frame into a recycled buffer.
+"""
+
+import logging
+import queue
+import threading
+
+import numpy as np
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+DROP = "drop"
+BLOCK = "block"
+
+_STOP = object()
+
+
+class AsyncRecorder:
+    """Feed a frame sink from a writer thread
+
+    Args:
+      write (Callable[[np.ndarray], None]): sink for one frame, e.g.
+          ``cv2.VideoWriter.write``; only ever called from the writer thread
+      close (Callable[[], None]): called on the writer thread once all queued
+          frames are written, e.g. ``cv2.VideoWriter.release``
+      maxsize (int): maximum number of frames waiting to be written
+      policy (str): what :meth:`submit` does when the queue is full:
+          :data:`DROP` the new frame or :data:`BLOCK` until there is room
+    """
+
+    def __init__(self, write, close=None, maxsize=32, policy=DROP):
+        if policy not in (DROP, BLOCK):
+            raise ValueError(f"Unknown policy: {policy}")
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self._write = write
+        self._close = close
+        self.maxsize = maxsize
+        self.policy = policy
+
+        self._queue = queue.Queue(maxsize)
+        self._free = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.error = None
+
+        self.frames_queued = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+
+        self._thread = threading.Thread(
+            target=self._run, name="AsyncRecorder", daemon=True
+        )
+        self._thread.start()
+
+    def _buffer_for(self, frame):
+        # Reuse a buffer the writer thread has finished with when possible.
+        while True:
+            try:
+                buffer = self._free.get_nowait()
+            except queue.Empty:
+                return np.empty_like(frame)
+            if buffer.shape == frame.shape and buffer.dtype == frame.dtype:
+                return buffer
+
+    def submit(self, frame, timeout=None):
+        """Queue a copy of ``frame`` for writing
+
+        Args:
+          frame (np.ndarray): frame to record; it may be reused by the caller
+              as soon as this returns
+          timeout (float): with the :data:`BLOCK` policy, give up and drop the
+              frame after this many seconds (``None`` waits forever)
+
+        Returns:
+          bool: ``True`` if queued, ``False`` if dropped
+        """
+        if self._closed:
+            raise RuntimeError("AsyncRecorder is closed")
+        buffer = self._buffer_for(frame)
+        np.copyto(buffer, frame)
+        try:
+            if self.policy == BLOCK:
+                self._queue.put(buffer, timeout=timeout)
+            else:
+                self._queue.put_nowait(buffer)
+        except queue.Full:
+            self._free.put(buffer)
+            with self._lock:
+                self.frames_dropped += 1
+            return False
+        with self._lock:
+            self.frames_queued += 1
+        return True
+
+    def _run(self):
+        while True:
+            buffer = self._queue.get()
+            if buffer is _STOP:
+                try:
+                    if self._close is not None:
+                        self._close()
+                except Exception as error:
+                    _logger.exception("AsyncRecorder: closing failed")
+                    self.error = error
+                finally:
+                    self._queue.task_done()
+                # Always exit, or close() would wait on join() forever
+                return
+            try:
+                if self.error is None:
+                    self._write(buffer)
+                    with self._lock:
+                        self.frames_written += 1
+                self._free.put(buffer)
+            except Exception as error:
+                _logger.exception("AsyncRecorder: writing failed")
+                self.error = error
+            finally:
+                self._queue.task_done()
+
+    @property
+    def pending(self):
+        """Number of frames waiting to be written"""
+        return self._queue.qsize()
+
+    def flush(self):
+        """Block until every queued frame has been written"""
+        self._queue.join()
+
+    def close(self):
+        """Write the remaining frames, close the sink and stop the thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def stats(self):
+        """Recording counters
+
+        Returns:
+          dict: ``queued``, ``written``, ``dropped`` and ``pending`` frames
+        """
+        with self._lock:
+            return {
+                "queued": self.frames_queued,
+                "written": self.frames_written,
+                "dropped": self.frames_dropped,
+                "pending": self.pending,
+            }
@@ -0,0 +1,206 @@
+"""
+Replay capture that stands in for the RealSense camera.
+
+:class:`ReplayCapture` exposes the same ``read()/isOpened()/release()`` surface
+as ``RealsenseCapture`` but is fed from a recorded session
+(:class:`~o3dgui.rawformat.RawRecordingReader`) or from a synthetic frame
+generator, so the capture pipeline can run and be profiled without hardware.
+"""
+
+import logging
+from types import SimpleNamespace
+
+import numpy as np
+
+from o3dgui.clock import FrameClock
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+def default_intrinsics(width=640, height=480):
+    """Pinhole intrinsics resembling a RealSense D4xx at ``width`` x ``height``
+
+    Returns:
+      :obj:`types.SimpleNamespace`: ``width``, ``height``, ``fx``, ``fy``,
+      ``ppx``, ``ppy`` like ``pyrealsense2.intrinsics``
+    """
+    focal = 0.95 * width
+    return SimpleNamespace(
+        width=width,
+        height=height,
+        fx=focal,
+        fy=focal,
+        ppx=(width - 1) / 2.0,
+        ppy=(height - 1) / 2.0,
+    )
+
+
+def synthetic_frames(
+    width=640,
+    height=480,
+    count=None,
+    depth_range=(500, 3000),
+    noise=0.0,
+    holes=0.0,
+    seed=0,
+):
+    """Generate moving color + depth test frames
+
+    The depth is a tilted plane with a bump that slides across the image, the
+    color a gradient that scrolls with it; both are cheap enough not to skew
+    throughput measurements. ``noise`` and ``holes`` make the depth look
+    more like a real sensor's, at the cost of a few milliseconds per frame.
+
+    Args:
+      width (int): frame width
+      height (int): frame height
+      count (int): number of frames, ``None`` for an endless stream
+      depth_range (Tuple[int, int]): near and far depth in depth units
+      noise (float): standard deviation of the depth noise, in depth units
+      holes (float): fraction of depth pixels randomly set to 0
+      seed (int): seed of the noise and holes
+
+    Yields:
+      dict: ``{"color": (H, W, 3) uint8, "depth": (H, W) uint16}``
+    """
+    near, far = depth_range
+    v, u = np.mgrid[0:height, 0:width].astype(np.float32)
+    plane = near + (far - near) * (v / max(height - 1, 1))
+    bump = np.exp(
+        -(((u - width / 2) / (width / 8)) ** 2 + ((v - height / 2) / (height / 8)) ** 2)
+    )
+    depth = (plane - 0.3 * (far - near) * bump).astype(np.uint16)
+    depth[: height // 20, : width // 20] = 0  # a hole, like real sensors have
+
+    color = np.empty((height, width, 3), dtype=np.uint8)
+    color[..., 0] = (255 * u / max(width - 1, 1)).astype(np.uint8)
+    color[..., 1] = (255 * v / max(height - 1, 1)).astype(np.uint8)
+    color[..., 2] = (255 * bump).astype(np.uint8)
+
+    rng = np.random.default_rng(seed)
+    index = 0
+    while count is None or index < count:
+        shift = (index * 4) % width
+        frame_depth = np.roll(depth, shift, axis=1)
+        if noise:
+            noisy = frame_depth + rng.normal(0.0, noise, frame_depth.shape)
+            noisy[frame_depth == 0] = 0
+            frame_depth = np.clip(np.rint(noisy), 0, 65535).astype(np.uint16)
+        if holes:
+            frame_depth[rng.random(frame_depth.shape) < holes] = 0
+        yield {
+            "color": np.roll(color, shift, axis=1),
+            "depth": frame_depth,
+        }
+        index += 1
+
+
+class ReplayCapture:
+    """Drop-in replacement for ``RealsenseCapture`` backed by recorded frames
+
+    Args:
+      source: a :class:`~o3dgui.rawformat.RawRecordingReader` (or any sequence
+          of ``{"color": ..., "depth": ...}`` dicts) or an iterator of such
+          dicts, e.g. :func:`synthetic_frames`
+      fps (float): replay rate; ``None`` replays as fast as possible
+      loop (bool): restart at the end of a sequence source
+      intrinsics: depth intrinsics reported by :attr:`intrinsics`; read from
+          the recording metadata when available
+    """
+
+    camera_is_open = False
+
+    def __init__(self, source, fps=None, loop=False, intrinsics=None):
+        self._source = source
+        self._is_sequence = hasattr(source, "__getitem__") and hasattr(
+            source, "__len__"
+        )
+        self._iterator = None if self._is_sequence else iter(source)
+        self._index = 0
+        self.loop = loop and self._is_sequence
+        self.frame_clock = FrameClock(fps) if fps else None
+        self.frames_read = 0
+
+        metadata = getattr(source, "metadata", {}) or {}
+        streams = getattr(source, "streams", {})
+        # Plain frame dicts carry both
+        self.streams = tuple(streams) or ("color", "depth")
+        if intrinsics is None and "intrinsics" in metadata:
+            intrinsics = SimpleNamespace(**metadata["intrinsics"])
+        elif intrinsics is None and "depth" in streams:
+            height, width = streams["depth"][0][:2]
+            intrinsics = default_intrinsics(width, height)
+        self.intrinsics = intrinsics
+        # Color camera and depth-to-color transform, when recorded; without
+        # them depth and color are taken as already aligned.
+        color_intrinsics = metadata.get("color_intrinsics")
+        self.color_intrinsics = (
+            SimpleNamespace(**color_intrinsics) if color_intrinsics else None
+        )
+        extrinsics = metadata.get("extrinsics")
+        self.extrinsics = SimpleNamespace(**extrinsics) if extrinsics else None
+        self.depth_scale = metadata.get("depth_scale", 0.001)
+        self.camera_is_open = True
+
+    def _next_frame(self):
+        if not self._is_sequence:
+            return next(self._iterator, None)
+        if self._index >= len(self._source):
+            if not self.loop or len(self._source) == 0:
+                return None
+            self._index = 0
+        frame = self._source[self._index]
+        self._index += 1
+        return frame
+
+    def read(self, image=None, return_depth=False):
+        """Read the next frame, paced at the configured rate
+
+        Args:
+          image (np.ndarray): optional buffer to write the color frame into
+          return_depth (bool): also return the depth frame
+
+        Returns:
+          Tuple: ``(ok, color)`` or ``(ok, color, depth)``; ``ok`` is ``False``
+          once the source is exhausted
+        """
+        if not self.camera_is_open:
+            return (False, None, None) if return_depth else (False, None)
+        if self.frame_clock is not None:
+            self.frame_clock.wait()
+
+        frame = self._next_frame()
+        if frame is None:
+            self.camera_is_open = False
+            return (False, None, None) if return_depth else (False, None)
+        self.frames_read += 1
+
+        color = frame.get("color")
+        if image is not None and color is not None and image.shape == color.shape:
+            np.copyto(image, color)
+            color = image
+        if return_depth:
+            return True, color, frame.get("depth")
+        return True, color
+
+    def grab(self):
+        """Skip one frame without pacing"""
+        if not self.camera_is_open:
+            return False
+        if self._next_frame() is None:
+            self.camera_is_open = False
+            return False
+        return True
+
+    def isOpened(self):
+        return self.camera_is_open
+
+    def release(self):
+        self.camera_is_open = False
+        close = getattr(self._source, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,192 @@
+"""
+Preallocated frame ring shared between a capture thread and the GUI thread.
+
+The capture thread fills slots in place and publishes them with a sequence
+number; the GUI only ever looks at the most recently published frame
+(latest-frame-wins). Frames that get replaced before the GUI reads them are
+counted as dropped instead of being queued up.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+class FrameRingBuffer:
+    """Fixed-size ring of preallocated frame slots
+
+    At least three slots are needed so the writer can always find a slot that
+    is neither the latest published frame nor the one being read.
+
+    Args:
+      shape (Tuple[int, ...]): shape of one frame
+      dtype: NumPy dtype of one frame
+      slots (int): number of preallocated slots, defaults to 3
+    """
+
+    def __init__(self, shape, dtype=np.uint8, slots=3):
+        if slots < 3:
+            raise ValueError("FrameRingBuffer needs at least 3 slots")
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._frames = np.zeros((slots,) + self.shape, dtype=self.dtype)
+        self._seqs = [0] * slots
+        self._lock = threading.Lock()
+        self._latest = None
+        self._writing = None
+        self._reading = set()
+        self._next = 0
+        self._seq = 0
+        self._last_read_seq = 0
+
+        self.frames_written = 0
+        self.frames_read = 0
+        self.frames_dropped = 0
+
+    @property
+    def slots(self):
+        return len(self._frames)
+
+    @property
+    def sequence(self):
+        """Sequence number of the latest published frame (0 before any)"""
+        return self._seq
+
+    def has_unread(self):
+        """Whether a published frame is waiting for the reader"""
+        with self._lock:
+            return self._seq > self._last_read_seq
+
+    def acquire(self):
+        """Borrow the next free slot for in-place writing
+
+        Returns:
+          Tuple[int, np.ndarray]: slot index and the slot array to fill; pass
+          the index to :meth:`publish` or :meth:`abort` afterwards
+        """
+        with self._lock:
+            if self._writing is not None:
+                raise RuntimeError("FrameRingBuffer supports a single writer")
+            for _ in range(self.slots):
+                slot = self._next
+                self._next = (self._next + 1) % self.slots
+                if slot != self._latest and slot not in self._reading:
+                    self._writing = slot
+                    return slot, self._frames[slot]
+        raise RuntimeError("No free slot in FrameRingBuffer")  # pragma: no cover
+
+    def abort(self, slot):
+        """Give back a slot from :meth:`acquire` without publishing it"""
+        with self._lock:
+            if slot == self._writing:
+                self._writing = None
+
+    def publish(self, slot):
+        """Publish a slot filled after :meth:`acquire`
+
+        Args:
+          slot (int): slot index returned by :meth:`acquire`
+
+        Returns:
+          bool: ``True`` if the reader had caught up and needs a wake-up. At
+          most one wake-up is outstanding at any time, so callers can post a
+          GUI update only when this is ``True``.
+        """
+        with self._lock:
+            if slot != self._writing:
+                raise RuntimeError(f"Slot {slot} was not acquired for writing")
+            self._writing = None
+            idle = self._seq == self._last_read_seq
+            if not idle:
+                # The previous frame was never read and is replaced now.
+                self.frames_dropped += 1
+            self._seq += 1
+            self._seqs[slot] = self._seq
+            self._latest = slot
+            self.frames_written += 1
+            return idle
+
+    def write(self, frame):
+        """Copy ``frame`` into the next slot and publish it
+
+        Args:
+          frame (np.ndarray): frame of the ring's shape
+
+        Returns:
+          bool: ``True`` if the reader needs a wake-up, see :meth:`publish`
+        """
+        slot, buffer = self.acquire()
+        try:
+            np.copyto(buffer, frame)
+        except BaseException:
+            self.abort(slot)
+            raise
+        return self.publish(slot)
+
+    @contextmanager
+    def read_latest(self):
+        """Borrow the latest unread frame
+
+        The writer will not touch the slot while the ``with`` block runs.
+
+        Yields:
+          Tuple[int, np.ndarray]: sequence number and frame, or ``(seq, None)``
+          when nothing new has been published since the last read
+        """
+        with self._lock:
+            slot = self._latest
+            if slot is None or self._seqs[slot] <= self._last_read_seq:
+                slot = None
+                seq = self._last_read_seq
+            else:
+                seq = self._seqs[slot]
+                self._last_read_seq = seq
+                self._reading.add(slot)
+                self.frames_read += 1
+        if slot is None:
+            yield seq, None
+            return
+        try:
+            yield seq, self._frames[slot]
+        finally:
+            with self._lock:
+                self._reading.discard(slot)
+
+    def copy_latest(self, out=None):
+        """Copy the latest unread frame out of the ring
+
+        Args:
+          out (np.ndarray): optional destination buffer
+
+        Returns:
+          Tuple[int, np.ndarray]: sequence number and frame (``None`` if there
+          is nothing new)
+        """
+        with self.read_latest() as (seq, frame):
+            if frame is None:
+                return seq, None
+            if out is None:
+                return seq, frame.copy()
+            np.copyto(out, frame)
+            return seq, out
+
+    def stats(self):
+        """Counters of the ring
+
+        Returns:
+          dict: ``written``, ``read`` and ``dropped`` frame counts
+        """
+        with self._lock:
+            return {
+                "written": self.frames_written,
+                "read": self.frames_read,
+                "dropped": self.frames_dropped,
+            }
@@ -0,0 +1,146 @@
+"""
+Region of interest applied to depth frames before back-projection.
+
+A :class:`RegionOfInterest` combines a pixel window, a pixel step and a 3D
+box in camera coordinates. :meth:`RegionOfInterest.bind` turns it into row
+and column slices for one camera, tightening the window to where the box can
+appear in the image, and returns the intrinsics of the cropped grid. Frames
+are then cropped with :meth:`RegionOfInterest.crop`, which is a strided view,
+so everything downstream (filters, alignment, projection) only touches the
+pixels of the region. The box itself is enforced per point by
+:class:`~o3dgui.pointcloud.DepthProjector` through ``bounds``.
+"""
+
+import logging
+import math
+from types import SimpleNamespace
+
+import numpy as np
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+def parse_window(text):
+    """``"x,y,width,height"`` to a tuple of ints"""
+    values = tuple(int(v) for v in text.split(","))
+    if len(values) != 4:
+        raise ValueError(f"Expected x,y,width,height, got {text!r}")
+    return values
+
+
+def parse_box(text):
+    """``"xmin,ymin,zmin,xmax,ymax,zmax"`` (meters) to a (2, 3) array"""
+    values = [float(v) for v in text.split(",")]
+    if len(values) != 6:
+        raise ValueError(f"Expected xmin,ymin,zmin,xmax,ymax,zmax, got {text!r}")
+    return np.array(values).reshape(2, 3)
+
+
+class RegionOfInterest:
+    """Pixel window, pixel step and 3D box of the depth worth processing
+
+    Args:
+      window (Tuple[int, int, int, int]): ``(x, y, width, height)`` in
+          pixels, ``None`` for the whole frame
+      box (np.ndarray): ``[[xmin, ymin, zmin], [xmax, ymax, zmax]]`` in
+          meters, in the depth camera frame; ``None`` for no box
+      step (Union[int, Tuple[int, int]]): keep every ``step``-th pixel, or
+          ``(step_x, step_y)``
+    """
+
+    def __init__(self, window=None, box=None, step=1):
+        self.window = None if window is None else tuple(int(v) for v in window)
+        self.box = (
+            None if box is None else np.asarray(box, dtype=np.float64).reshape(2, 3)
+        )
+        if self.box is not None and (self.box[0] > self.box[1]).any():
+            raise ValueError(
+                f"Box minimum {self.box[0]} exceeds its maximum {self.box[1]}"
+            )
+        self.step_x, self.step_y = (step, step) if np.isscalar(step) else step
+        if self.step_x < 1 or self.step_y < 1:
+            raise ValueError(f"Pixel step must be at least 1, got {step}")
+        self.rows = self.cols = None
+
+    @property
+    def bounds(self):
+        """Box as ``(min, max)`` float32 arrays for the projector, or ``None``"""
+        if self.box is None:
+            return None
+        return self.box.astype(np.float32)
+
+    def pixel_window(self, intrinsics):
+        """Pixel range ``(x0, y0, x1, y1)`` covering both the window and the
+        image of the box, clipped to the frame"""
+        x0, y0, x1, y1 = 0, 0, intrinsics.width, intrinsics.height
+        if self.window is not None:
+            x, y, width, height = self.window
+            x0, y0, x1, y1 = (
+                max(x0, x),
+                max(y0, y),
+                min(x1, x + width),
+                min(y1, y + height),
+            )
+        if self.box is not None and self.box[0, 2] > 0:
+            # u = fx * x / z + ppx is monotonic in x and 1/z: corners bound it
+            corners = np.array(
+                [
+                    [x, y, z]
+                    for x in self.box[:, 0]
+                    for y in self.box[:, 1]
+                    for z in self.box[:, 2]
+                ]
+            )
+            u = intrinsics.fx * corners[:, 0] / corners[:, 2] + intrinsics.ppx
+            v = intrinsics.fy * corners[:, 1] / corners[:, 2] + intrinsics.ppy
+            x0, x1 = max(x0, math.floor(u.min())), min(x1, math.ceil(u.max()) + 1)
+            y0, y1 = max(y0, math.floor(v.min())), min(y1, math.ceil(v.max()) + 1)
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError("Region of interest is outside the frame")
+        return x0, y0, x1, y1
+
+    def bind(self, intrinsics):
+        """Fix the crop for a camera
+
+        Args:
+          intrinsics: full-frame depth intrinsics (``width``, ``height``,
+              ``fx``, ``fy``, ``ppx``, ``ppy``)
+
+        Returns:
+          SimpleNamespace: intrinsics of the cropped frames
+        """
+        x0, y0, x1, y1 = self.pixel_window(intrinsics)
+        self.cols = slice(x0, x1, self.step_x)
+        self.rows = slice(y0, y1, self.step_y)
+        cropped = SimpleNamespace(
+            width=len(range(x0, x1, self.step_x)),
+            height=len(range(y0, y1, self.step_y)),
+            fx=intrinsics.fx / self.step_x,
+            fy=intrinsics.fy / self.step_y,
+            ppx=(intrinsics.ppx - x0) / self.step_x,
+            ppy=(intrinsics.ppy - y0) / self.step_y,
+        )
+        _logger.info(
+            "ROI: pixels [%d:%d:%d, %d:%d:%d], %dx%d of %dx%d",
+            y0,
+            y1,
+            self.step_y,
+            x0,
+            x1,
+            self.step_x,
+            cropped.width,
+            cropped.height,
+            intrinsics.width,
+            intrinsics.height,
+        )
+        return cropped
+
+    def crop(self, image):
+        """Strided view of a depth or registered image, no copy"""
+        if self.rows is None:
+            raise RuntimeError("RegionOfInterest.bind() must be called first")
+        return image[self.rows, self.cols]
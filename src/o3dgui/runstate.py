@@ -0,0 +1,81 @@
+"""
+Run/pause/stop state shared between a worker loop and its controller.
+
+A paused worker sleeps on a condition variable instead of spinning, and is
+woken up as soon as the controller resumes or stops it.
+"""
+
+import logging
+import threading
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+RUNNING = "running"
+PAUSED = "paused"
+STOPPED = "stopped"
+
+
+class RunState:
+    """Thread-safe running / paused / stopped state
+
+    Args:
+      state (str): initial state, defaults to :data:`RUNNING`
+    """
+
+    def __init__(self, state=RUNNING):
+        if state not in (RUNNING, PAUSED, STOPPED):
+            raise ValueError(f"Unknown state: {state}")
+        self._state = state
+        self._cond = threading.Condition()
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def is_paused(self):
+        return self._state == PAUSED
+
+    @property
+    def is_stopped(self):
+        return self._state == STOPPED
+
+    def _set(self, state):
+        with self._cond:
+            if self._state == STOPPED or self._state == state:
+                return
+            self._state = state
+            self._cond.notify_all()
+
+    def pause(self):
+        """Ask the worker to pause (no effect once stopped)"""
+        self._set(PAUSED)
+
+    def resume(self):
+        """Wake a paused worker up (no effect once stopped)"""
+        self._set(RUNNING)
+
+    def stop(self):
+        """Stop the worker for good; wakes it up if it is paused"""
+        with self._cond:
+            self._state = STOPPED
+            self._cond.notify_all()
+
+    def wait_until_running(self, timeout=None):
+        """Block while paused
+
+        Args:
+          timeout (float): give up after this many seconds, ``None`` waits
+              until the state changes
+
+        Returns:
+          bool: ``True`` if running, ``False`` if stopped or still paused
+          after ``timeout``
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._state != PAUSED, timeout)
+            return self._state == RUNNING
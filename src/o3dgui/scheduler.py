@@ -0,0 +1,95 @@
+"""
+Coalescing scheduler for GUI updates posted from worker threads.
+
+Each widget gets at most one pending update on the GUI thread. Submitting
+again while an update is still pending only replaces its payload, so the GUI
+queue cannot grow when rendering falls behind the producers.
+"""
+
+import logging
+import threading
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+class UpdateScheduler:
+    """At most one pending GUI update per key
+
+    Args:
+      post (Callable[[Callable[[], None]], None]): posts a callable to the GUI
+          thread, e.g. ``lambda fn: gui.Application.instance.post_to_main_thread(
+          window, fn)``
+    """
+
+    def __init__(self, post):
+        self._post = post
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._counters = {}
+
+    def _counter(self, key):
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters[key] = {"posted": 0, "merged": 0, "run": 0}
+        return counter
+
+    def submit(self, key, func, data=None):
+        """Schedule ``func(data)`` on the GUI thread
+
+        If an update for ``key`` is already pending, it is not posted again;
+        the pending update will run the newest ``func`` with the newest
+        ``data`` instead.
+
+        Args:
+          key (str): widget the update belongs to
+          func (Callable[[object], None]): update to run on the GUI thread
+          data (object): payload handed to ``func``
+
+        Returns:
+          bool: ``True`` if a new update was posted, ``False`` if it was merged
+        """
+        with self._lock:
+            counter = self._counter(key)
+            merged = key in self._pending
+            self._pending[key] = (func, data)
+            if merged:
+                counter["merged"] += 1
+                return False
+            counter["posted"] += 1
+
+        self._post(lambda: self._run(key))
+        return True
+
+    def _run(self, key):
+        with self._lock:
+            func, data = self._pending.pop(key)
+            self._counter(key)["run"] += 1
+        func(data)
+
+    def pending(self):
+        """Keys with an update waiting on the GUI thread
+
+        Returns:
+          List[str]: pending keys
+        """
+        with self._lock:
+            return list(self._pending)
+
+    @property
+    def merged(self):
+        """Total number of updates merged into a pending one"""
+        with self._lock:
+            return sum(counter["merged"] for counter in self._counters.values())
+
+    def stats(self):
+        """Per-key counters
+
+        Returns:
+          dict: ``{key: {"posted": int, "merged": int, "run": int}}``
+        """
+        with self._lock:
+            return {key: dict(counter) for key, counter in self._counters.items()}
@@ -0,0 +1,219 @@
+"""
+Latest-frame-wins ring of multi-stream frames in shared memory.
+
+:class:`SharedFrameRing` is the cross-process counterpart of
+:class:`~o3dgui.ringbuffer.FrameRingBuffer`: one writer process and one
+reader process exchange frames made of several named arrays ("color",
+"depth", "points", ...) through a ``multiprocessing.shared_memory`` block,
+without pickling or copying them through a pipe. Slot bookkeeping lives in
+a small int64 header in the same block and is guarded by a
+``multiprocessing.Lock``; a ``multiprocessing.Event`` wakes up the reader.
+
+Both sides build the ring from the same stream spec, so the layout is
+computed identically; the creating side owns the block and unlinks it.
+"""
+
+import contextlib
+import logging
+from multiprocessing import shared_memory
+
+import numpy as np
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+ALIGN = 64
+
+# Header fields (int64)
+_SEQUENCE, _LATEST, _READING, _WRITING, _WRITTEN, _DROPPED, _LAST_READ, _READ = range(8)
+_FIELDS = 8
+
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def layout(streams, slots):
+    """Byte offsets of the header and of every (slot, stream) array
+
+    Args:
+      streams (Dict[str, Tuple[tuple, str]]): ``name -> (shape, dtype)``
+      slots (int): number of slots
+
+    Returns:
+      Tuple[int, dict]: total size and ``{(slot, name): offset}``
+    """
+    offset = _aligned((_FIELDS + 2 * slots) * 8)
+    offsets = {}
+    for slot in range(slots):
+        for name, (shape, dtype) in streams.items():
+            offsets[slot, name] = offset
+            offset = _aligned(offset + int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    return offset, offsets
+
+
+class SharedFrameRing:
+    """Triple buffer of multi-stream frames shared between processes
+
+    Use :meth:`create` in one process and :meth:`attach` in the other.
+
+    Args:
+      shm (shared_memory.SharedMemory): the backing block
+      streams (Dict[str, Tuple[tuple, str]]): ``name -> (shape, dtype)``
+      lock (multiprocessing.Lock): guards the header
+      event (multiprocessing.Event): set when a frame is published
+      slots (int): at least 3, so the writer never waits for the reader
+      owner (bool): unlink the block on :meth:`close`
+    """
+
+    def __init__(self, shm, streams, lock, event, slots=3, owner=False):
+        if slots < 3:
+            raise ValueError("A shared ring needs at least 3 slots")
+        self.streams = {
+            name: (tuple(shape), np.dtype(dtype).str)
+            for name, (shape, dtype) in streams.items()
+        }
+        self.slots = slots
+        self._shm = shm
+        self._lock = lock
+        self._event = event
+        self._owner = owner
+        size, offsets = layout(self.streams, slots)
+        if shm.size < size:
+            raise ValueError(
+                f"Shared block of {shm.size} bytes is smaller than the ring ({size})"
+            )
+        self._header = np.ndarray(
+            (_FIELDS + 2 * slots,), dtype=np.int64, buffer=shm.buf
+        )
+        self._slot_sequence = self._header[_FIELDS : _FIELDS + slots]
+        self._slot_meta = self._header[_FIELDS + slots :]
+        self._views = [
+            {
+                name: np.ndarray(
+                    shape, dtype=dtype, buffer=shm.buf, offset=offsets[slot, name]
+                )
+                for name, (shape, dtype) in self.streams.items()
+            }
+            for slot in range(slots)
+        ]
+
+    @classmethod
+    def create(cls, streams, lock, event, slots=3):
+        size, _ = layout(streams, slots)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        ring = cls(shm, streams, lock, event, slots, owner=True)
+        ring._header[:] = 0
+        ring._header[[_LATEST, _READING, _WRITING]] = -1
+        return ring
+
+    @classmethod
+    def attach(cls, name, streams, lock, event, slots=3):
+        return cls(shared_memory.SharedMemory(name=name), streams, lock, event, slots)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def spec(self):
+        """Arguments for :meth:`attach` in another process, minus lock/event"""
+        return {"name": self.name, "streams": self.streams, "slots": self.slots}
+
+    # Writer side
+    def acquire(self):
+        """Reserve a slot to write into
+
+        Returns:
+          Tuple[int, Dict[str, np.ndarray]]: slot and its stream arrays
+        """
+        with self._lock:
+            busy = {int(self._header[_LATEST]), int(self._header[_READING])}
+            slot = next(i for i in range(self.slots) if i not in busy)
+            self._header[_WRITING] = slot
+        return slot, self._views[slot]
+
+    def publish(self, slot, meta=0):
+        """Make ``slot`` the latest frame; ``meta`` is an int stored with it"""
+        with self._lock:
+            latest = int(self._header[_LATEST])
+            if latest >= 0 and self._slot_sequence[latest] > self._header[_LAST_READ]:
+                self._header[_DROPPED] += 1
+            self._header[_SEQUENCE] += 1
+            self._slot_sequence[slot] = self._header[_SEQUENCE]
+            self._slot_meta[slot] = meta
+            self._header[_LATEST] = slot
+            self._header[_WRITING] = -1
+            self._header[_WRITTEN] += 1
+        self._event.set()
+
+    # Reader side
+    def has_unread(self):
+        with self._lock:
+            latest = int(self._header[_LATEST])
+            return (
+                latest >= 0 and self._slot_sequence[latest] > self._header[_LAST_READ]
+            )
+
+    def wait(self, timeout=None):
+        """Wait until an unread frame is available
+
+        Returns:
+          bool: whether there is an unread frame
+        """
+        if self.has_unread():
+            return True
+        self._event.wait(timeout)
+        self._event.clear()
+        return self.has_unread()
+
+    @contextlib.contextmanager
+    def read_latest(self):
+        """Hold the latest unread frame while the block runs
+
+        Yields:
+          Tuple[int, Dict[str, np.ndarray], int]: sequence, stream arrays
+          (``None`` when nothing new was published) and meta
+        """
+        with self._lock:
+            latest = int(self._header[_LATEST])
+            if latest < 0 or self._slot_sequence[latest] <= self._header[_LAST_READ]:
+                sequence = int(self._header[_LAST_READ])
+                latest = -1
+            else:
+                sequence = int(self._slot_sequence[latest])
+                self._header[_READING] = latest
+                self._header[_LAST_READ] = sequence
+                self._header[_READ] += 1
+        if latest < 0:
+            yield sequence, None, 0
+            return
+        try:
+            yield sequence, self._views[latest], int(self._slot_meta[latest])
+        finally:
+            with self._lock:
+                self._header[_READING] = -1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "written": int(self._header[_WRITTEN]),
+                "read": int(self._header[_READ]),
+                "dropped": int(self._header[_DROPPED]),
+            }
+
+    def close(self):
+        """Unmap the block; the creating side also unlinks it"""
+        self._views = []
+        self._header = self._slot_sequence = self._slot_meta = None
+        try:
+            self._shm.close()
+        except BufferError:
+            _logger.warning(
+                "Shared frame ring %s still has views in use", self._shm.name
+            )
+        if self._owner:
+            self._shm.unlink()
+            self._owner = False
@@ -0,0 +1,409 @@
+"""
+Offscreen snapshots of a point-cloud scene.
+
+:class:`SnapshotRenderer` keeps its own scene, loaded once, and renders any
+number of camera poses to images at a chosen resolution without opening a
+window. Inside a running ``gui.Application`` it renders through the window's
+renderer; on its own it uses ``rendering.OffscreenRenderer``, which runs
+headless and, with ``OPEN3D_CPU_RENDERING=true`` set before Open3D is
+imported, on the CPU (Mesa llvmpipe) where there is no GPU.
+
+:class:`ImageWriter` encodes the rendered images to disk on a thread pool, so
+rendering the next pose overlaps with compressing the previous ones::
+
+    python -m o3dgui.snapshot cloud.ply --orbit 36 -r 1920x1080 -o shots/
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import logging
+import math
+import os
+import struct
+import sys
+import threading
+import zlib
+
+import numpy as np
+
+from o3dgui import __version__
+from o3dgui.cloudio import CloudFile, is_mappable
+from o3dgui.geometry import IncrementalPointCloud
+
+try:
+    import cv2
+except ImportError:  # pragma: no cover
+    cv2 = None
+
+try:
+    import open3d as o3d
+    import open3d.visualization.gui as gui
+    import open3d.visualization.rendering as rendering
+except ImportError:  # pragma: no cover
+    o3d = None
+    gui = None
+    rendering = None
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+Pose = collections.namedtuple(
+    "Pose", "center eye up fov", defaults=((0.0, -1.0, 0.0), 60.0)
+)
+Pose.__doc__ = (
+    "Camera looking from ``eye`` at ``center``; "
+    "``fov`` is the vertical field of view in degrees"
+)
+
+
+def orbit_poses(center, radius, count, elevation=20.0, up=(0.0, -1.0, 0.0), fov=60.0):
+    """``count`` poses evenly spaced on a circle around ``center``
+
+    Args:
+      center (np.ndarray): point looked at
+      radius (float): distance of the camera from ``center``
+      count (int): number of poses
+      elevation (float): angle above the plane normal to ``up``, in degrees
+      up (np.ndarray): up direction
+      fov (float): vertical field of view, in degrees
+
+    Returns:
+      List[Pose]: the poses, starting on the side of ``-z`` (or ``-x`` when
+      ``up`` is along z)
+    """
+    center = np.asarray(center, dtype=np.float64)
+    up = np.asarray(up, dtype=np.float64)
+    up = up / np.linalg.norm(up)
+    start = (
+        np.array([0.0, 0.0, -1.0]) if abs(up[2]) < 0.9 else np.array([-1.0, 0.0, 0.0])
+    )
+    first = start - up * (start @ up)
+    first /= np.linalg.norm(first)
+    second = np.cross(up, first)
+
+    lift = math.radians(elevation)
+    poses = []
+    for i in range(count):
+        angle = 2.0 * math.pi * i / count
+        direction = (
+            math.cos(lift) * (math.cos(angle) * first + math.sin(angle) * second)
+            + math.sin(lift) * up
+        )
+        poses.append(Pose(center, center + radius * direction, up, fov))
+    return poses
+
+
+def clip_range(center, extent, eye):
+    """Near and far planes enclosing a box seen from ``eye``
+
+    Args:
+      center (np.ndarray): box center
+      extent (np.ndarray): box size along each axis
+      eye (np.ndarray): camera position
+
+    Returns:
+      Tuple[float, float]: near and far distance
+    """
+    radius = 0.5 * float(np.linalg.norm(extent))
+    distance = float(np.linalg.norm(np.asarray(eye, dtype=np.float64) - center))
+    far = max(distance + radius, 1e-3)
+    return max(distance - radius, far * 1e-4), far
+
+
+def pose_from_camera(camera, center):
+    """Pose of a ``rendering.Camera``, looking at the depth of ``center``"""
+    model = np.asarray(camera.get_model_matrix(), dtype=np.float64)
+    eye, up, forward = model[:3, 3], model[:3, 1], -model[:3, 2]
+    distance = max(float((np.asarray(center) - eye) @ forward), 1e-3)
+    return Pose(eye + distance * forward, eye, up, camera.get_field_of_view())
+
+
+def encode_png(image, level=6):
+    """PNG bytes of an 8-bit grayscale, RGB or RGBA image
+
+    Args:
+      image (np.ndarray): (H, W), (H, W, 3) or (H, W, 4) uint8 image
+      level (int): zlib compression level
+
+    Returns:
+      bytes: the PNG file
+    """
+    image = np.asarray(image)
+    if image.dtype != np.uint8:
+        raise ValueError(f"Only 8-bit images are supported, got {image.dtype}")
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    color_type = {1: 0, 3: 2, 4: 6}.get(channels)
+    if color_type is None:
+        raise ValueError(f"Cannot encode an image of shape {image.shape}")
+    height, width = image.shape[:2]
+    # Every row starts with its filter type, 0 (none)
+    rows = np.zeros((height, 1 + width * channels), np.uint8)
+    rows[:, 1:] = image.reshape(height, -1)
+
+    def chunk(kind, data):
+        return (
+            struct.pack(">I", len(data))
+            + kind
+            + data
+            + struct.pack(">I", zlib.crc32(kind + data))
+        )
+
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    return b"".join(
+        (
+            b"\x89PNG\r\n\x1a\n",
+            chunk(b"IHDR", header),
+            chunk(b"IDAT", zlib.compress(rows.tobytes(), level)),
+            chunk(b"IEND", b""),
+        )
+    )
+
+
+def write_image(path, image, level=6):
+    """Write an RGB(A) or grayscale image; the format follows the extension
+
+    OpenCV handles every format it knows when it is installed; otherwise
+    ``.png`` uses :func:`encode_png`. ``.npy`` stores the raw array.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        np.save(path, image)
+    elif cv2 is not None:
+        if image.ndim == 3:
+            image = cv2.cvtColor(
+                image, cv2.COLOR_RGBA2BGRA if image.shape[2] == 4 else cv2.COLOR_RGB2BGR
+            )
+        if not cv2.imwrite(path, image, [cv2.IMWRITE_PNG_COMPRESSION, min(level, 9)]):
+            raise OSError(f"Cannot write {path}")
+    elif extension == ".png":
+        with open(path, "wb") as file:
+            file.write(encode_png(image, level))
+    else:
+        raise ValueError(f"Writing {extension} images needs OpenCV")
+    return path
+
+
+class ImageWriter:
+    """Encodes and writes images on a thread pool
+
+    zlib and OpenCV release the GIL while compressing, so the caller keeps
+    rendering while earlier images are written. :meth:`submit` blocks once
+    ``max_pending`` images are waiting, which bounds the memory held by
+    rendered but unwritten images.
+
+    Args:
+      workers (int): encoder threads
+      max_pending (int): images queued or being written, default
+          ``2 * workers``
+      level (int): compression level
+    """
+
+    def __init__(self, workers=None, max_pending=None, level=6):
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.level = level
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * self.workers)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            self.workers, thread_name_prefix="ImageWriter"
+        )
+
+    def submit(self, path, image):
+        """Queue ``image`` for writing to ``path``
+
+        Returns:
+          concurrent.futures.Future: resolves to ``path``
+        """
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(write_image, path, image, self.level)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def close(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SnapshotRenderer:
+    """Renders camera poses of a scene loaded once
+
+    Args:
+      width (int): image width
+      height (int): image height
+      window (gui.Window): render through this window's renderer (GUI thread
+          only); ``None`` for a headless ``OffscreenRenderer``
+      background (Tuple[float, float, float, float]): RGBA background
+    """
+
+    def __init__(self, width, height, window=None, background=(1.0, 1.0, 1.0, 1.0)):
+        if o3d is None:
+            raise ImportError("open3d is required to render snapshots")
+        self.width, self.height = int(width), int(height)
+        if window is None:
+            self._offscreen = rendering.OffscreenRenderer(self.width, self.height)
+            self.scene = self._offscreen.scene
+        else:
+            self._offscreen = None
+            self.scene = rendering.Open3DScene(window.renderer)
+        self.scene.set_background(np.asarray(background, dtype=np.float32))
+        self.cloud = None
+
+    def set_points(self, points, colors=None):
+        """Load or update the point cloud, in place when it fits"""
+        if self.cloud is None or len(points) > self.cloud.capacity:
+            if self.cloud is not None:
+                self.scene.remove_geometry(self.cloud.name)
+            self.cloud = IncrementalPointCloud(len(points), "snapshot")
+            self.cloud.set(points, colors)
+            self.cloud.add_to(self.scene)
+        else:
+            self.cloud.set(points, colors)
+            self.cloud.push(self.scene)
+
+    def _setup_camera(self, pose):
+        bounds = self.scene.bounding_box
+        near, far = clip_range(bounds.get_center(), bounds.get_extent(), pose.eye)
+        camera = self.scene.camera
+        camera.set_projection(
+            pose.fov,
+            self.width / self.height,
+            near,
+            far,
+            rendering.Camera.FovType.Vertical,
+        )
+        camera.look_at(
+            np.asarray(pose.center, dtype=np.float32),
+            np.asarray(pose.eye, dtype=np.float32),
+            np.asarray(pose.up, dtype=np.float32),
+        )
+
+    def render(self, pose):
+        """Render one pose
+
+        Returns:
+          np.ndarray: (H, W, 3) uint8 RGB image
+        """
+        self._setup_camera(pose)
+        if self._offscreen is not None:
+            image = self._offscreen.render_to_image()
+        else:
+            image = gui.Application.instance.render_to_image(
+                self.scene, self.width, self.height
+            )
+        return np.asarray(image)
+
+    def render_batch(self, poses, paths, writer):
+        """Render ``poses`` one after the other and write them to ``paths``
+
+        Returns:
+          List[concurrent.futures.Future]: one per image, see
+          :meth:`ImageWriter.submit`
+        """
+        return [
+            writer.submit(path, self.render(pose)) for pose, path in zip(poses, paths)
+        ]
+
+
+# ---- CLI ----
+
+
+def _read_points(path):
+    if is_mappable(path):
+        cloud = CloudFile(path)
+        colors = cloud.colors
+        if colors is not None:
+            colors = colors.astype(np.float32) * np.float32(1.0 / 255.0)
+        return np.asarray(cloud.xyz, dtype=np.float32), colors
+    cloud = o3d.io.read_point_cloud(path)
+    colors = np.asarray(cloud.colors, dtype=np.float32) if cloud.has_colors() else None
+    return np.asarray(cloud.points, dtype=np.float32), colors
+
+
+def parse_args(args):
+    """Parse command line parameters
+
+    Args:
+      args (List[str]): command line parameters as list of strings
+
+    Returns:
+      :obj:`argparse.Namespace`: command line parameters namespace
+    """
+    parser = argparse.ArgumentParser(
+        description="Render snapshots of a point cloud without a window"
+    )
+    parser.add_argument("--version", action="version", version=f"O3dGui {__version__}")
+    parser.add_argument("cloud", help="point cloud file")
+    parser.add_argument("-o", "--output", default=".", help="output directory")
+    parser.add_argument(
+        "-r", "--resolution", default="1920x1080", help="image size, WxH"
+    )
+    parser.add_argument(
+        "-n", "--orbit", type=int, default=8, help="number of poses around the cloud"
+    )
+    parser.add_argument(
+        "--elevation", type=float, default=20.0, help="camera elevation, degrees"
+    )
+    parser.add_argument(
+        "--fov", type=float, default=60.0, help="vertical field of view, degrees"
+    )
+    parser.add_argument("--format", default="png", help="image file extension")
+    parser.add_argument("-j", "--workers", type=int, help="encoder threads")
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        dest="loglevel",
+        help="set loglevel to INFO",
+        action="store_const",
+        const=logging.INFO,
+    )
+    return parser.parse_args(args)
+
+
+def main(args):
+    """Render an orbit around a cloud file and write one image per pose
+
+    Args:
+      args (List[str]): command line parameters as list of strings
+    """
+    args = parse_args(args)
+    logging.basicConfig(level=args.loglevel or logging.WARNING, stream=sys.stderr)
+    width, height = (int(value) for value in args.resolution.lower().split("x"))
+    points, colors = _read_points(args.cloud)
+    low, high = points.min(axis=0).astype(np.float64), points.max(axis=0).astype(
+        np.float64
+    )
+    center = (low + high) / 2
+    # Far enough for the bounding sphere to fit the vertical field of view
+    radius = 0.5 * np.linalg.norm(high - low) / math.sin(math.radians(args.fov) / 2)
+
+    os.makedirs(args.output, exist_ok=True)
+    poses = orbit_poses(center, radius, args.orbit, args.elevation, fov=args.fov)
+    paths = [
+        os.path.join(args.output, f"snapshot_{i:04d}.{args.format}")
+        for i in range(len(poses))
+    ]
+    renderer = SnapshotRenderer(width, height)
+    renderer.set_points(points, colors)
+    with ImageWriter(args.workers) as writer:
+        for future in renderer.render_batch(poses, paths, writer):
+            _logger.info("Wrote %s", future.result())
+
+
+def run():
+    """Calls :func:`main` passing the CLI arguments extracted from :obj:`sys.argv`"""
+    main(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    run()
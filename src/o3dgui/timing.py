@@ -0,0 +1,162 @@
+"""
+Lightweight per-stage latency instrumentation.
+
+Each stage keeps its most recent samples in a fixed ring (no allocation and no
+lock on the hot path); percentiles and rates are only computed when somebody
+asks for them, e.g. to refresh a status-bar overlay.
+"""
+
+import logging
+import time
+
+import numpy as np
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+_clock_ns = time.perf_counter_ns
+
+
+class _Measurement:
+    __slots__ = ("_timer", "_start")
+
+    def __init__(self, timer):
+        self._timer = timer
+
+    def __enter__(self):
+        self._start = _clock_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self._timer.record(_clock_ns() - self._start)
+
+
+class StageTimer:
+    """Ring-buffered latency samples of one pipeline stage
+
+    Args:
+      name (str): stage name
+      size (int): number of recent samples kept
+    """
+
+    def __init__(self, name, size=512):
+        self.name = name
+        self._durations = np.zeros(size, dtype=np.int64)
+        self._ends = np.zeros(size, dtype=np.int64)
+        self.count = 0
+        self._measurement = _Measurement(self)
+
+    def record(self, duration_ns, end_ns=None):
+        """Add one sample
+
+        Args:
+          duration_ns (int): stage latency in nanoseconds
+          end_ns (int): when the stage finished, defaults to now
+        """
+        i = self.count % len(self._durations)
+        self._durations[i] = duration_ns
+        self._ends[i] = _clock_ns() if end_ns is None else end_ns
+        self.count += 1
+
+    def start(self):
+        """Start a measurement; pass the result to :meth:`stop`"""
+        return _clock_ns()
+
+    def stop(self, start_ns):
+        end = _clock_ns()
+        self.record(end - start_ns, end)
+
+    def measure(self):
+        """Context manager timing its block
+
+        The returned object is reused, so measurements of one stage must not
+        be nested or run concurrently.
+        """
+        return self._measurement
+
+    def samples(self):
+        """Recent latencies in milliseconds, oldest first"""
+        n = min(self.count, len(self._durations))
+        i = self.count % len(self._durations)
+        if n < len(self._durations):
+            durations = self._durations[:n]
+        else:
+            durations = np.roll(self._durations, -i)
+        return durations / 1e6
+
+    def fps(self):
+        """Completed stages per second over the recent samples"""
+        n = min(self.count, len(self._ends))
+        if n < 2:
+            return 0.0
+        ends = self._ends[:n] if n < len(self._ends) else self._ends
+        span = ends.max() - ends.min()
+        return (n - 1) * 1e9 / span if span > 0 else 0.0
+
+    def summary(self):
+        """Latency summary
+
+        Returns:
+          dict: ``count``, ``p50_ms``, ``p95_ms``, ``p99_ms`` and ``fps``
+        """
+        samples = self.samples()
+        if len(samples) == 0:
+            p50 = p95 = p99 = 0.0
+        else:
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        return {
+            "count": self.count,
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "fps": self.fps(),
+        }
+
+
+class LatencyMonitor:
+    """Collection of :class:`StageTimer` objects, created on first use
+
+    Args:
+      size (int): samples kept per stage
+    """
+
+    def __init__(self, size=512):
+        self.size = size
+        self._stages = {}
+
+    def stage(self, name):
+        """Timer of stage ``name``"""
+        timer = self._stages.get(name)
+        if timer is None:
+            timer = self._stages.setdefault(name, StageTimer(name, self.size))
+        return timer
+
+    def measure(self, name):
+        """Shortcut for ``stage(name).measure()``"""
+        return self.stage(name).measure()
+
+    def snapshot(self):
+        """Summaries of all stages
+
+        Returns:
+          dict: ``{stage: StageTimer.summary()}`` in creation order
+        """
+        return {name: timer.summary() for name, timer in list(self._stages.items())}
+
+    def format_status(self):
+        """One-line text for a status bar
+
+        Returns:
+          str: e.g. ``"capture 1.2/1.9/2.4 ms 30.0 fps | ..."`` with
+          p50/p95/p99 latencies
+        """
+        parts = []
+        for name, s in self.snapshot().items():
+            parts.append(
+                f"{name} {s['p50_ms']:.1f}/{s['p95_ms']:.1f}/{s['p99_ms']:.1f} ms "
+                f"{s['fps']:.1f} fps"
+            )
+        return " | ".join(parts)
@@ -26,11 +26,13 @@ import sys
 from typing import Tuple
 
 import cv2
-import numpy as np
 from PySide6.QtCore import QThread, Signal
 from PySide6.QtWidgets import QApplication
 
 from aztermis import __version__
+from o3dgui.clock import FrameClock
+from o3dgui.ringbuffer import FrameRingBuffer
+from o3dgui.timing import LatencyMonitor
 
 __author__ = "akiragishinichi"
 __copyright__ = "akiragishinichi"
@@ -63,7 +65,9 @@ _logger = logging.getLogger(__name__)
 
 
 class VideoWorkerThread(QThread):
-    frame_data_updated = Signal(np.ndarray)
+    # Emitted with the frame sequence number when the GUI has caught up with
+    # the previous frame; fetch the pixels with read_frame().
+    frame_data_updated = Signal(int)
     frame_data_invalid = Signal(str)
     is_running = False
 
@@ -85,7 +89,10 @@ class VideoWorkerThread(QThread):
         self._fps = fps
         self._frame_size = frame_size
         self._delay = int(1000 / self._fps)
+        self.frame_clock = FrameClock(self._fps)
         self._camera_id = camera_id
+        self.frame_ring = None
+        self.latency = LatencyMonitor()
 
         self._initialize_capture()
 
@@ -105,13 +112,44 @@ class VideoWorkerThread(QThread):
             cv2.CAP_PROP_FOURCC, cv2.VideoWriter.fourcc("M", "J", "P", "G")
         )
 
+    def _read_into_ring(self):
+        """Read a frame straight into a slot of ``frame_ring``
+
+        :return: whether a frame was read
+        :rtype: bool
+        """
+        if self.frame_ring is not None:
+            slot, buffer = self.frame_ring.acquire()
+            ret_val, frame = self._capture.read(buffer)
+            if not ret_val:
+                self.frame_ring.abort(slot)
+                return False
+            if frame is buffer:
+                self.frame = buffer
+                self._notify_frame(self.frame_ring.publish(slot))
+                return True
+            # The capture reallocated instead of filling the slot
+            self.frame_ring.abort(slot)
+        else:
+            ret_val, frame = self._capture.read()
+            if not ret_val:
+                return False
+
+        if self.frame_ring is None or frame.shape != self.frame_ring.shape:
+            self.frame_ring = FrameRingBuffer(frame.shape, frame.dtype)
+        self.frame = frame
+        self._notify_frame(self.frame_ring.write(frame))
+        return True
+
+    def _notify_frame(self, reader_is_idle):
+        if reader_is_idle:
+            self.frame_data_updated.emit(self.frame_ring.sequence)
+
     def _capture_frame(self):
         """Capture a frame"""
         if self.is_running:
             if self._capture.isOpened():
-                ret_val, self.frame = self._capture.read()
-                if ret_val:
-                    self.frame_data_updated.emit(self.frame)
+                if self._read_into_ring():
                     return True
                 else:
                     self.frame_data_invalid.emit("Can not capture frame.")
@@ -121,19 +159,33 @@ class VideoWorkerThread(QThread):
             self.frame_data_invalid.emit("Worker is not running yet.")
         return False
 
+    def read_frame(self, out=None):
+        """Latest captured frame, meant to be called from the GUI thread
+
+        :param out: buffer to copy the frame into, defaults to None
+        :type out: np.ndarray, optional
+        :return: frame sequence number and frame (None if nothing new)
+        :rtype: tuple(int, np.ndarray)
+        """
+        if self.frame_ring is None:
+            return 0, None
+        return self.frame_ring.copy_latest(out)
+
     def run(self):
         """Run workers"""
         print("\n  VideoWorkerThread - run")
         self.is_running = True
+        self.frame_clock.reset()
         while self.is_running:
-            ret_val = self._capture_frame()
+            self.frame_clock.wait()
+            with self.latency.measure("capture"):
+                ret_val = self._capture_frame()
             if not ret_val:
                 self.is_running = False
                 print(
                     "\n  VideoWorkerThread - run: Error occured. Worker stop running."
                 )
                 break
-            cv2.waitKey(self._delay)
 
     def stop_thread(self):
         """Stop worker running & worker thread"""
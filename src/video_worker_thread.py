@@ -1,6 +1,7 @@
 # video_worker_thread.py
 import os
 import datetime
+import threading
 import numpy as np
 import cv2
 import pyrealsense2 as rs
@@ -8,24 +9,60 @@ import pyrealsense2 as rs
 from PySide6.QtWidgets import QApplication
 from PySide6.QtCore import Signal, QThread
 
+from o3dgui.clock import FrameClock
+from o3dgui.depthcodec import DepthRecordingWriter, depth_path
+from o3dgui.rawformat import EXTENSION as RAW_EXTENSION
+from o3dgui.rawformat import RawRecordingWriter, RawVideoCapture
+from o3dgui.replay import ReplayCapture, synthetic_frames
+from o3dgui.recorder import DROP, AsyncRecorder
+from o3dgui.ringbuffer import FrameRingBuffer
+from o3dgui.runstate import RunState
+from o3dgui.timing import LatencyMonitor
+
 EXTERNAL_CAMERA = 1
 
 
+def realsense_serials():
+    """Serial numbers of the connected Realsense devices"""
+    return [
+        device.get_info(rs.camera_info.serial_number)
+        for device in rs.context().query_devices()
+    ]
+
+
+def open_realsense_captures(width=1280, height=720, fps=30, with_depth=True):
+    """One ``RealsenseCapture`` per connected device, keyed by serial number
+
+    Pass the result to ``o3dgui.multicam.CaptureManager`` to get framesets
+    matched across devices; ``with_depth`` should match the manager's.
+    """
+    return {
+        serial: RealsenseCapture(width, height, fps, with_depth, serial=serial)
+        for serial in realsense_serials()
+    }
+
+
 class RealsenseCapture():
     camera_is_open = False
 
     # def __init__(self, width=1280, height=720, fps=30) -> None:
-    def __init__(self, width=1280, height=720, fps=30, with_depth=False) -> None:
+    def __init__(self, width=1280, height=720, fps=30, with_depth=False, serial=None) -> None:
         self.with_depth = with_depth
+        self.serial = serial
+        self.depth_scale = 0.001
         # Create a pipeline
         self.pipeline = rs.pipeline()
         # Create a config and configure the pipeline to stream
         #  different resolutions of color and depth streams
         self.config = rs.config()
+        if serial is not None:
+            # Several cameras: each capture binds to its own device
+            self.config.enable_device(serial)
         self.config.enable_stream(
             rs.stream.color, width, height, rs.format.rgb8, fps)
-        # self.config.enable_stream(
-        #     rs.stream.depth, width, height, rs.format.z16, fps)
+        if with_depth:
+            self.config.enable_stream(
+                rs.stream.depth, width, height, rs.format.z16, fps)
         # self.config.enable_stream(
         #     rs.stream.infrared, 1, width, height, rs.format.y8, fps)
         # self.config.enable_stream(
@@ -35,6 +72,8 @@ class RealsenseCapture():
         # The "align_to" is the stream type to which we plan to align depth frames.
         # align_to = rs.stream.color
         # self.align = rs.align(align_to)
+        # Depth is registered to the color pixels, like the replay sources
+        self.align = rs.align(rs.stream.color) if with_depth else None
 
         try:
             # ! If there isn't any Realsense camera, this function is broken immediately -> time saving
@@ -42,8 +81,11 @@ class RealsenseCapture():
                 rs.pipeline_wrapper(self.pipeline))
 
             self.profile = self.pipeline.start(self.config)
+            device = self.profile.get_device()
+            if with_depth:
+                self.depth_scale = device.first_depth_sensor().get_depth_scale()
 
-            sensor = self.profile.get_device().query_sensors()[1]
+            sensor = device.query_sensors()[1]
             sensor.set_option(rs.option.exposure, 4)
             sensor.set_option(rs.option.gain, 80)  # 84
 
@@ -52,33 +94,45 @@ class RealsenseCapture():
         except:
             print(f'\n    RealsenseCapture - initialized not success')
 
-    def read(self, return_depth=False):
+    def read(self, image=None, return_depth=False):
         """Read BGR image from Realsense camera
 
+        Args:
+            image ([ndarray], optional): buffer to write the frame into, same
+                contract as ``cv2.VideoCapture.read``
+            return_depth (bool, optional): also return the uint16 depth
+                frame, registered to the color pixels; needs ``with_depth``
+
         Returns:
             [bool]: able to capture frame or not
             [ndarray]: frame
+            [ndarray]: depth, only with ``return_depth``
         """
+        if return_depth and not self.with_depth:
+            raise ValueError(
+                'RealsenseCapture - read: depth requested from a capture opened without with_depth')
         try:
             frames = self.pipeline.wait_for_frames()
-            # Align the depth frame to color frame
-            # frames = self.align.process(frames)
+            if self.align is not None:
+                # Align the depth frame to color frame
+                frames = self.align.process(frames)
 
             color_frame = frames.get_color_frame()
-            # depth_frame = frames.get_depth_frame()
-
             color_image = np.asarray(color_frame.get_data())
-            # depth_image = np.asarray(depth_frame.get_data())
-            # print(color_image.shape, depth_image.shape)
+            if image is not None and image.shape == color_image.shape:
+                np.copyto(image, color_image[:, :, ::-1])
+            else:
+                image = color_image[:, :, ::-1]
 
-            # if return_depth:
-            #     return True, color_image[:, :, ::-1], depth_image
-            # else:
-            return True, color_image[:, :, ::-1]
+            if return_depth:
+                # Copied: the frame's memory goes back to the pipeline
+                depth_image = np.array(frames.get_depth_frame().get_data())
+                return True, image, depth_image
+            return True, image
         except:
             self.camera_is_open = False
             print(f'\n    RealsenseCapture - read: error')
-            return False, None
+            return (False, None, None) if return_depth else (False, None)
 
     def isOpened(self):
         return self.camera_is_open
@@ -93,9 +147,15 @@ class RealsenseCapture():
 
 
 class VideoWorkerThread(QThread):
-    frame_data_updated = Signal(np.ndarray)
+    # Emitted with the frame sequence number when the GUI has caught up with
+    # the previous frame; fetch the pixels with readFrame().
+    frame_data_updated = Signal(int)
     frame_data_invalid = Signal()
 
+    # While paused, the params flags are re-checked this often (seconds) in
+    # case they are flipped directly instead of through pauseVideo/resumeVideo.
+    PAUSE_POLL = 0.1
+
     def __init__(
             self, parent, video_file, fps=24, frame_size=(640, 480)) -> None:
         super().__init__()
@@ -104,6 +164,16 @@ class VideoWorkerThread(QThread):
         self.fps = fps
         self.frame_size = frame_size
         self.delay = int(1000 / self.fps)
+        self.frame_clock = FrameClock(self.fps)
+        self.frame_ring = None
+        self.run_state = RunState()
+        self.recorder = None
+        # Guards swapping the recorders, which the GUI thread does while the
+        # capture loop is submitting frames to them
+        self.recorder_lock = threading.Lock()
+        self.depth_recorder = None
+        self.depth = None
+        self.latency = LatencyMonitor()
 
         self.setup_capture()
 
@@ -125,29 +195,164 @@ class VideoWorkerThread(QThread):
                 cv2.CAP_PROP_FRAME_HEIGHT, self.frame_size[1])
             self.video_capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter.fourcc(
                 'M', 'J', 'P', 'G'))
+        elif self.video_file == 'synthetic':
+            self.video_capture = ReplayCapture(synthetic_frames(
+                width=self.frame_size[0], height=self.frame_size[1]))
+        elif str(self.video_file).endswith(RAW_EXTENSION):
+            self.video_capture = RawVideoCapture(self.video_file)
         else:
             self.video_capture = cv2.VideoCapture(self.video_file)
 
-    def initializeRecorder(self, file_path):
+    def seekFrame(self, index):
+        """Jump to frame ``index`` of a file-backed source
+
+        Returns:
+            [bool]: whether the source supports seeking
+        """
+        if not self.isFileSource():
+            return False
+        self.frame_clock.reset()
+        return self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+
+    def isFileSource(self):
+        return self.video_file not in (0, 1)
+
+    def hasDepth(self):
+        capture = getattr(self, 'video_capture', None)
+        return 'depth' in getattr(capture, 'streams', ())
+
+    def readCapture(self, image=None):
+        """``video_capture.read`` that also keeps ``self.depth`` while depth
+        is being recorded"""
+        if self.depth_recorder is None:
+            # Never leave the depth of an earlier frame for executeRecording()
+            self.depth = None
+            return self.video_capture.read(image)
+        ret_val, frame, self.depth = self.video_capture.read(image, return_depth=True)
+        return ret_val, frame
+
+    def captureFrame(self):
+        """Read the next frame straight into a slot of ``frame_ring``
+
+        Returns:
+            [bool]: able to capture frame or not
+        """
+        if self.frame_ring is not None:
+            slot, buffer = self.frame_ring.acquire()
+            ret_val, frame = self.readCapture(buffer)
+            if not ret_val:
+                self.frame_ring.abort(slot)
+                return False
+            if frame is buffer:
+                self.frame = buffer
+                self.notifyFrame(self.frame_ring.publish(slot))
+                return True
+            # The capture reallocated instead of filling the slot
+            self.frame_ring.abort(slot)
+        else:
+            ret_val, frame = self.readCapture()
+            if not ret_val:
+                return False
+
+        if self.frame_ring is None or frame.shape != self.frame_ring.shape:
+            self.frame_ring = FrameRingBuffer(frame.shape, frame.dtype)
+        self.frame = frame
+        self.notifyFrame(self.frame_ring.write(frame))
+        return True
+
+    def notifyFrame(self, reader_is_idle):
+        if reader_is_idle:
+            self.frame_data_updated.emit(self.frame_ring.sequence)
+
+    def readFrame(self, out=None):
+        """Latest captured frame, meant to be called from the GUI thread
+
+        Args:
+            out ([ndarray], optional): buffer to copy the frame into
+
+        Returns:
+            [int]: frame sequence number
+            [ndarray]: frame, or None if nothing new was captured
+        """
+        if self.frame_ring is None:
+            return 0, None
+        return self.frame_ring.copy_latest(out)
+
+    def initializeRecorder(self, file_path, queue_size=64, policy=DROP):
+        """Open a recorder fed by a background writer thread
+
+        Paths ending in ``.o3draw`` are recorded losslessly as raw frames,
+        anything else as MJPG video. Sources with depth also get a
+        losslessly compressed ``.o3ddepth`` recording next to ``file_path``.
+
+        Args:
+            file_path ([str]): output path
+            queue_size (int, optional): frames allowed to wait for writing
+            policy (str, optional): ``"drop"`` new frames or ``"block"`` the
+                capture loop when the queue is full
+        """
         print(f'\n  VideoWorkerThread - initializeRecorder')
-        self.video_writer = cv2.VideoWriter(
-            file_path, cv2.VideoWriter.fourcc(
-                'M', 'J', 'P', 'G'), self.fps, self.frame_size)
+        self.stopRecording()
+        # File sources may not match frame_size: use what is being captured
+        width, height = self.frame_size
+        if getattr(self, 'frame', None) is not None:
+            height, width = self.frame.shape[:2]
+        if str(file_path).endswith(RAW_EXTENSION):
+            self.video_writer = RawRecordingWriter(
+                file_path, {'color': ((height, width, 3), np.uint8)},
+                fps=self.fps, metadata={'color_order': 'bgr'})
+            writer = self.video_writer
 
-    def executeRecording(self):
-        if hasattr(self, 'video_writer'):
-            if self.video_writer.isOpened():
-                self.video_writer.write(self.frame)
-            else:
+            def write(frame):
+                writer.write(color=frame)
+            close = writer.close
+        else:
+            self.video_writer = cv2.VideoWriter(
+                file_path, cv2.VideoWriter.fourcc(
+                    'M', 'J', 'P', 'G'), self.fps, (width, height))
+            if not self.video_writer.isOpened():
                 print(
-                    f'\n  VideoWorkerThread - run / video_is_recording: Error - recorder is not initialized yet.')
+                    f'\n  VideoWorkerThread - initializeRecorder: Error - can not open {file_path}.')
+                return
+            write, close = self.video_writer.write, self.video_writer.release
+        recorder = AsyncRecorder(
+            write, close, maxsize=queue_size, policy=policy)
+        depth_recorder = None
+        if self.hasDepth():
+            # Encoded on a thread pool; submit() copies the frame
+            depth_recorder = DepthRecordingWriter(
+                depth_path(file_path), (height, width), fps=self.fps,
+                metadata={'depth_scale': self.video_capture.depth_scale},
+                policy=policy)
+        with self.recorder_lock:
+            self.recorder, self.depth_recorder = recorder, depth_recorder
+
+    def executeRecording(self):
+        # Holding the lock keeps stopRecording() from closing the recorder
+        # while a frame is being submitted
+        with self.recorder_lock:
+            recorder, depth_recorder = self.recorder, self.depth_recorder
+            if recorder is not None:
+                recorder.submit(self.frame)
+            if depth_recorder is not None and self.depth is not None:
+                depth_recorder.submit(self.depth)
+        if recorder is None and hasattr(self, 'video_writer'):
+            print(
+                f'\n  VideoWorkerThread - run / video_is_recording: Error - recorder is not initialized yet.')
 
     def stopRecording(self):
-        if hasattr(self, 'video_writer'):
-            if self.video_writer.isOpened():
-                self.video_writer.release()
-                print(
-                    f'\n  VideoWorkerThread - run / not video_is_recording: stop recording.')
+        with self.recorder_lock:
+            recorder, self.recorder = self.recorder, None
+            depth_recorder, self.depth_recorder = self.depth_recorder, None
+        if recorder is not None:
+            # Flushes the queued frames before releasing the writer
+            recorder.close()
+            print(
+                f'\n  VideoWorkerThread - run / not video_is_recording: stop recording. {recorder.stats()}')
+        if depth_recorder is not None:
+            depth_recorder.close()
+            print(
+                f'\n  VideoWorkerThread - run / not video_is_recording: stop depth recording. {depth_recorder.stats()}')
 
     def run(self):
         # print(f'\n  VideoWorkerThread - run')
@@ -173,26 +378,64 @@ class VideoWorkerThread(QThread):
         if not self.video_capture.isOpened():
             self.frame_data_invalid.emit()
         else:
+            if self.run_state.is_stopped:  # restarted after stopVideo()
+                self.run_state = RunState()
+            self.frame_clock.reset()
             while self.parent.params['state']['video_thread_is_running']:
                 if self.parent.params['state']['video_is_pausing']:
+                    # Sleep until resumeVideo()/stopVideo() wakes us up
+                    self.run_state.pause()
+                    # resumeVideo() may have run between the check and pause()
+                    if self.parent.params['state']['video_is_pausing']:
+                        self.run_state.wait_until_running(self.PAUSE_POLL)
+                    if self.run_state.is_stopped:
+                        break
+                    self.frame_clock.reset()
                     continue
                 else:
-                    ret_val, self.frame = self.video_capture.read()  # Read a frame from camera
+                    self.run_state.resume()
+                    skipped = self.frame_clock.wait()
+                    if skipped and self.isFileSource():
+                        # Behind schedule: drop the frames whose deadline passed
+                        for _ in range(skipped):
+                            self.video_capture.grab()
+                    with self.latency.measure('capture'):
+                        ret_val = self.captureFrame()  # Read a frame from camera
                     if not ret_val:  # If couldn't get new valid frame
                         print(
                             f'\n  VideoWorkerThread - run: Error or reached the end of the video')
                         self.frame_data_invalid.emit()
                         break
                     else:  # If got new valid frame
-                        self.frame_data_updated.emit(self.frame)
                         if self.parent.params['state']['video_is_recording']:
-                            self.executeRecording()
+                            with self.latency.measure('recording'):
+                                self.executeRecording()
                         else:
                             self.stopRecording()
-                    cv2.waitKey(self.delay)
+
+    def latencyStats(self):
+        """Per-stage latency of the capture loop
+
+        Returns:
+            [dict]: {stage: {count, p50_ms, p95_ms, p99_ms, fps}}
+        """
+        return self.latency.snapshot()
+
+    def pauseVideo(self):
+        self.parent.params['state']['video_is_pausing'] = True
+        self.run_state.pause()
+
+    def resumeVideo(self):
+        self.parent.params['state']['video_is_pausing'] = False
+        self.run_state.resume()
+
+    def stopVideo(self):
+        self.parent.params['state']['video_thread_is_running'] = False
+        self.run_state.stop()
 
     def stopThread(self):
         print(f'\n  VideoWorkerThread - stopThread')
+        self.stopVideo()
         self.wait()
 
         self.releaseVideoTools()
@@ -201,7 +444,6 @@ class VideoWorkerThread(QThread):
 
     def releaseVideoTools(self):
         print(f'\n  VideoWorkerThread - releaseVideoTools')
-        if hasattr(self, 'video_writer'):
-            self.video_writer.release()
+        self.stopRecording()
         if hasattr(self, 'video_capture'):
             self.video_capture.release()
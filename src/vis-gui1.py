@@ -31,11 +31,30 @@ import open3d.visualization.rendering as rendering
 import numpy as np
 import time
 import threading
+from types import SimpleNamespace
 from typing import List, Tuple
 import pyrealsense2 as rs
-import cv2
 
 from o3dgui import __version__
+from o3dgui.align import DepthColorAligner, capture_aligner
+from o3dgui.cache import CloudCache
+from o3dgui.captureproc import CaptureProcess
+from o3dgui.cloudexport import ExportJob, FrameCloudExporter, export_format
+from o3dgui.cloudio import CloudFile, is_mappable
+from o3dgui.clock import FrameClock
+from o3dgui.depthfilter import build_chain
+from o3dgui.depthvis import DepthColorizer
+from o3dgui.geometry import IncrementalPointCloud
+from o3dgui.loader import CloudLoader
+from o3dgui.lod import LodCloud, LodStreamer, build_lod
+from o3dgui.pointcloud import DepthProjector
+from o3dgui.preprocess import Preprocessor
+from o3dgui.rawformat import RawRecordingReader
+from o3dgui.roi import RegionOfInterest, parse_box, parse_window
+from o3dgui.replay import ReplayCapture, default_intrinsics, synthetic_frames
+from o3dgui.ringbuffer import FrameRingBuffer
+from o3dgui.scheduler import UpdateScheduler
+from o3dgui.timing import LatencyMonitor
 
 __author__ = "akiragishinichi"
 __copyright__ = "akiragishinichi"
@@ -90,6 +109,57 @@ def parse_args(args):
         version="O3dGui {ver}".format(ver=__version__),
     )
     parser.add_argument("--n", help="n-th Fibonacci number", type=int)
+    parser.add_argument(
+        "--replay",
+        help="replay a .o3draw recording (or 'synthetic' frames) instead of the camera",
+        default=None,
+    )
+    parser.add_argument(
+        "--capture-process",
+        help="capture and process frames in a separate process",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--depth-filters",
+        help="depth filter chain applied before projection, e.g. 'decimation=2,spatial,temporal'",
+        default=None,
+    )
+    parser.add_argument(
+        "--roi",
+        help="process only the pixel window 'x,y,width,height' of the depth frame",
+        type=parse_window,
+        default=None,
+    )
+    parser.add_argument(
+        "--roi-box",
+        help="keep only points inside 'xmin,ymin,zmin,xmax,ymax,zmax' (meters, camera frame)",
+        type=parse_box,
+        default=None,
+    )
+    parser.add_argument(
+        "--roi-step",
+        help="use every N-th depth pixel inside the region (default: 1)",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--voxel-size",
+        help="voxel size used to downsample loaded clouds (default: no downsampling)",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--outlier-neighbors",
+        help="remove outliers of loaded clouds using N neighbours (default: 0, off)",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--normal-neighbors",
+        help="estimate normals of loaded clouds from N neighbours (default: 0, off)",
+        type=int,
+        default=0,
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -145,19 +215,74 @@ class AppWindow:
     MENU_QUIT = 3
     MENU_SHOW_SETTINGS = 4
     MENU_ABOUT = 5
-
-    def __init__(self, width=1024, height=768, *args, **kwargs):
+    MENU_SHOW_LATENCY = 6
+    MENU_EXPORT_LIVE = 7
+
+    STATUS_INTERVAL = 0.5
+    PREVIEW_POINTS = 200000
+    LOD_THRESHOLD = 5000000
+    LOD_BUDGET = 3000000
+    LOD_NODE_POINTS = 20000
+    LOD_MAX_DEPTH = 12
+    PREVIEW_VOXELS = 512
+    EXPORT_WINDOW = 10.0
+
+    def __init__(self, width=1024, height=768, replay=None, voxel_size=None, outlier_neighbors=0, normal_neighbors=0, capture_process=False, depth_filters=None, roi=None, *args, **kwargs):
         self.window = gui.Application.instance.create_window("Open3D", width=1024, height=768)
         em = self.window.theme.font_size
 
         # ─── REALSENSE CAMERA ────────────────────────────────────────────
-        self.pipeline = rs.pipeline()
-        self.config = rs.config()
-
-        self.config.enable_stream(rs.stream.depth, 640, 480, rs.format.z16, 30)
-        self.config.enable_stream(rs.stream.color, 640, 480, rs.format.rgb8, 30)
-
-        self.pipeline.start(self.config)
+        self.pipeline = None
+        self.capture = None
+        self.capture_process = None
+        self.aligner = None
+        # Smoothing/decimation of the raw depth; with decimation everything
+        # downstream works at the reduced size. The capture process runs its
+        # own chain.
+        self.depth_filter = build_chain(depth_filters) if depth_filters and not capture_process else None
+        # Cropped first, so every later stage scales with the region size
+        self.roi = roi if not capture_process else None
+        if capture_process:
+            # Capture, colormap and projection run in a worker process and
+            # come back through shared memory.
+            self.capture_process = CaptureProcess(replay or "realsense", depth_filters=depth_filters, roi=roi).start()
+            intrinsics = SimpleNamespace(**self.capture_process.info["intrinsics"])
+            depth_scale = 0.001
+        elif replay is None:
+            self.pipeline = rs.pipeline()
+            self.config = rs.config()
+
+            self.config.enable_stream(rs.stream.depth, 640, 480, rs.format.z16, 30)
+            self.config.enable_stream(rs.stream.color, 640, 480, rs.format.rgb8, 30)
+
+            profile = self.pipeline.start(self.config)
+
+            depth_profile = profile.get_stream(rs.stream.depth).as_video_stream_profile()
+            intrinsics = depth_profile.get_intrinsics()
+            depth_scale = profile.get_device().first_depth_sensor().get_depth_scale()
+            color_profile = profile.get_stream(rs.stream.color).as_video_stream_profile()
+            intrinsics = self._frame_intrinsics(intrinsics)
+            self.aligner = DepthColorAligner.from_extrinsics(
+                intrinsics, color_profile.get_intrinsics(), depth_profile.get_extrinsics_to(color_profile), depth_scale
+            )
+        else:
+            # Recorded (.o3draw) or synthetic frames instead of the camera
+            source = synthetic_frames() if replay == "synthetic" else RawRecordingReader(replay)
+            self.capture = ReplayCapture(source, loop=True)
+            intrinsics = self.capture.intrinsics or default_intrinsics(640, 480)
+            depth_scale = self.capture.depth_scale
+            intrinsics = self._frame_intrinsics(intrinsics)
+            self.aligner = capture_aligner(self.capture, intrinsics, depth_scale)
+        if self.aligner is not None and self.aligner.is_identity:
+            self.aligner = None
+        self.projector = DepthProjector.from_intrinsics(
+            intrinsics, depth_scale=depth_scale, depth_trunc=3.0, bounds=self.roi.bounds if self.roi else None
+        )
+
+        self.frame_clock = FrameClock(30)
+        self.latency = LatencyMonitor()
+        self._last_status = 0.0
+        self.scheduler = UpdateScheduler(lambda func: gui.Application.instance.post_to_main_thread(self.window, func))
         #
         # ────────────────────────────────────────── REALSENSE CAMERA ─────
         #
@@ -185,10 +310,15 @@ class AppWindow:
         self.color_image_preview = gui.ImageWidget()
 
         self.depth_image = np.zeros((100, 100, 3))
+        self.color_ring = None
+        self.depth_vis_ring = None
+        self.depth_colorizer = DepthColorizer(auto_range=True)
         depth_image_label = gui.Label("Depth image")
         self.depth_image_preview = gui.ImageWidget()
 
-        self.cloud = None
+        # Live cloud, updated in place in the preview scene
+        self.cloud = IncrementalPointCloud(self.projector.width * self.projector.height)
+        self._cloud_in_preview = False
         cloud_label = gui.Label("Point cloud")
         self.cloud_preview = gui.SceneWidget()
         self.cloud_preview.scene = rendering.Open3DScene(self.window.renderer)
@@ -196,7 +326,15 @@ class AppWindow:
         group2 = [color_image_label, self.color_image_preview, depth_image_label, self.depth_image_preview, cloud_label, self.cloud_preview]
         second_ctrls = create_collapsable_vert("Second Controls", items=group2, spacing=0.25*em, margins=(em, 0, em, 0))
 
+        self._load_progress = gui.ProgressBar()
+        self._cancel_load_button = create_button("Cancel", self._on_cancel_load, hpad=0.5)
+        self._load_ctrls = gui.Horiz(0.25 * em)
+        self._load_ctrls.add_child(self._load_progress)
+        self._load_ctrls.add_child(self._cancel_load_button)
+        self._load_ctrls.visible = False
+
         self._settings_panel = gui.Vert(0, gui.Margins(0.25 * em, 0.25* em, 0.25 * em, 0.25 * em))
+        self._settings_panel.add_child(self._load_ctrls)
         self._settings_panel.add_child(first_ctrls)
         self._settings_panel.add_child(second_ctrls)
         #
@@ -208,12 +346,16 @@ class AppWindow:
         if gui.Application.instance.menubar is None:
             file_menu = gui.Menu()
             file_menu.add_item("Open...", AppWindow.MENU_OPEN)
+            file_menu.add_item("Export...", AppWindow.MENU_EXPORT)
+            file_menu.add_item("Export live clouds...", AppWindow.MENU_EXPORT_LIVE)
             file_menu.add_separator()
             file_menu.add_item("Quit", AppWindow.MENU_QUIT)
 
             settings_menu = gui.Menu()
             settings_menu.add_item("Settings", AppWindow.MENU_SHOW_SETTINGS)
             settings_menu.set_checked(AppWindow.MENU_SHOW_SETTINGS, True)
+            settings_menu.add_item("Latency overlay", AppWindow.MENU_SHOW_LATENCY)
+            settings_menu.set_checked(AppWindow.MENU_SHOW_LATENCY, False)
 
             help_menu = gui.Menu()
             help_menu.add_item("About", AppWindow.MENU_ABOUT)
@@ -229,6 +371,31 @@ class AppWindow:
         #
 
 
+        # ─── LOADER ──────────────────────────────────────────────────────
+        self.loader = CloudLoader(
+            read_full=self._read_cloud,
+            read_preview=self._read_preview,
+            make_preview=self._make_preview,
+            on_preview=lambda path, model: self.scheduler.submit("main_scene", self._show_model, model + (False,)),
+            on_done=lambda path, model: self.scheduler.submit("main_scene", self._show_model, model + (True,)),
+            on_progress=lambda path, fraction, message: self.scheduler.submit("load_progress", self._show_load_progress, fraction),
+            on_error=self._on_load_error,
+        )
+        self._model_camera_ready = False
+        self.cache = CloudCache()
+        self.preprocessor = Preprocessor(
+            voxel_size=voxel_size, outlier_neighbors=outlier_neighbors, normal_neighbors=normal_neighbors)
+        self.lod_streamer = None
+        self._lod_in_scene = False
+        self.model = None
+        self.export_job = None
+        self.frame_exporter = None
+        self.main_display.set_on_mouse(self._on_main_display_mouse)
+        #
+        # ──────────────────────────────────────────────────── LOADER ─────
+        #
+
+
         # ─── STATUS BAR ──────────────────────────────────────────────────
         self.status_bar = gui.Label("")
         self.status_bar.visible = False
@@ -245,11 +412,14 @@ class AppWindow:
 
         self.window.set_on_menu_item_activated(AppWindow.MENU_OPEN, self._on_menu_open)
         self.window.set_on_menu_item_activated(AppWindow.MENU_EXPORT, self._on_menu_export)
+        self.window.set_on_menu_item_activated(AppWindow.MENU_EXPORT_LIVE, self._on_menu_export_live)
         self.window.set_on_menu_item_activated(AppWindow.MENU_QUIT, self._on_menu_quit)
         self.window.set_on_menu_item_activated(AppWindow.MENU_SHOW_SETTINGS, self._on_menu_toggle_settings_panel)
         self.window.set_on_menu_item_activated(AppWindow.MENU_ABOUT, self._on_menu_about)
+        self.window.set_on_menu_item_activated(AppWindow.MENU_SHOW_LATENCY, self._on_menu_toggle_latency_overlay)
 
-        threading.Thread(target=self._update_thread).start()
+        update_thread = self._update_thread if self.capture_process is None else self._process_update_thread
+        threading.Thread(target=update_thread).start()
         #
         # ──────────────────────────────────────────────────── WINDOW ─────
         #
@@ -285,22 +455,296 @@ class AppWindow:
         self.load(filename)
 
     def load(self, path):
-        self.main_display.scene.clear_geometry()
-
+        # Read on a worker; a strided preview shows up first, then the full
+        # cloud replaces it in one GUI-thread update.
+        self._model_camera_ready = False
+        self._show_load_progress(0.0)
+        self.loader.load(path)
+
+    def _read_cloud(self, path, token, progress):
+        progress(0.02, "Hashing")
+        digest = self.cache.digest(path)
+        token.check()
+
+        # Scans too big to draw whole go through the cached octree instead.
+        if is_mappable(path):
+            cloud_file = CloudFile(path)
+            if len(cloud_file) > AppWindow.LOD_THRESHOLD:
+                return self._read_lod(cloud_file, digest, token, progress)
+            cloud_file.close()
+
+        if self.preprocessor.enabled:
+            key = self.cache.key(digest, kind="cloud", preprocess=self.preprocessor.params())
+        else:
+            key = self.cache.key(digest, kind="cloud")
+        entry = self.cache.get(key)
+        if entry is not None:
+            progress(0.3, "Reading cache")
+            cloud = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(entry["points"]))
+            for name in ("colors", "normals"):
+                if name in entry:
+                    setattr(cloud, name, o3d.utility.Vector3dVector(entry[name]))
+            return cloud, o3d.geometry.AxisAlignedBoundingBox(*entry.meta["bounds"])
+
+        progress(0.05, "Reading")
         cloud = o3d.io.read_point_cloud(path)
+        token.check()
+
+        # Downsample, drop outliers and estimate normals, if asked to
+        if self.preprocessor.enabled:
+            progress(0.3, "Preprocessing")
+            result = self.preprocessor.run(
+                np.asarray(cloud.points),
+                np.asarray(cloud.colors) if cloud.has_colors() else None,
+                progress=lambda fraction: progress(0.3 + 0.45 * fraction, "Preprocessing"),
+            )
+            cloud = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(result["points"]))
+            for name in ("colors", "normals"):
+                if result[name] is not None:
+                    setattr(cloud, name, o3d.utility.Vector3dVector(result[name]))
+        bounds = cloud.get_axis_aligned_bounding_box()
+        token.check()
+
+        progress(0.8, "Caching")
+        bounds_meta = [bounds.min_bound.tolist(), bounds.max_bound.tolist()]
+        self.cache.put(key, {
+            "points": np.asarray(cloud.points),
+            "colors": np.asarray(cloud.colors) if cloud.has_colors() else None,
+            "normals": np.asarray(cloud.normals) if cloud.has_normals() else None,
+        }, meta={"bounds": bounds_meta})
+        # Reopening this file starts from the voxel preview
+        voxel_size = max(bounds.get_max_extent(), 1e-9) / AppWindow.PREVIEW_VOXELS
+        preview = cloud.voxel_down_sample(voxel_size)
+        self.cache.put(self.cache.key(digest, kind="voxel", voxels=AppWindow.PREVIEW_VOXELS), {
+            "points": np.asarray(preview.points, dtype=np.float32),
+            "colors": np.asarray(preview.colors, dtype=np.float32) if preview.has_colors() else None,
+        }, meta={"bounds": bounds_meta})
+        return cloud, bounds
+
+    def _read_lod(self, cloud_file, digest, token, progress):
+        key = self.cache.key(digest, kind="lod", node_points=AppWindow.LOD_NODE_POINTS, max_depth=AppWindow.LOD_MAX_DEPTH)
+        try:
+            entry = self.cache.get(key)
+            if entry is None:
+                # Streams over the mapped file; a cancelled build leaves no entry
+                progress(0.05, "Building LOD")
+                entry = self.cache.put_dir(key, lambda directory: build_lod(
+                    cloud_file.xyz, cloud_file.colors, directory,
+                    node_points=AppWindow.LOD_NODE_POINTS, max_depth=AppWindow.LOD_MAX_DEPTH,
+                    progress=lambda fraction: progress(0.05 + 0.75 * fraction, "Building LOD"),
+                    token=token,
+                ))
+        finally:
+            cloud_file.close()
+        lod = LodCloud(entry.path)
+        lo, hi = lod.bounds
+        return lod, o3d.geometry.AxisAlignedBoundingBox(lo, hi)
+
+    def _read_preview(self, path, token):
+        # A file opened before shows its cached voxel preview right away.
+        digest = self.cache.known_digest(path)
+        if digest is not None:
+            entry = self.cache.get(self.cache.key(digest, kind="voxel", voxels=AppWindow.PREVIEW_VOXELS))
+            if entry is not None:
+                cloud = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(entry["points"]))
+                if "colors" in entry:
+                    cloud.colors = o3d.utility.Vector3dVector(entry["colors"])
+                return cloud, o3d.geometry.AxisAlignedBoundingBox(*entry.meta["bounds"])
+
+        # Binary PLY/PCD: sample the memory-mapped file directly, touching only
+        # the pages under the strided records instead of parsing everything.
+        if not is_mappable(path):
+            return None
+        cloud_file = CloudFile(path)
+        try:
+            if len(cloud_file) <= AppWindow.PREVIEW_POINTS:
+                return None
+            points, colors = cloud_file.subsample(AppWindow.PREVIEW_POINTS)
+        finally:
+            cloud_file.close()
+        token.check()
+
+        cloud = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(points))
+        if colors is not None:
+            cloud.colors = o3d.utility.Vector3dVector(colors)
+        return cloud, cloud.get_axis_aligned_bounding_box()
+
+    def _make_preview(self, model):
+        cloud, bounds = model
+        if isinstance(cloud, LodCloud):
+            return None
+        n_points = len(cloud.points)
+        if n_points <= AppWindow.PREVIEW_POINTS:
+            return None
+        stride = -(-n_points // AppWindow.PREVIEW_POINTS)
+        return cloud.uniform_down_sample(stride), bounds
+
+    def _show_model(self, model):
+        cloud, bounds, is_final = model
+        if self.lod_streamer is not None:
+            self.lod_streamer.stop()
+            self.lod_streamer = None
+        if is_final:
+            self.model = cloud
+        if isinstance(cloud, LodCloud):
+            self._show_lod(cloud, bounds)
+            return
 
         material = rendering.Material()
         material.base_color = [0.9, 0.9, 0.9, 1.0]
         material.shader = "defaultLit"
 
+        self.main_display.scene.clear_geometry()
         self.main_display.scene.add_geometry("__model__", cloud, material)
-        bounds = cloud.get_axis_aligned_bounding_box()
-        self.main_display.setup_camera(60, bounds, bounds.get_center())
+        if not self._model_camera_ready:
+            self.main_display.setup_camera(60, bounds, bounds.get_center())
+            self._model_camera_ready = True
+        if is_final:
+            self._show_load_progress(None)
+
+    def _show_lod(self, lod, bounds):
+        # The preview stays on screen until the first LOD selection is ready.
+        if not self._model_camera_ready:
+            self.main_display.setup_camera(60, bounds, bounds.get_center())
+            self._model_camera_ready = True
+        self._lod_in_scene = False
+        self.lod_streamer = LodStreamer(
+            lod,
+            IncrementalPointCloud(min(AppWindow.LOD_BUDGET, len(lod)), "__model__"),
+            on_ready=lambda count: self.scheduler.submit("lod_scene", self._push_lod),
+        )
+        self.lod_streamer.update_camera(self._camera_position())
+
+    def _push_lod(self, _=None):
+        if self.lod_streamer is None:
+            return
+        cloud = self.lod_streamer.cloud
+        if not self._lod_in_scene:
+            self.main_display.scene.clear_geometry()
+            cloud.add_to(self.main_display.scene)
+            self._lod_in_scene = True
+            self._show_load_progress(None)
+        else:
+            cloud.push(self.main_display.scene)
+
+    def _camera_position(self):
+        return np.asarray(self.main_display.scene.camera.get_model_matrix())[:3, 3]
+
+    def _on_main_display_mouse(self, event):
+        # Reselect LOD nodes as the camera moves; the streamer only keeps the
+        # latest position, so a drag costs one selection at a time.
+        if self.lod_streamer is not None:
+            self.lod_streamer.update_camera(self._camera_position())
+        return gui.Widget.EventCallbackResult.IGNORED
+
+    def _show_load_progress(self, fraction):
+        # None hides the progress bar
+        self._load_ctrls.visible = fraction is not None
+        if fraction is not None:
+            self._load_progress.value = fraction
+        self.window.set_needs_layout()
+
+    def _on_load_error(self, path, error):
+        # Loader thread; cancelled loads never get here. CloudLoader has
+        # already logged the traceback.
+        self._hide_load_progress()
+        self.scheduler.submit("error_dialog", self._show_error, f"Could not load {path}:\n{error}")
+
+    def _show_error(self, message):
+        em = self.window.theme.font_size
+        dlg = gui.Dialog("Error")
+        layout = gui.Vert(em, gui.Margins(em, em, em, em))
+        layout.add_child(gui.Label(message))
+        ok = gui.Button("OK")
+        ok.set_on_clicked(self.window.close_dialog)
+        buttons = gui.Horiz()
+        buttons.add_stretch()
+        buttons.add_child(ok)
+        buttons.add_stretch()
+        layout.add_child(buttons)
+        dlg.add_child(layout)
+        self.window.show_dialog(dlg)
+
+    def _on_cancel_load(self):
+        self.loader.cancel()
+        if self.export_job is not None:
+            self.export_job.cancel()
+        self._show_load_progress(None)
 
     def _on_menu_export(self):
-        pass
+        dlg = gui.FileDialog(gui.FileDialog.SAVE, "Export point cloud", self.window.theme)
+        dlg.add_filter(".ply", "Polygon files (.ply)")
+        dlg.add_filter(".pcd", "Point Cloud Data files (.pcd)")
+        dlg.add_filter(".gz", "Compressed point clouds (.ply.gz, .pcd.gz)")
+
+        dlg.set_on_cancel(self._on_file_dialog_cancel)
+        dlg.set_on_done(self._on_export_dialog_done)
+
+        self.window.show_dialog(dlg)
+
+    def _on_export_dialog_done(self, filename):
+        self.window.close_dialog()
+        # A bad extension would otherwise only fail in the export thread's log
+        try:
+            export_format(filename)
+        except ValueError as error:
+            self._show_error(str(error))
+            return
+        self.export(filename)
+
+    def export(self, path):
+        # The loaded model, or the live cloud when nothing is loaded; written
+        # in chunks on a worker, so memory use does not grow with the cloud.
+        normals = None
+        if isinstance(self.model, LodCloud):
+            points, colors = self.model.points, self.model.colors
+        elif self.model is not None:
+            points = np.asarray(self.model.points)
+            colors = np.asarray(self.model.colors) if self.model.has_colors() else None
+            normals = np.asarray(self.model.normals) if self.model.has_normals() else None
+        else:
+            points, colors = self.cloud.snapshot()
+
+        if self.export_job is not None:
+            self.export_job.cancel()
+        self._show_load_progress(0.0)
+        self.export_job = ExportJob(
+            path, points, colors, normals,
+            on_progress=lambda fraction: self.scheduler.submit("load_progress", self._show_load_progress, fraction),
+            on_done=self._hide_load_progress,
+            on_error=self._hide_load_progress,
+        )
+
+    def _hide_load_progress(self, _=None):
+        self.scheduler.submit("load_progress", self._show_load_progress, None)
+
+    def _on_menu_export_live(self):
+        dlg = gui.FileDialog(gui.FileDialog.OPEN_DIR, "Export live clouds to", self.window.theme)
+        dlg.set_on_cancel(self._on_file_dialog_cancel)
+        dlg.set_on_done(self._on_export_live_dialog_done)
+        self.window.show_dialog(dlg)
+
+    def _on_export_live_dialog_done(self, directory):
+        self.window.close_dialog()
+        # The next EXPORT_WINDOW seconds of live clouds, one file per frame
+        if self.frame_exporter is not None:
+            self.frame_exporter.close(wait=False)
+        self.frame_exporter = FrameCloudExporter(directory, AppWindow.EXPORT_WINDOW)
+
+    def _export_live_cloud(self, points, colors):
+        exporter = self.frame_exporter
+        if exporter is not None:
+            with self.latency.measure("export"):
+                exporter.submit(points, colors)
 
     def _on_menu_quit(self):
+        self.preprocessor.close()
+        if self.export_job is not None:
+            self.export_job.cancel()
+        if self.frame_exporter is not None:
+            self.frame_exporter.close()
+        if self.capture_process is not None:
+            self.capture_process.stop()
         gui.Application.instance.quit()
 
     def _on_menu_toggle_settings_panel(self):
@@ -310,33 +754,140 @@ class AppWindow:
     def _on_menu_about(self):
         pass
 
+    def _on_menu_toggle_latency_overlay(self):
+        self.status_bar.visible = not self.status_bar.visible
+        gui.Application.instance.menubar.set_checked(AppWindow.MENU_SHOW_LATENCY, self.status_bar.visible)
+        self._update_status_bar()
+        self.window.set_needs_layout()
+
+    def _update_status_bar(self, _=None):
+        self.status_bar.text = self.latency.format_status()
+        self.window.set_needs_layout()
+
+    def _frame_intrinsics(self, intrinsics):
+        # Camera model of the depth after the ROI crop and the filters
+        if self.roi is not None:
+            intrinsics = self.roi.bind(intrinsics)
+        if self.depth_filter is not None:
+            intrinsics = self.depth_filter.scale_intrinsics(intrinsics)
+        return intrinsics
+
     def _update_thread(self):
         while 1:
-            time.sleep(0.100)
+            self.frame_clock.wait()
 
-            frames = self.pipeline.wait_for_frames()
-            depth_frame = frames.get_depth_frame()
-            color_frame = frames.get_color_frame()
-
-            if not depth_frame or not color_frame:
+            with self.latency.measure("capture"):
+                depth_data, color_data = self._read_frames()
+            if depth_data is None or color_data is None:
                 continue
-
-            depth_image = np.asarray(depth_frame.get_data())
-            color_image = np.asarray(color_frame.get_data())
+            if self.roi is not None:
+                # Strided views: no copy, and only the region is processed
+                depth_data = self.roi.crop(depth_data)
+            if self.depth_filter is not None:
+                # Timed per filter as "filter_<name>"
+                depth_data = self.depth_filter.process(depth_data, self.latency)
+            if self.depth_vis_ring is None:
+                self.depth_vis_ring = FrameRingBuffer(depth_data.shape + (3,), np.uint8)
+                self.color_ring = FrameRingBuffer(color_data.shape, color_data.dtype)
+                self.aligned_color = np.empty(depth_data.shape + (3,), np.uint8)
 
             # deph_image_dim, color_image_dim = depth_image.shape, color_image.shape
 
-            def update():
-                def to_o3d_image(np_image):
-                    return o3d.geometry.Image(np_image)
-                
-                def standardize_depth_image(image, alpha=0.03, color_map=cv2.COLORMAP_JET):
-                    return cv2.applyColorMap(cv2.convertScaleAbs(depth_image, alpha=alpha), color_map)
-
-                self.depth_image_preview.update_image(to_o3d_image(standardize_depth_image(depth_image)))
-                self.color_image_preview.update_image(to_o3d_image(color_image))
-            
-            gui.Application.instance.post_to_main_thread(self.window, update)
+            aligned_color = color_data
+            if self.aligner is not None:
+                with self.latency.measure("align"):
+                    # Color resampled onto the depth pixels before projection
+                    aligned_color = self.aligner.color_to_depth(depth_data, color_data, out=self.aligned_color)
+            else:
+                # Already registered: the same crop and subsampling as depth
+                if self.roi is not None:
+                    aligned_color = self.roi.crop(aligned_color)
+                if self.depth_filter is not None:
+                    aligned_color = self.depth_filter.decimate(aligned_color)
+
+            with self.latency.measure("pointcloud"):
+                points, colors = self.projector.project(depth_data, aligned_color)
+                self.cloud.set(points, colors)
+            self._export_live_cloud(points, colors)
+
+            self.color_ring.write(color_data)
+            with self.latency.measure("depth_colormap"):
+                # Colorized here, off the GUI thread, straight into a ring slot
+                slot, depth_vis = self.depth_vis_ring.acquire()
+                self.depth_colorizer.colorize(depth_data, out=depth_vis)
+                self.depth_vis_ring.publish(slot)
+
+            self._submit_previews()
+
+    def _process_update_thread(self):
+        # Frames arrive colorized and projected from the capture process;
+        # this process only copies them into the display buffers.
+        ring = self.capture_process.ring
+        while self.capture_process.poll():
+            if not ring.wait(0.1):
+                continue
+            with self.latency.measure("shared_frame"), ring.read_latest() as (_, frame, count):
+                if frame is None:
+                    continue
+                if self.depth_vis_ring is None:
+                    self.depth_vis_ring = FrameRingBuffer(frame["depth_vis"].shape, np.uint8)
+                    self.color_ring = FrameRingBuffer(frame["color"].shape, frame["color"].dtype)
+                self.color_ring.write(frame["color"])
+                self.depth_vis_ring.write(frame["depth_vis"])
+                self.cloud.set(frame["points"][:count], frame["colors"][:count])
+                self._export_live_cloud(frame["points"][:count], frame["colors"][:count])
+            self._submit_previews()
+        if self.capture_process.error:
+            _logger.error("Capture process failed: %s", self.capture_process.error)
+
+    def _submit_previews(self):
+        # At most one pending update per widget; newer data is merged into it.
+        self.scheduler.submit("color_preview", self._update_color_preview)
+        self.scheduler.submit("depth_preview", self._update_depth_preview)
+        self.scheduler.submit("cloud_preview", self._update_cloud_preview)
+
+        now = time.perf_counter()
+        if self.status_bar.visible and now - self._last_status >= AppWindow.STATUS_INTERVAL:
+            self._last_status = now
+            self.scheduler.submit("status_bar", self._update_status_bar)
+
+    def _read_frames(self):
+        if self.capture is not None:
+            ret_val, color_data, depth_data = self.capture.read(return_depth=True)
+            return (depth_data, color_data) if ret_val else (None, None)
+
+        frames = self.pipeline.wait_for_frames()
+        depth_frame = frames.get_depth_frame()
+        color_frame = frames.get_color_frame()
+
+        if not depth_frame or not color_frame:
+            return None, None
+
+        return np.asarray(depth_frame.get_data()), np.asarray(color_frame.get_data())
+
+    def _update_color_preview(self, _=None):
+        with self.latency.measure("color_preview"), self.color_ring.read_latest() as (_, color_image):
+            if color_image is not None:
+                self.color_image_preview.update_image(o3d.geometry.Image(color_image))
+
+    def _update_depth_preview(self, _=None):
+        with self.latency.measure("depth_preview"), self.depth_vis_ring.read_latest() as (_, depth_vis):
+            if depth_vis is not None:
+                self.depth_image_preview.update_image(o3d.geometry.Image(depth_vis))
+
+    def _update_cloud_preview(self, _=None):
+        with self.latency.measure("cloud_preview"):
+            if self._cloud_in_preview:
+                self.cloud.push(self.cloud_preview.scene)
+                return
+
+            bounds = self.cloud.bounds()
+            if bounds is None:
+                return
+            self.cloud.add_to(self.cloud_preview.scene)
+            self._cloud_in_preview = True
+            bounds = o3d.geometry.AxisAlignedBoundingBox(*(b.astype(np.float64) for b in bounds))
+            self.cloud_preview.setup_camera(60, bounds, bounds.get_center())
 
     def _say_hi(self):
         print("Hi!")
@@ -359,7 +910,13 @@ def main(args):
 
     _logger.debug("Start AppWindow")
     gui.Application.instance.initialize()
-    window = AppWindow(width=1024, height=768)
+    window = AppWindow(
+        width=1024, height=768, replay=args.replay, voxel_size=args.voxel_size, capture_process=args.capture_process,
+        outlier_neighbors=args.outlier_neighbors, normal_neighbors=args.normal_neighbors,
+        depth_filters=args.depth_filters,
+        roi=RegionOfInterest(args.roi, args.roi_box, args.roi_step)
+        if args.roi is not None or args.roi_box is not None or args.roi_step > 1 else None,
+    )
     gui.Application.instance.run()
 
     _logger.info("Script ends here")
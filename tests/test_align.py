@@ -0,0 +1,140 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from o3dgui.align import (
+    DepthColorAligner,
+    align_color_to_depth_reference,
+    capture_aligner,
+    extrinsics_matrix,
+)
+from o3dgui.rawformat import RawRecordingReader, RawRecordingWriter
+from o3dgui.replay import ReplayCapture, default_intrinsics, synthetic_frames
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def _config(width=64, height=48):
+    color = default_intrinsics(width + 16, height + 8)
+    color.fx *= 1.1
+    color.fy *= 1.1
+    rotation = np.array([[1.0, 0.01, 0.0], [-0.01, 1.0, 0.005], [0.0, -0.005, 1.0]])
+    return (
+        default_intrinsics(width, height),
+        color,
+        rotation,
+        np.array([0.015, 0.001, 0.0]),
+    )
+
+
+def _frame(width=64, height=48, color_shape=(56, 80)):
+    depth = next(synthetic_frames(width, height))["depth"]
+    color = np.random.default_rng(0).integers(
+        0, 256, color_shape + (3,), dtype=np.uint8
+    )
+    return depth, color
+
+
+def test_color_to_depth_matches_reference():
+    depth, color = _frame()
+    aligner = DepthColorAligner(*_config())
+    aligned = aligner.color_to_depth(depth, color)
+    expected = align_color_to_depth_reference(depth, color, *_config())
+    # float32 tables may round a pixel on the boundary differently
+    assert (aligned != expected).any(axis=-1).mean() < 0.01
+    assert not aligned[depth == 0].any()
+
+    # Cached tables are reused for the next frame and the output buffer
+    depth[:10] = 0
+    out = np.empty_like(aligned)
+    assert aligner.color_to_depth(depth, color, out=out) is out
+    assert not out[:10].any()
+
+
+def test_without_translation_uses_a_fixed_gather():
+    depth_intr, color_intr, rotation, _ = _config()
+    depth, color = _frame()
+    aligner = DepthColorAligner(depth_intr, color_intr, rotation)
+    assert aligner._static_index is not None
+    expected = align_color_to_depth_reference(
+        depth, color, depth_intr, color_intr, rotation, np.zeros(3)
+    )
+    assert (aligner.color_to_depth(depth, color) != expected).any(axis=-1).mean() < 0.01
+
+
+def test_identity_and_shape_checks():
+    intrinsics = default_intrinsics(8, 6)
+    aligner = DepthColorAligner(intrinsics, intrinsics)
+    assert aligner.is_identity
+    depth, color = _frame(8, 6, (6, 8))
+    aligned = aligner.color_to_depth(depth, color)
+    np.testing.assert_array_equal(aligned[depth > 0], color[depth > 0])
+    with pytest.raises(ValueError):
+        aligner.color_to_depth(depth[:5], color)
+    with pytest.raises(ValueError):
+        aligner.color_to_depth(depth, color[:5])
+
+
+def test_depth_to_color_keeps_the_nearest_depth():
+    intrinsics = default_intrinsics(8, 6)
+    aligner = DepthColorAligner(intrinsics, intrinsics)
+    depth = np.full((6, 8), 1000, np.uint16)
+    depth[0, 0] = 0
+    np.testing.assert_array_equal(aligner.depth_to_color(depth), depth)
+
+    # Two pixels on the same color pixel: half the color image width away
+    color = default_intrinsics(4, 3)
+    color.fx, color.fy, color.ppx, color.ppy = (
+        intrinsics.fx / 2,
+        intrinsics.fy / 2,
+        1.5,
+        1.0,
+    )
+    out = DepthColorAligner(intrinsics, color).depth_to_color(
+        np.full((6, 8), 800, np.uint16)
+    )
+    assert out.shape == (3, 4) and (out[out > 0] == 800).all()
+
+
+def test_extrinsics_matrix_is_column_major():
+    rotation = np.array([[0.0, -1.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, 1.0]])
+    extrinsics = SimpleNamespace(
+        rotation=list(rotation.T.ravel()), translation=[0.01, 0.0, 0.0]
+    )
+    matrix, translation = extrinsics_matrix(extrinsics)
+    np.testing.assert_array_equal(matrix, rotation)
+    np.testing.assert_array_equal(translation, [0.01, 0.0, 0.0])
+
+
+def test_replayed_recording_provides_an_aligner(tmp_path):
+    depth_intr, color_intr, rotation, translation = _config()
+    path = str(tmp_path / "s.o3draw")
+    streams = {"color": ((56, 80, 3), np.uint8), "depth": ((48, 64), np.uint16)}
+    metadata = {
+        "intrinsics": vars(depth_intr),
+        "color_intrinsics": vars(color_intr),
+        "extrinsics": {
+            "rotation": list(rotation.T.ravel()),
+            "translation": list(translation),
+        },
+    }
+    depth, color = _frame()
+    with RawRecordingWriter(path, streams, metadata=metadata) as w:
+        w.write(color=color, depth=depth)
+
+    capture = ReplayCapture(RawRecordingReader(path))
+    aligner = capture_aligner(capture, capture.intrinsics, capture.depth_scale)
+    _, color, depth = capture.read(return_depth=True)
+    expected = align_color_to_depth_reference(
+        depth, color, depth_intr, color_intr, rotation, translation
+    )
+    assert (aligner.color_to_depth(depth, color) != expected).any(axis=-1).mean() < 0.01
+    assert (
+        capture_aligner(
+            ReplayCapture(synthetic_frames(8, 6, count=1)), default_intrinsics(8, 6)
+        )
+        is None
+    )
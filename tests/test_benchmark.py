@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from o3dgui.benchmark import STAGES, main, run_benchmarks, summarize
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def test_summarize():
+    result = summarize([1e6] * 99 + [11e6])
+    assert result["frames"] == 100
+    assert result["p50_ms"] == pytest.approx(1.0)
+    assert result["max_ms"] == pytest.approx(11.0)
+    assert result["fps"] == pytest.approx(1000 / 1.1)
+
+
+def test_run_all_stages_headless():
+    report = run_benchmarks(resolutions=[(64, 48), (32, 24)], frames=3, warmup=1)
+    stages = {(r["stage"], r["width"]) for r in report["results"]}
+    for name in ("acquisition", "pointcloud", "align_color_to_depth", "recording"):
+        assert (name, 64) in stages and (name, 32) in stages
+    assert all(r["p99_ms"] >= r["p50_ms"] for r in report["results"])
+    assert report["meta"]["numpy"]
+    with pytest.raises(ValueError):
+        run_benchmarks(stages=["nope"])
+
+
+def test_main_writes_json(tmp_path):
+    output = tmp_path / "bench.json"
+    main(["-r", "32x24", "-n", "2", "-s", "pointcloud", "-o", str(output)])
+    report = json.loads(output.read_text())
+    assert [r["stage"] for r in report["results"]] == ["pointcloud"]
+    assert set(STAGES) >= {"acquisition", "bgr_to_rgb", "depth_colormap"}
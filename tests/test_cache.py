@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+
+from o3dgui.cache import CloudCache, file_digest
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def test_digest_follows_content(tmp_path):
+    cache = CloudCache(str(tmp_path / "cache"))
+    source = tmp_path / "a.pcd"
+    source.write_bytes(b"one")
+    copy = tmp_path / "b.pcd"
+    copy.write_bytes(b"one")
+
+    assert cache.known_digest(str(source)) is None
+    digest = cache.digest(str(source))
+    assert digest == file_digest(str(source)) == cache.digest(str(copy))
+    assert cache.known_digest(str(source)) == digest
+    # Remembered across instances
+    assert CloudCache(str(tmp_path / "cache")).known_digest(str(source)) == digest
+
+    source.write_bytes(b"two!")
+    assert cache.known_digest(str(source)) is None
+    assert cache.digest(str(source)) != digest
+
+
+def test_keys_depend_on_params():
+    assert CloudCache.key("d", kind="voxel", voxels=256) == CloudCache.key(
+        "d", voxels=256, kind="voxel"
+    )
+    assert CloudCache.key("d", kind="voxel", voxels=256) != CloudCache.key(
+        "d", kind="voxel", voxels=512
+    )
+    assert CloudCache.key("d", kind="voxel") != CloudCache.key("e", kind="voxel")
+
+
+def test_put_get_roundtrip(tmp_path):
+    cache = CloudCache(str(tmp_path))
+    points = np.arange(12, dtype=np.float64).reshape(4, 3)
+    key = cache.key("digest", kind="cloud")
+
+    assert cache.get(key) is None
+    cache.put(
+        key,
+        {"points": points, "colors": None},
+        meta={"bounds": [[0, 1, 2], [9, 10, 11]]},
+    )
+    entry = cache.get(key)
+    np.testing.assert_array_equal(entry["points"], points)
+    assert isinstance(entry["points"], np.memmap)
+    assert "colors" not in entry
+    assert entry.get("colors") is None
+    assert entry.meta["bounds"][1] == [9, 10, 11]
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not [name for name in os.listdir(str(tmp_path)) if name.startswith(".tmp")]
+
+
+def test_lru_eviction(tmp_path):
+    cache = CloudCache(str(tmp_path), max_bytes=3 * 8 * 1000 + 1500)
+    block = np.zeros(1000, dtype=np.float64)
+    for i, key in enumerate("abc"):
+        cache.put(key, {"data": block})
+        os.utime(os.path.join(str(tmp_path), key, "entry.json"), (100 + i, 100 + i))
+
+    # Touch "a" so "b" becomes the least recently used
+    assert cache.get("a") is not None
+    cache.put("d", {"data": block})
+
+    assert cache.get("b") is None
+    for key in "acd":
+        assert cache.get(key) is not None
+    assert cache.size() <= cache.max_bytes
@@ -0,0 +1,74 @@
+import time
+
+import numpy as np
+import pytest
+
+from o3dgui.clock import FrameClock
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 100.0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        assert seconds >= 0
+        self.now += seconds
+
+
+def test_deadlines_absorb_processing_time():
+    fake = FakeTime()
+    frame_clock = FrameClock(10, clock=fake.clock, sleep=fake.sleep)
+    ticks = []
+    for _ in range(5):
+        assert frame_clock.wait() == 0
+        ticks.append(fake.now)
+        fake.now += 0.03  # work done inside the frame
+    np.testing.assert_allclose(np.diff(ticks), 0.1)
+    assert frame_clock.achieved_fps == pytest.approx(10)
+    assert frame_clock.jitter == pytest.approx(0, abs=1e-9)
+
+
+def test_missed_deadlines_are_skipped():
+    fake = FakeTime()
+    frame_clock = FrameClock(10, clock=fake.clock, sleep=fake.sleep)
+    frame_clock.wait()
+    fake.now += 0.35  # stalled for three and a half periods
+    assert frame_clock.wait() == 2
+    start = fake.now
+    assert frame_clock.wait() == 0
+    # back on the original grid: deadline at t0 + 0.4
+    assert fake.now - start == pytest.approx(0.05)
+    assert frame_clock.stats()["skipped"] == 2
+
+
+def test_file_backed_source_paced_in_real_time(tmp_path):
+    cv2 = pytest.importorskip("cv2")
+    path = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter.fourcc(*"MJPG"), 50, (32, 24))
+    for i in range(15):
+        writer.write(np.full((24, 32, 3), i * 10, dtype=np.uint8))
+    writer.release()
+
+    capture = cv2.VideoCapture(path)
+    frame_clock = FrameClock(50)
+    start = time.perf_counter()
+    frames = 0
+    while True:
+        frame_clock.wait()
+        ret_val, _ = capture.read()
+        if not ret_val:
+            break
+        frames += 1
+    elapsed = time.perf_counter() - start
+    capture.release()
+
+    assert frames == 15
+    assert elapsed == pytest.approx(15 / 50, abs=0.1)
+    assert frame_clock.achieved_fps == pytest.approx(50, rel=0.2)
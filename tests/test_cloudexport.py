@@ -0,0 +1,163 @@
+import gzip
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from o3dgui import cloudexport
+from o3dgui.cloudexport import (
+    CloudWriter,
+    ExportJob,
+    FrameCloudExporter,
+    export_cloud,
+    export_format,
+)
+from o3dgui.cloudio import CloudFile
+from o3dgui.loader import CancelToken, LoadCancelled
+from o3dgui.recorder import BLOCK
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def _cloud(n=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.random((n, 3)) * 10 - 5
+    colors = rng.integers(0, 256, (n, 3)).astype(np.float64) / 255.0
+    normals = rng.random((n, 3))
+    return points, colors, normals
+
+
+def test_export_format():
+    assert export_format("a/b.PLY") == ("ply", False)
+    assert export_format("b.pcd.gz") == ("pcd", True)
+    with pytest.raises(ValueError):
+        export_format("b.xyz")
+
+
+@pytest.mark.parametrize("name", ["cloud.ply", "cloud.pcd"])
+def test_export_reads_back(tmp_path, name):
+    points, colors, normals = _cloud()
+    path = str(tmp_path / name)
+    # Small chunks: the buffer is reused many times
+    export_cloud(path, points, colors, normals, chunk_points=64)
+    assert os.listdir(tmp_path) == [name]
+
+    cloud = CloudFile(path)
+    assert len(cloud) == len(points)
+    np.testing.assert_array_equal(cloud.xyz, points.astype(np.float32))
+    np.testing.assert_array_equal(cloud.normals, normals.astype(np.float32))
+    np.testing.assert_array_equal(cloud.colors, np.rint(colors * 255).astype(np.uint8))
+    cloud.close()
+
+
+def test_compressed_variant_matches_plain_file(tmp_path):
+    points, colors, _ = _cloud()
+    export_cloud(str(tmp_path / "a.pcd"), points, colors)
+    size = export_cloud(str(tmp_path / "a.pcd.gz"), points, colors, chunk_points=100)
+    assert size == os.path.getsize(tmp_path / "a.pcd.gz")
+    with gzip.open(tmp_path / "a.pcd.gz") as f:
+        assert f.read() == (tmp_path / "a.pcd").read_bytes()
+
+
+def test_writer_checks_counts_and_removes_partial_files(tmp_path):
+    points, colors, _ = _cloud(10)
+    path = str(tmp_path / "a.ply")
+    writer = CloudWriter(path, 10, colors=True)
+    writer.write(points[:5], np.uint8(255) * np.ones((5, 3), np.uint8))
+    with pytest.raises(ValueError):
+        writer.write(points[:5])
+    with pytest.raises(ValueError):
+        writer.write(points, colors)
+    with pytest.raises(ValueError):
+        writer.close()
+    assert os.listdir(tmp_path) == []
+
+    token = CancelToken()
+    token.cancel()
+    with pytest.raises(LoadCancelled):
+        export_cloud(path, points, token=token)
+    assert os.listdir(tmp_path) == []
+
+
+def test_export_job(tmp_path):
+    points, colors, _ = _cloud(5000)
+    done, fractions = [], []
+    job = ExportJob(
+        str(tmp_path / "a.ply"),
+        points,
+        colors,
+        on_progress=fractions.append,
+        on_done=done.append,
+    )
+    job.wait(10)
+    assert not job.busy
+    assert done == [str(tmp_path / "a.ply")] and fractions[-1] == 1.0
+    assert len(CloudFile(done[0])) == 5000
+
+
+def test_frame_exporter_writes_a_time_window(tmp_path):
+    now = [0.0]
+    finished = []
+    exporter = FrameCloudExporter(
+        str(tmp_path / "frames"),
+        1.0,
+        pattern="f_{:03d}.pcd",
+        maxsize=16,
+        clock=lambda: now[0],
+        on_done=finished.append,
+    )
+    points, colors, _ = _cloud(100)
+    for i in range(4):
+        assert exporter.submit(points[: 50 + i], colors[: 50 + i])
+        now[0] += 0.3
+    # 1.2 s: past the window, which ends the export
+    assert not exporter.submit(points, colors)
+    exporter._thread.join(5)
+    assert exporter.finished and finished == [exporter]
+    assert exporter.frames_written == 4 and exporter.error is None
+    names = sorted(os.listdir(tmp_path / "frames"))
+    assert names == [f"f_{i:03d}.pcd" for i in range(4)]
+    assert [len(CloudFile(str(tmp_path / "frames" / name))) for name in names] == [
+        50,
+        51,
+        52,
+        53,
+    ]
+
+
+def test_frame_exporter_close_does_not_block_on_a_full_queue(tmp_path, monkeypatch):
+    release = threading.Event()
+    real_export = cloudexport.export_cloud
+
+    def slow_export(*args):
+        release.wait(5)
+        return real_export(*args)
+
+    monkeypatch.setattr(cloudexport, "export_cloud", slow_export)
+    exporter = FrameCloudExporter(
+        str(tmp_path / "frames"), 60.0, maxsize=2, policy=BLOCK
+    )
+    points, colors, _ = _cloud(10)
+    # One cloud in the stalled writer, two waiting: the queue is full
+    for _ in range(3):
+        assert exporter.submit(points, colors)
+    blocked = threading.Thread(target=exporter.submit, args=(points, colors))
+    blocked.start()
+
+    started = time.monotonic()
+    exporter.close(wait=False)
+    assert time.monotonic() - started < 0.5
+    # The blocked submit gives up instead of queueing behind the end
+    blocked.join(1)
+    assert not blocked.is_alive()
+    assert not exporter.submit(points, colors)
+
+    release.set()
+    exporter.close()
+    assert exporter.finished
+    assert exporter.frames_written == exporter.frames_submitted == 3
+    assert len(os.listdir(tmp_path / "frames")) == 3
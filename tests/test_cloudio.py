@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+
+from o3dgui import cloudio
+from o3dgui.cloudio import CloudFile, is_mappable
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def _points(n=50):
+    rng = np.random.default_rng(3)
+    xyz = rng.random((n, 3), dtype=np.float32)
+    rgb = rng.integers(0, 256, (n, 3), dtype=np.uint8)
+    return xyz, rgb
+
+
+def _write_ply(path, xyz, rgb, fmt="binary_little_endian"):
+    n = len(xyz)
+    header = (
+        "ply\n"
+        f"format {fmt} 1.0\n"
+        "comment test\n"
+        f"element vertex {n}\n"
+        "property float x\nproperty float y\nproperty float z\n"
+        "property float nx\nproperty float ny\nproperty float nz\n"
+        "property uchar red\nproperty uchar green\nproperty uchar blue\n"
+        "element face 0\n"
+        "property list uchar int vertex_indices\n"
+        "end_header\n"
+    )
+    dtype = np.dtype([("xyz", "<f4", 3), ("n", "<f4", 3), ("rgb", "u1", 3)])
+    body = np.zeros(n, dtype)
+    body["xyz"], body["n"], body["rgb"] = xyz, xyz * 2, rgb
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii"))
+        f.write(body.tobytes())
+
+
+def _write_pcd(path, xyz, rgb, data="binary"):
+    n = len(xyz)
+    header = (
+        "# .PCD v0.7 - Point Cloud Data file format\n"
+        "VERSION 0.7\nFIELDS x y z rgb\nSIZE 4 4 4 4\nTYPE F F F F\nCOUNT 1 1 1 1\n"
+        f"WIDTH {n}\nHEIGHT 1\nVIEWPOINT 0 0 0 1 0 0 0\nPOINTS {n}\nDATA {data}\n"
+    )
+    packed = (
+        (rgb[:, 0].astype(np.uint32) << 16)
+        | (rgb[:, 1].astype(np.uint32) << 8)
+        | rgb[:, 2]
+    )
+    body = np.zeros(n, [("xyz", "<f4", 3), ("rgb", "<u4")])
+    body["xyz"], body["rgb"] = xyz, packed
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii"))
+        f.write(body.tobytes())
+
+
+def test_ply_views(tmp_path):
+    xyz, rgb = _points()
+    path = str(tmp_path / "cloud.ply")
+    _write_ply(path, xyz, rgb)
+
+    assert is_mappable(path)
+    cloud = CloudFile(path)
+    assert cloud.format == "ply"
+    assert len(cloud) == len(xyz)
+    np.testing.assert_array_equal(cloud.xyz, xyz)
+    np.testing.assert_array_equal(cloud.normals, xyz * 2)
+    np.testing.assert_array_equal(cloud.colors, rgb)
+    # Views, not copies
+    assert not cloud.xyz.flags.owndata
+    assert not cloud.colors.flags.owndata
+    lo, hi = cloud.bounds(chunk=7)
+    np.testing.assert_allclose(lo, xyz.min(axis=0))
+    np.testing.assert_allclose(hi, xyz.max(axis=0))
+
+
+def test_pcd_packed_rgb(tmp_path):
+    xyz, rgb = _points()
+    path = str(tmp_path / "cloud.pcd")
+    _write_pcd(path, xyz, rgb)
+
+    cloud = CloudFile(path)
+    assert cloud.format == "pcd"
+    np.testing.assert_array_equal(cloud.xyz, xyz)
+    np.testing.assert_array_equal(cloud.colors, rgb)
+    assert cloud.normals is None
+
+
+def test_subsample(tmp_path):
+    xyz, rgb = _points(100)
+    path = str(tmp_path / "cloud.ply")
+    _write_ply(path, xyz, rgb)
+
+    points, colors = CloudFile(path).subsample(30)
+    assert len(points) <= 30
+    assert points.dtype == np.float32 and colors.dtype == np.float32
+    np.testing.assert_array_equal(points, xyz[::4])
+    np.testing.assert_allclose(colors, rgb[::4] / 255.0, rtol=1e-6)
+
+
+def test_unmappable(tmp_path):
+    xyz, rgb = _points(4)
+    ascii_path = str(tmp_path / "ascii.ply")
+    _write_ply(ascii_path, xyz, rgb, fmt="ascii")
+    compressed = str(tmp_path / "compressed.pcd")
+    _write_pcd(compressed, xyz, rgb, data="binary_compressed")
+    assert not is_mappable(ascii_path)
+    assert not is_mappable(compressed)
+
+
+def test_sniffing_other_formats_reads_only_the_start(tmp_path, monkeypatch):
+    xyz, _ = _points(100000)
+    text = str(tmp_path / "cloud.xyz")
+    np.savetxt(text, xyz)
+    # PCD-looking, but the DATA line never comes
+    headless = tmp_path / "headless.pcd"
+    headless.write_bytes(b"# .PCD v0.7\n" + b"FIELDS x y z\n" * 100000)
+    # No newline at all
+    blob = tmp_path / "blob.bin"
+    blob.write_bytes(bytes(1 << 20))
+
+    furthest = []
+
+    def tracking_open(*args, **kwargs):
+        f = open(*args, **kwargs)
+
+        def readline(size=-1):
+            line = type(f).readline(f, size)
+            furthest.append(f.tell())
+            return line
+
+        f.readline = readline
+        return f
+
+    monkeypatch.setattr(cloudio, "open", tracking_open, raising=False)
+    for path in (text, str(headless), str(blob)):
+        assert not is_mappable(path)
+    assert max(furthest) <= cloudio._HEADER_LIMIT + 1
+
+
+def test_truncated(tmp_path):
+    xyz, rgb = _points(10)
+    path = tmp_path / "cloud.ply"
+    _write_ply(str(path), xyz, rgb)
+    path.write_bytes(path.read_bytes()[:-5])
+    with pytest.raises(ValueError):
+        CloudFile(str(path))
@@ -0,0 +1,142 @@
+import os
+import zlib
+
+import numpy as np
+import pytest
+
+from o3dgui.depthcodec import (
+    _FRAME_HEADER,
+    BACKENDS,
+    FRAME_MAGIC,
+    DepthCodec,
+    DepthRecordingReader,
+    DepthRecordingWriter,
+    decode_residuals,
+    decode_valid,
+    encode_residuals,
+    encode_valid,
+)
+from o3dgui.recorder import DROP
+from o3dgui.replay import ReplayCapture, synthetic_frames
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def _depths(count, width=64, height=48, **kwargs):
+    return [
+        frame["depth"] for frame in synthetic_frames(width, height, count, **kwargs)
+    ]
+
+
+def test_residuals_round_trip_extremes():
+    rng = np.random.default_rng(0)
+    for depth in (
+        rng.integers(0, 1 << 16, (7, 9), dtype=np.uint16),
+        np.array([[0, 65535, 0], [65535, 0, 1]], np.uint16),
+        np.zeros((1, 1), np.uint16),
+    ):
+        zigzag = encode_residuals(depth)
+        np.testing.assert_array_equal(decode_residuals(zigzag.copy()), depth)
+        mask, zigzag = encode_valid(depth)
+        np.testing.assert_array_equal(decode_valid(mask, zigzag), depth)
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_codec_round_trip(backend):
+    codec = DepthCodec(backend)
+    depth = _depths(1, 640, 480)[0]
+    data = codec.encode(depth[:, 1:])  # not contiguous
+    out = np.empty((480, 639), np.uint16)
+    assert DepthCodec.decode(data, out=out) is out
+    np.testing.assert_array_equal(out, depth[:, 1:])
+    # Smooth depth: far better than the 3x target
+    assert depth.nbytes / len(data) > 3
+
+
+@pytest.mark.parametrize("backend", sorted(set(BACKENDS) - {"lz4"}))
+def test_codec_ratio_on_noisy_depth_with_holes(backend):
+    # Closer to a real sensor than the smooth plane: sigma 3 noise, 5% holes
+    depth = _depths(1, 640, 480, noise=3.0, holes=0.05)[0]
+    assert 0.05 <= (depth == 0).mean() < 0.06
+    data = DepthCodec(backend).encode(depth)
+    np.testing.assert_array_equal(DepthCodec.decode(data), depth)
+    assert depth.nbytes / len(data) > 3
+
+
+def test_codec_decodes_all_holes_and_first_version_frames():
+    holes = np.zeros((5, 7), np.uint16)
+    np.testing.assert_array_equal(DepthCodec.decode(DepthCodec().encode(holes)), holes)
+
+    # Left-neighbour prediction, holes included, as the first recordings had
+    depth = _depths(1)[0]
+    planes = encode_residuals(depth).view(np.uint8).reshape(-1, 2).T
+    data = _FRAME_HEADER.pack(FRAME_MAGIC, 1, 1, 1, 0, 48, 64) + zlib.compress(
+        np.ascontiguousarray(planes).tobytes()
+    )
+    np.testing.assert_array_equal(DepthCodec.decode(data), depth)
+
+
+def test_codec_rejects_bad_input():
+    with pytest.raises(ValueError):
+        DepthCodec("nope")
+    with pytest.raises(ValueError):
+        DepthCodec().encode(np.zeros((2, 2, 2), np.uint16))
+    with pytest.raises(ValueError):
+        DepthCodec.decode(b"garbage" * 4)
+
+
+def test_recording_seeks_and_replays(tmp_path):
+    depths = _depths(10)
+    path = str(tmp_path / "a.o3ddepth")
+    with DepthRecordingWriter(
+        path, (48, 64), fps=15, metadata={"depth_scale": 0.001}, workers=3
+    ) as writer:
+        for i, depth in enumerate(depths):
+            assert writer.submit(depth, timestamp=i / 15)
+    assert writer.frames_written == 10 and writer.ratio > 3
+
+    with DepthRecordingReader(path) as reader:
+        assert len(reader) == 10 and reader.fps == 15
+        # Written in submission order, whichever encoder finished first
+        for i in (7, 0, 9, 3):
+            np.testing.assert_array_equal(reader[i]["depth"], depths[i])
+        np.testing.assert_allclose(reader.timestamps, np.arange(10) / 15)
+
+        capture = ReplayCapture(reader)
+        assert capture.depth_scale == 0.001
+        ok, color, depth = capture.read(return_depth=True)
+        assert ok and color is None
+        np.testing.assert_array_equal(depth, depths[0])
+
+
+def test_reader_recovers_frames_without_index(tmp_path):
+    depths = _depths(4)
+    path = str(tmp_path / "a.o3ddepth")
+    with DepthRecordingWriter(path, (48, 64)) as writer:
+        for depth in depths:
+            writer.submit(depth)
+    with DepthRecordingReader(path) as reader:
+        end = int(reader.offsets[-1]) + 10
+    # Lose the index and half of the last frame, as after a crash
+    with open(path, "r+b") as f:
+        f.truncate(end)
+    with DepthRecordingReader(path) as reader:
+        assert len(reader) == 3
+        np.testing.assert_array_equal(reader.decode(2), depths[2])
+
+
+def test_writer_drops_when_full(tmp_path, monkeypatch):
+    writer = DepthRecordingWriter(
+        str(tmp_path / "a.o3ddepth"), (48, 64), workers=1, max_pending=1, policy=DROP
+    )
+    monkeypatch.setattr(writer._pending, "full", lambda: True)
+    assert not writer.submit(_depths(1)[0])
+    with pytest.raises(ValueError):
+        writer.submit(np.zeros((2, 2), np.uint16))
+    writer.close()
+    assert writer.frames_dropped == 1
+    assert os.path.getsize(tmp_path / "a.o3ddepth") > 0
+    with pytest.raises(RuntimeError):
+        writer.submit(_depths(1)[0])
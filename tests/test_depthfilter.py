@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from o3dgui.depthfilter import (
+    DecimationFilter,
+    DepthFilterChain,
+    SpatialFilter,
+    TemporalFilter,
+    build_chain,
+)
+from o3dgui.replay import default_intrinsics
+from o3dgui.timing import LatencyMonitor
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def test_decimation_averages_valid_samples():
+    depth = np.array([[0, 4, 1, 1, 9], [0, 0, 2, 3, 9], [7, 7, 0, 0, 9]], np.uint16)
+    out = DecimationFilter(2)(depth)
+    # Half-filled blocks are dropped, holes do not pull the mean down
+    np.testing.assert_array_equal(out, [[4, 2]])
+
+    intrinsics = DecimationFilter(2).scale_intrinsics(default_intrinsics(640, 480))
+    assert (intrinsics.width, intrinsics.height) == (320, 240)
+    assert intrinsics.ppx == pytest.approx((319.5 + 0.5) / 2 - 0.5)
+    assert DecimationFilter(2).decimate(np.zeros((5, 7, 3))).shape == (2, 3, 3)
+
+
+def test_spatial_filter_preserves_edges_and_holes():
+    rng = np.random.default_rng(0)
+    depth = np.full((20, 20), 1000, np.uint16)
+    depth[:, 10:] = 2000
+    noisy = (depth + rng.integers(-3, 4, depth.shape)).astype(np.uint16)
+    noisy[5, 5] = 0
+    out = SpatialFilter(delta=20, iterations=2)(noisy)
+    assert out[5, 5] == 0
+    out[5, 5] = 1000
+    assert np.abs(out[:, :10].astype(int) - 1000).max() <= 3
+    assert np.abs(out[:, 10:].astype(int) - 2000).max() <= 3
+    # Smoother than the input, away from the hole
+    assert out[10:, :9].std() < noisy[10:, :9].std()
+
+
+def test_temporal_filter_smooths_restarts_and_persists():
+    f = TemporalFilter(alpha=0.5, delta=20, persistence=2)
+    frame = np.full((2, 2), 1000, np.uint16)
+    assert (f(frame) == 1000).all()
+    assert (f(frame + 10) == 1005).all()
+    # Large jump: motion, taken as is
+    assert (f(frame + 500) == 1500).all()
+    holes = np.zeros_like(frame)
+    assert (f(holes) == 1500).all() and (f(holes) == 1500).all()
+    assert (f(holes) == 0).all()
+    f.reset()
+    assert (f(frame + 10) == 1010).all()
+
+
+def test_filters_reuse_buffers():
+    depth = np.full((8, 8), 500, np.uint16)
+    for f in (DecimationFilter(2), SpatialFilter(), TemporalFilter()):
+        assert f(depth) is f(depth)
+    with pytest.raises(ValueError):
+        SpatialFilter()(np.zeros((4, 4), np.float32))
+
+
+def test_chain():
+    chain = build_chain("decimation=2, spatial, temporal=0.5")
+    assert [f.name for f in chain.filters] == ["decimation", "spatial", "temporal"]
+    assert chain.filters[2].alpha == 0.5 and chain.factor == 2
+    latency = LatencyMonitor()
+    depth = np.full((6, 8), 700, np.uint16)
+    assert chain.process(depth, latency).shape == (3, 4)
+    assert {"filter_decimation", "filter_spatial", "filter_temporal"} <= set(
+        latency.snapshot()
+    )
+
+    # Disabled decimation still shrinks the frame, by subsampling
+    chain.filters[0].enabled = False
+    depth[::2, ::2] = 900
+    assert (chain.process(depth) > 700).all()
+    intrinsics = chain.scale_intrinsics(
+        SimpleNamespace(width=8, height=6, fx=4.0, fy=4.0, ppx=3.5, ppy=2.5)
+    )
+    assert (intrinsics.width, intrinsics.height) == (4, 3)
+
+    assert len(DepthFilterChain()) == 0
+    with pytest.raises(ValueError):
+        build_chain("median")
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from o3dgui.depthvis import DepthColorizer, colormap_table
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def test_colormap_table():
+    jet = colormap_table("jet")
+    assert jet.shape == (256, 3) and jet.dtype == np.uint8
+    assert jet[0, 2] > 100 and jet[0, 0] == 0  # blue for near
+    assert jet[-1, 0] > 100 and jet[-1, 2] == 0  # red for far
+    gray = colormap_table("gray")
+    assert (gray[:, 0] == np.arange(256)).all()
+    with pytest.raises(ValueError):
+        colormap_table("nope")
+
+
+def test_colorize_matches_lut_into_reused_buffer():
+    colorizer = DepthColorizer(near=1000, far=2000, colormap="gray")
+    depth = np.array([[0, 500, 1000], [1500, 2000, 65535]], dtype=np.uint16)
+    out = np.zeros((2, 3, 3), np.uint8)
+
+    assert colorizer.colorize(depth, out=out) is out
+    assert (out[0, 0] == 0).all()  # holes stay black
+    assert out[0, 1, 0] == 0 and out[0, 2, 0] == 0
+    assert out[1, 0, 0] in (127, 128)
+    assert out[1, 1, 0] == 255 and out[1, 2, 0] == 255
+    np.testing.assert_array_equal(out, colorizer.lut[depth])
+
+    strided = np.zeros((2, 3, 4), np.uint8)[..., :3]
+    np.testing.assert_array_equal(colorizer.colorize(depth, out=strided), out)
+    with pytest.raises(ValueError):
+        colorizer.colorize(depth.astype(np.float32))
+
+
+def test_lut_rebuilt_only_on_change():
+    colorizer = DepthColorizer(near=100, far=200)
+    assert colorizer.rebuilds == 1
+    colorizer.set_range(100, 200)
+    colorizer.set_colormap("jet")
+    assert colorizer.rebuilds == 1
+    colorizer.set_colormap("gray")
+    colorizer.set_range(100, 300)
+    assert colorizer.rebuilds == 3
+
+    bgr = DepthColorizer(near=0, far=10, bgr=True)
+    np.testing.assert_array_equal(bgr.lut[5], colormap_table("jet")[127][::-1])
+
+
+def test_auto_range_follows_scene_and_is_stable():
+    colorizer = DepthColorizer(auto_range=True, smoothing=1.0, quantum=100)
+    rng = np.random.default_rng(0)
+    depth = rng.integers(800, 1200, size=(64, 64)).astype(np.uint16)
+    depth[:8] = 0
+    colorizer.colorize(depth)
+    near, far = colorizer.range
+    assert 700 <= near <= 900 and 1100 <= far <= 1300
+
+    rebuilds = colorizer.rebuilds
+    for _ in range(10):
+        colorizer.colorize(rng.integers(800, 1200, size=(64, 64)).astype(np.uint16))
+    assert colorizer.rebuilds == rebuilds
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from o3dgui.geometry import IncrementalPointCloud
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def test_set_reuses_buffers_and_collapses_the_tail():
+    cloud = IncrementalPointCloud(5)
+    positions = cloud.positions
+    cloud.set(np.arange(15, dtype=np.float32).reshape(5, 3))
+    cloud.set(np.ones((2, 3)), colors=np.zeros((2, 3)))
+
+    assert cloud.positions is positions
+    assert cloud.count == 2
+    # no stray points at the old locations
+    np.testing.assert_array_equal(cloud.positions[2:], np.ones((3, 3)))
+    points, colors = cloud.snapshot()
+    assert points.shape == colors.shape == (2, 3)
+    lo, hi = cloud.bounds()
+    np.testing.assert_array_equal(lo, hi)
+
+    with pytest.raises(ValueError):
+        cloud.set(np.zeros((6, 3)))
+
+    fresh = IncrementalPointCloud(4)
+    fresh.set(np.full((1, 3), 7.0))
+    assert (fresh.positions == 7.0).all()
+    assert IncrementalPointCloud(3).bounds() is None
+
+
+def test_push_only_uploads_changed_attributes():
+    pytest.importorskip("open3d")
+    from o3dgui.geometry import rendering
+
+    class Scene:
+        def __init__(self):
+            self.scene = self
+            self.calls = []
+
+        def add_geometry(self, name, geometry, material):
+            self.calls.append(("add", name))
+
+        def update_geometry(self, name, geometry, flags):
+            self.calls.append(("update", flags))
+
+    scene = Scene()
+    cloud = IncrementalPointCloud(4)
+    cloud.set(np.zeros((4, 3)))
+    cloud.add_to(scene)
+    assert not cloud.push(scene)
+    cloud.set(colors=np.ones((4, 3)))
+    assert cloud.push(scene)
+    assert scene.calls == [
+        ("add", "__cloud__"),
+        ("update", rendering.Scene.UPDATE_COLORS_FLAG),
+    ]
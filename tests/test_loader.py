@@ -0,0 +1,122 @@
+import threading
+import time
+
+from o3dgui.loader import CloudLoader
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+class Events:
+    def __init__(self):
+        self.items = []
+        self.done = threading.Event()
+
+    def preview(self, path, cloud):
+        self.items.append(("preview", path, cloud))
+
+    def finished(self, path, cloud):
+        self.items.append(("done", path, cloud))
+        self.done.set()
+
+    def progress(self, path, fraction, message):
+        self.items.append(("progress", fraction))
+
+    def error(self, path, error):
+        self.items.append(("error", str(error)))
+        self.done.set()
+
+
+def make_loader(events, read_full, **kwargs):
+    return CloudLoader(
+        read_full,
+        on_preview=events.preview,
+        on_done=events.finished,
+        on_progress=events.progress,
+        on_error=events.error,
+        **kwargs,
+    )
+
+
+def test_preview_then_full_with_progress():
+    events = Events()
+
+    def read_full(path, token, progress):
+        progress(0.5, "half")
+        return list(range(10))
+
+    loader = make_loader(events, read_full, make_preview=lambda cloud: cloud[::5])
+    loader.load("a.ply")
+    assert events.done.wait(2)
+    loader.wait(2)
+
+    kinds = [item[0] for item in events.items]
+    assert kinds.index("preview") < kinds.index("done")
+    assert ("preview", "a.ply", [0, 5]) in events.items
+    assert events.items[-1] == ("done", "a.ply", list(range(10)))
+    fractions = [item[1] for item in events.items if item[0] == "progress"]
+    assert fractions == sorted(fractions) and fractions[-1] == 1.0
+    assert not loader.busy
+
+
+def test_read_preview_arrives_before_full_read_finishes():
+    events = Events()
+    release = threading.Event()
+
+    def read_full(path, token, progress):
+        assert release.wait(2)
+        return "full"
+
+    loader = make_loader(events, read_full, read_preview=lambda path, token: "quick")
+    loader.load("a.pcd")
+    for _ in range(2000):
+        if any(item[0] == "preview" for item in events.items):
+            break
+        time.sleep(0.001)
+    assert not events.done.is_set()
+    release.set()
+    assert events.done.wait(2)
+    assert events.items[-1] == ("done", "a.pcd", "full")
+
+
+def test_new_load_and_cancel_discard_stale_results():
+    events = Events()
+    gates = {"old.ply": threading.Event(), "new.ply": threading.Event()}
+
+    def read_full(path, token, progress):
+        gates[path].wait(2)
+        progress(0.9)  # raises once cancelled
+        return path
+
+    loader = make_loader(events, read_full)
+    first = loader.load("old.ply")
+    loader.load("new.ply")
+    assert first.cancelled
+    gates["old.ply"].set()
+    gates["new.ply"].set()
+    assert events.done.wait(2)
+    loader.wait(2)
+    assert [item for item in events.items if item[0] == "done"] == [
+        ("done", "new.ply", "new.ply")
+    ]
+
+    events.done.clear()
+    gate = threading.Event()
+    loader = make_loader(events, lambda path, token, progress: gate.wait(2) and path)
+    loader.load("x.ply")
+    loader.cancel()
+    gate.set()
+    loader.wait(2)
+    assert not events.done.is_set()
+
+
+def test_errors_are_reported():
+    events = Events()
+
+    def read_full(path, token, progress):
+        raise IOError("bad file")
+
+    make_loader(events, read_full).load("bad.ply")
+    assert events.done.wait(2)
+    assert events.items[-1] == ("error", "bad file")
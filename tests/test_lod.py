@@ -0,0 +1,129 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from o3dgui.geometry import IncrementalPointCloud
+from o3dgui.loader import CancelToken, LoadCancelled
+from o3dgui.lod import LodCloud, LodStreamer, build_lod
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def _cloud(n=5000):
+    rng = np.random.default_rng(1)
+    xyz = rng.random((n, 3), dtype=np.float32) * 10
+    rgb = rng.integers(0, 256, (n, 3), dtype=np.uint8)
+    return xyz, rgb
+
+
+def test_build_keeps_every_point(tmp_path):
+    xyz, rgb = _cloud()
+    lod = build_lod(xyz, rgb, str(tmp_path / "lod"), node_points=100, max_depth=4)
+
+    assert len(lod) == len(xyz)
+    assert lod.nodes["count"].sum() == len(xyz)
+    assert (lod.nodes["count"][lod.nodes["depth"] < 4] <= 100).all()
+    # Same set of points, reordered with their colors
+    order = np.lexsort(lod.points.T)
+    reference = np.lexsort(xyz.T)
+    np.testing.assert_array_equal(lod.points[order], xyz[reference])
+    np.testing.assert_array_equal(lod.colors[order], rgb[reference])
+    # Every node's points lie in its cell
+    for i in range(len(lod.nodes)):
+        lo, hi = lod.node_box(i)
+        start, count = lod.nodes["start"][i], lod.nodes["count"][i]
+        points = lod.points[start : start + count]
+        assert (points >= lo - 1e-4).all() and (points <= hi + 1e-4).all()
+
+
+def test_build_streams_from_a_memmap_in_chunks(tmp_path):
+    xyz, rgb = _cloud(3000)
+    xyz[[5, 700]] = np.nan
+    np.save(tmp_path / "xyz.npy", xyz)
+    mapped = np.load(tmp_path / "xyz.npy", mmap_mode="r")
+
+    whole = build_lod(mapped, rgb, str(tmp_path / "a"), node_points=64, max_depth=4)
+    chunked = build_lod(
+        mapped, rgb, str(tmp_path / "b"), node_points=64, max_depth=4, chunk_points=97
+    )
+    # Non-finite points are dropped; chunking does not change the result
+    assert len(chunked) == 2998
+    np.testing.assert_array_equal(chunked.nodes, whole.nodes)
+    np.testing.assert_array_equal(chunked.points, whole.points)
+    np.testing.assert_array_equal(chunked.colors, whole.colors)
+    assert sorted(os.listdir(tmp_path / "b")) == [
+        "colors.npy",
+        "meta.json",
+        "nodes.npy",
+        "points.npy",
+    ]
+
+
+def test_build_checks_the_cancel_token(tmp_path):
+    xyz, rgb = _cloud(1000)
+    token = CancelToken()
+    calls = []
+
+    def progress(fraction):
+        calls.append(fraction)
+        token.cancel()
+
+    with pytest.raises(LoadCancelled):
+        build_lod(
+            xyz,
+            rgb,
+            str(tmp_path / "lod"),
+            node_points=10,
+            progress=progress,
+            token=token,
+        )
+    assert len(calls) == 1
+    assert not os.path.exists(tmp_path / "lod" / "meta.json")
+    assert not os.path.exists(tmp_path / "lod" / "depth.tmp")
+
+
+def test_select_respects_budget_and_prefers_near(tmp_path):
+    xyz, rgb = _cloud(20000)
+    lod = build_lod(xyz, rgb, str(tmp_path / "lod"), node_points=200, max_depth=5)
+
+    near_corner = np.array([0.0, 0.0, 0.0])
+    selected = lod.select(near_corner, budget=3000)
+    assert lod.nodes["count"][selected].sum() <= 3000
+    assert selected[0] == 0
+
+    points = np.empty((3000, 3), np.float32)
+    count = lod.gather(selected, points)
+    near = np.linalg.norm(points[:count] - near_corner, axis=1) < 3
+    far = np.linalg.norm(points[:count] - 10, axis=1) < 3
+    assert near.sum() > 2 * far.sum()
+
+
+def test_streamer_fills_buffer(tmp_path):
+    xyz, rgb = _cloud(4000)
+    lod = LodCloud(
+        build_lod(xyz, rgb, str(tmp_path / "lod"), node_points=100, max_depth=4).path
+    )
+    cloud = IncrementalPointCloud(1500)
+    ready = threading.Event()
+    counts = []
+
+    def on_ready(count):
+        counts.append(count)
+        ready.set()
+
+    streamer = LodStreamer(lod, cloud, on_ready=on_ready)
+    try:
+        streamer.update_camera([5, 5, 5])
+        assert ready.wait(5)
+    finally:
+        streamer.stop()
+    assert 0 < counts[0] <= 1500
+    assert cloud.count == counts[0]
+    assert (
+        0.0 <= cloud.colors[: cloud.count].min()
+        and cloud.colors[: cloud.count].max() <= 1.0
+    )
@@ -0,0 +1,89 @@
+import time
+
+import numpy as np
+
+from o3dgui.multicam import CaptureManager, Frame, FrameMatcher
+from o3dgui.replay import ReplayCapture, synthetic_frames
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def _frame(source, sequence, timestamp):
+    return Frame(source, sequence, timestamp, None, None)
+
+
+def test_matcher_groups_within_tolerance():
+    matcher = FrameMatcher(["a", "b"], tolerance=0.005)
+    assert matcher.push(_frame("a", 0, 1.000)) == []
+    (frameset,) = matcher.push(_frame("b", 0, 1.003))
+    assert frameset.frames["a"].sequence == frameset.frames["b"].sequence == 0
+    assert abs(frameset.skew - 0.003) < 1e-9
+    assert abs(frameset.timestamp - 1.0015) < 1e-9
+
+
+def test_matcher_drops_frames_without_partner():
+    matcher = FrameMatcher(["a", "b", "c"], tolerance=0.005)
+    # "a" dropped a frame: its 1.033 pairs with the second frames of b and c
+    for frame in [
+        _frame("a", 0, 1.000),
+        _frame("b", 0, 1.001),
+        _frame("b", 1, 1.034),
+        _frame("c", 0, 1.033),
+    ]:
+        assert matcher.push(frame) == []
+    (frameset,) = matcher.push(_frame("a", 1, 1.033))
+    assert [frameset.frames[name].sequence for name in "abc"] == [1, 1, 0]
+    assert matcher.unmatched == {"a": 1, "b": 1, "c": 0}
+    assert matcher.matched == 1
+
+
+def test_manager_with_replay_sources():
+    sources = {
+        name: ReplayCapture(synthetic_frames(32, 24, count=40), fps=100)
+        for name in ("left", "right")
+    }
+    manager = CaptureManager(sources, tolerance=0.004)
+    framesets = []
+    with manager:
+        for frameset in manager:
+            framesets.append(frameset)
+
+    assert len(framesets) >= 10
+    for frameset in framesets:
+        assert frameset.skew <= 0.004
+        assert set(frameset.frames) == {"left", "right"}
+        assert frameset.frames["left"].depth.dtype == np.uint16
+    timestamps = [frameset.timestamp for frameset in framesets]
+    assert timestamps == sorted(timestamps)
+    stats = manager.stats()
+    assert all(len(framesets) <= count <= 40 for count in stats["read"].values())
+    assert stats["matched"] == len(framesets) + stats["dropped"]
+    assert not sources["left"].isOpened()
+
+
+class _StalledCapture:
+    """Open, but every read times out"""
+
+    def __init__(self):
+        self.reads = 0
+
+    def read(self, return_depth=False):
+        self.reads += 1
+        return (False, None, None) if return_depth else (False, None)
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+
+def test_manager_backs_off_on_failed_reads():
+    source = _StalledCapture()
+    manager = CaptureManager({"stalled": source})
+    with manager:
+        time.sleep(0.2)
+    # A spinning thread would read hundreds of thousands of times
+    assert 0 < source.reads <= 2 * 0.2 / CaptureManager.RETRY_DELAY
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from o3dgui.pointcloud import DepthProjector
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def make_projector(**kwargs):
+    return DepthProjector(4, 3, fx=2.0, fy=2.0, cx=1.5, cy=1.0, **kwargs)
+
+
+def test_project_pinhole():
+    """Points follow the pinhole model and zero depth is dropped"""
+    projector = make_projector()
+    depth = np.full((3, 4), 1000, dtype=np.uint16)
+    depth[0, 0] = 0
+    color = np.arange(3 * 4 * 3, dtype=np.uint8).reshape(3, 4, 3)
+
+    points, colors = projector.project(depth, color)
+
+    assert points.shape == (11, 3)
+    assert points.dtype == np.float32
+    # pixel (u=3, v=2) is the last valid one
+    np.testing.assert_allclose(points[-1], [(3 - 1.5) / 2, (2 - 1.0) / 2, 1.0])
+    np.testing.assert_allclose(colors[-1], color[2, 3] / 255.0, rtol=1e-6)
+
+
+def test_project_truncates_and_checks_shape():
+    projector = make_projector(depth_trunc=1.0)
+    depth = np.full((3, 4), 500, dtype=np.uint16)
+    depth[1, 1] = 2000
+
+    points, colors = projector.project(depth)
+    assert len(points) == 11
+    assert colors is None
+    with pytest.raises(ValueError):
+        projector.project(np.zeros((4, 3), dtype=np.uint16))
+
+
+def test_from_intrinsics():
+    class Intrinsics:
+        width, height, fx, fy, ppx, ppy = 4, 3, 2.0, 2.0, 1.5, 1.0
+
+    projector = DepthProjector.from_intrinsics(Intrinsics(), depth_scale=0.01)
+    points, _ = projector.project(np.ones((3, 4), dtype=np.uint16))
+    np.testing.assert_allclose(points[:, 2], 0.01)
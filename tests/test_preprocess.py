@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from o3dgui.preprocess import (
+    Preprocessor,
+    estimate_normals,
+    knn_pairs,
+    voxel_downsample,
+)
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def _plane(n=4000, seed=0):
+    rng = np.random.default_rng(seed)
+    xy = rng.random((n, 2)) * 4
+    z = 0.01 * rng.standard_normal(n) + 1.0
+    points = np.column_stack([xy, z])
+    colors = rng.random((n, 3))
+    return points, colors
+
+
+def test_knn_matches_brute_force():
+    points, _ = _plane(500)
+    q, p, d = knn_pairs(points, 50, radius=0.4, k=5)
+    for i in range(50):
+        distances = ((points - points[i]) ** 2).sum(axis=1)
+        expected = np.sort(distances[distances <= 0.16])[:5]
+        np.testing.assert_allclose(d[q == i], expected)
+
+
+def test_voxel_downsample_centroids():
+    points = np.array([[0.1, 0.1, 0.1], [0.3, 0.3, 0.3], [1.5, 0.1, 0.1]])
+    colors = np.array([[1.0, 0, 0], [0, 1.0, 0], [0, 0, 1.0]])
+    keys, centroids, mean_colors = voxel_downsample(points, colors, np.zeros(3), 1.0)
+    assert len(keys) == 2
+    np.testing.assert_allclose(centroids, [[0.2, 0.2, 0.2], [1.5, 0.1, 0.1]])
+    np.testing.assert_allclose(mean_colors, [[0.5, 0.5, 0], [0, 0, 1.0]])
+
+
+def test_normals_of_a_plane_face_the_viewpoint():
+    points, _ = _plane(2000)
+    normals = estimate_normals(
+        points, len(points), radius=0.3, k=20, viewpoint=(2, 2, 10)
+    )
+    assert (normals[:, 2] > 0.95).all()
+
+
+def test_passes_are_opt_in():
+    assert not Preprocessor().enabled
+    assert Preprocessor(voxel_size=0.1).enabled
+    assert Preprocessor(outlier_neighbors=10).enabled
+    assert Preprocessor(normal_neighbors=10).enabled
+
+
+def test_outliers_are_removed():
+    points, colors = _plane(3000)
+    outliers = np.array([[2.0, 2.0, 3.0], [-3.0, 1.0, 1.0], [7.0, 7.0, -2.0]])
+    result = Preprocessor(
+        outlier_neighbors=10, normal_neighbors=0, radius=0.5, workers=0
+    ).run(np.vstack([points, outliers]), np.vstack([colors, np.zeros((3, 3))]))
+    kept = result["points"]
+    assert len(kept) >= 0.95 * len(points)
+    for outlier in outliers:
+        assert not (np.abs(kept - outlier).sum(axis=1) < 1e-9).any()
+    assert result["normals"] is None
+
+
+@pytest.mark.parametrize("chunk_size", [0.7, 1.3, 10.0])
+def test_chunking_does_not_change_the_result(chunk_size):
+    points, colors = _plane(3000, seed=4)
+    options = dict(
+        voxel_size=0.05, outlier_neighbors=8, normal_neighbors=12, radius=0.3, workers=0
+    )
+    reference = Preprocessor(chunk_size=100.0, **options).run(points, colors)
+    chunked = Preprocessor(chunk_size=chunk_size, **options).run(points, colors)
+    for name in ("points", "colors", "normals"):
+        np.testing.assert_allclose(chunked[name], reference[name], atol=1e-9)
+
+
+def test_process_pool_matches_inline():
+    points, colors = _plane(2000, seed=5)
+    options = dict(
+        voxel_size=0.05,
+        outlier_neighbors=8,
+        normal_neighbors=12,
+        radius=0.3,
+        chunk_size=1.0,
+    )
+    inline = Preprocessor(workers=0, **options).run(points, colors)
+    pool = Preprocessor(workers=2, **options)
+    try:
+        parallel = pool.run(points, colors)
+    finally:
+        pool.close()
+    for name in ("points", "colors", "normals"):
+        np.testing.assert_array_equal(parallel[name], inline[name])
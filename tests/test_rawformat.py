@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from o3dgui.rawformat import (
+    CAP_PROP_FRAME_COUNT,
+    CAP_PROP_POS_FRAMES,
+    RawRecordingReader,
+    RawRecordingWriter,
+    RawVideoCapture,
+)
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+STREAMS = {"color": ((6, 8, 3), np.uint8), "depth": ((6, 8), np.uint16)}
+
+
+def write_session(path, n=5):
+    with RawRecordingWriter(path, STREAMS, fps=15, metadata={"serial": "x"}) as w:
+        for i in range(n):
+            w.write(
+                timestamp=i / 15,
+                color=np.full((6, 8, 3), i, dtype=np.uint8),
+                depth=np.full((6, 8), 1000 + i, dtype=np.uint16),
+            )
+
+
+def test_roundtrip_is_lossless_and_memory_mapped(tmp_path):
+    path = str(tmp_path / "session.o3draw")
+    write_session(path)
+
+    reader = RawRecordingReader(path)
+    assert len(reader) == 5
+    assert reader.fps == 15
+    assert reader.metadata == {"serial": "x"}
+    assert isinstance(reader.records, np.memmap)
+
+    frame = reader[3]
+    assert frame["timestamp"] == pytest.approx(3 / 15)
+    assert frame["depth"].dtype == np.uint16
+    assert (frame["depth"] == 1003).all()
+    assert (frame["color"] == 3).all()
+    assert reader.stream("depth").shape == (5, 6, 8)
+    np.testing.assert_allclose(np.diff(reader.timestamps), 1 / 15)
+
+
+def test_truncated_record_is_ignored(tmp_path):
+    path = tmp_path / "session.o3draw"
+    write_session(str(path))
+    with open(path, "ab") as f:
+        f.write(b"\1" * 10)
+    assert len(RawRecordingReader(str(path))) == 5
+
+
+def test_writer_validates_frames(tmp_path):
+    with RawRecordingWriter(str(tmp_path / "s.o3draw"), STREAMS) as w:
+        with pytest.raises(ValueError):
+            w.write(color=np.zeros((6, 8, 3), np.uint8))
+        with pytest.raises(ValueError):
+            w.write(color=np.zeros((6, 8), np.uint8), depth=np.zeros((6, 8)))
+    with pytest.raises(ValueError):
+        RawRecordingReader(__file__)
+
+
+def test_rejected_frame_leaves_no_partial_record(tmp_path):
+    path = str(tmp_path / "s.o3draw")
+    with RawRecordingWriter(path, STREAMS) as w:
+        with pytest.raises(ValueError):
+            # color is fine, depth is not: nothing may be written
+            w.write(color=np.ones((6, 8, 3), np.uint8), depth=np.zeros((6, 7)))
+        w.write(
+            timestamp=2.0,
+            color=np.full((6, 8, 3), 7, np.uint8),
+            depth=np.full((6, 8), 1234, np.uint16),
+        )
+    reader = RawRecordingReader(path)
+    assert len(reader) == 1
+    frame = reader[0]
+    assert frame["timestamp"] == 2.0
+    assert (frame["color"] == 7).all() and (frame["depth"] == 1234).all()
+
+
+def test_capture_supports_seeking(tmp_path):
+    path = str(tmp_path / "session.o3draw")
+    write_session(path)
+
+    capture = RawVideoCapture(path, stream="depth")
+    assert capture.get(CAP_PROP_FRAME_COUNT) == 5
+    assert capture.set(CAP_PROP_POS_FRAMES, 4)
+    buffer = np.empty((6, 8), np.uint16)
+    ret_val, frame = capture.read(buffer)
+    assert ret_val and frame is buffer and (frame == 1004).all()
+    assert capture.read() == (False, None)
+    capture.release()
+    assert not capture.isOpened()
+
+
+def test_capture_returns_the_matching_depth(tmp_path):
+    path = str(tmp_path / "session.o3draw")
+    write_session(path)
+
+    capture = RawVideoCapture(path)
+    assert "depth" in capture.streams and capture.depth_scale == 0.001
+    capture.set(CAP_PROP_POS_FRAMES, 2)
+    ret_val, color, depth = capture.read(return_depth=True)
+    assert ret_val and (color == 2).all() and (depth == 1002).all()
+    capture.release()
+
+    color_only = str(tmp_path / "color.o3draw")
+    with RawRecordingWriter(color_only, {"color": STREAMS["color"]}) as w:
+        w.write(color=np.zeros((6, 8, 3), np.uint8))
+    capture = RawVideoCapture(color_only)
+    assert "depth" not in capture.streams
+    with pytest.raises(ValueError):
+        capture.read(return_depth=True)
+    capture.release()
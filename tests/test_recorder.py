@@ -0,0 +1,83 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from o3dgui.recorder import BLOCK, DROP, AsyncRecorder
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+class SlowSink:
+    def __init__(self):
+        self.frames = []
+        self.gate = threading.Event()
+        self.closed = False
+
+    def write(self, frame):
+        self.gate.wait()
+        self.frames.append(int(frame[0]))
+
+    def close(self):
+        self.closed = True
+
+
+def test_frames_are_copied_written_in_order_and_flushed_on_close():
+    sink = SlowSink()
+    sink.gate.set()
+    recorder = AsyncRecorder(sink.write, sink.close, maxsize=4, policy=BLOCK)
+    frame = np.zeros(8, dtype=np.uint8)
+    for i in range(20):
+        frame[:] = i  # the caller reuses its buffer
+        assert recorder.submit(frame)
+    recorder.close()
+
+    assert sink.frames == list(range(20))
+    assert sink.closed
+    assert recorder.stats() == {"queued": 20, "written": 20, "dropped": 0, "pending": 0}
+    with pytest.raises(RuntimeError):
+        recorder.submit(frame)
+
+
+def test_drop_policy_never_blocks_the_capture_loop():
+    sink = SlowSink()
+    recorder = AsyncRecorder(sink.write, sink.close, maxsize=2, policy=DROP)
+    results = [recorder.submit(np.full(4, i, dtype=np.uint8)) for i in range(10)]
+    sink.gate.set()
+    recorder.close()
+
+    stats = recorder.stats()
+    assert stats["queued"] + stats["dropped"] == 10
+    assert stats["dropped"] >= 7
+    assert results.count(True) == stats["written"] == len(sink.frames)
+
+
+def test_block_policy_times_out_into_a_drop():
+    sink = SlowSink()
+    recorder = AsyncRecorder(sink.write, maxsize=1, policy=BLOCK)
+    recorder.submit(np.zeros(1))
+    while recorder.pending:  # wait for the writer to pick it up and stall
+        time.sleep(0.001)
+    recorder.submit(np.zeros(1))  # fills the queue
+    assert not recorder.submit(np.zeros(1), timeout=0.01)
+    sink.gate.set()
+    recorder.flush()
+    assert recorder.stats()["dropped"] == 1
+    recorder.close()
+
+
+def test_failing_close_still_stops_the_writer_thread():
+    def close():
+        raise OSError("No space left on device")
+
+    recorder = AsyncRecorder(lambda frame: None, close)
+    recorder.submit(np.zeros(4, np.uint8))
+    closer = threading.Thread(target=recorder.close)
+    closer.start()
+    closer.join(2.0)
+    assert not closer.is_alive()
+    assert isinstance(recorder.error, OSError)
+    assert recorder.frames_written == 1
@@ -0,0 +1,67 @@
+import time
+
+import numpy as np
+import pytest
+
+from o3dgui.rawformat import RawRecordingReader, RawRecordingWriter
+from o3dgui.replay import ReplayCapture, default_intrinsics, synthetic_frames
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def test_synthetic_frames():
+    frames = list(synthetic_frames(32, 24, count=3))
+    assert len(frames) == 3
+    assert frames[0]["color"].shape == (24, 32, 3)
+    assert frames[0]["depth"].dtype == np.uint16
+    assert (frames[0]["depth"] == 0).any() and frames[0]["depth"].max() > 0
+    assert not np.array_equal(frames[0]["depth"], frames[1]["depth"])
+
+
+def test_replay_recording_with_depth_and_loop(tmp_path):
+    path = str(tmp_path / "s.o3draw")
+    streams = {"color": ((4, 5, 3), np.uint8), "depth": ((4, 5), np.uint16)}
+    with RawRecordingWriter(path, streams, metadata={"depth_scale": 0.0001}) as w:
+        for i in range(3):
+            w.write(
+                color=np.full((4, 5, 3), i, np.uint8),
+                depth=np.full((4, 5), i, np.uint16),
+            )
+
+    capture = ReplayCapture(RawRecordingReader(path), loop=True)
+    assert capture.isOpened()
+    assert capture.depth_scale == 0.0001
+    assert (capture.intrinsics.width, capture.intrinsics.height) == (5, 4)
+    values = []
+    for _ in range(5):
+        ret_val, color, depth = capture.read(return_depth=True)
+        assert ret_val
+        values.append(int(depth[0, 0]))
+    assert values == [0, 1, 2, 0, 1]
+
+    buffer = np.empty((4, 5, 3), np.uint8)
+    ret_val, color = capture.read(buffer)
+    assert color is buffer and (buffer == 2).all()
+    capture.release()
+    assert capture.read() == (False, None)
+
+
+def test_iterator_source_ends_and_rate_is_configurable():
+    capture = ReplayCapture(synthetic_frames(8, 6, count=2))
+    assert capture.read()[0] and capture.read()[0]
+    assert capture.read(return_depth=True) == (False, None, None)
+    assert not capture.isOpened()
+
+    capture = ReplayCapture(synthetic_frames(8, 6, count=6), fps=100)
+    start = time.perf_counter()
+    while capture.read()[0]:
+        pass
+    assert time.perf_counter() - start == pytest.approx(0.06, abs=0.04)
+
+
+def test_default_intrinsics():
+    intrinsics = default_intrinsics(640, 480)
+    assert (intrinsics.width, intrinsics.height) == (640, 480)
+    assert intrinsics.ppx == pytest.approx(319.5)
@@ -0,0 +1,88 @@
+import threading
+
+import numpy as np
+import pytest
+
+from o3dgui.ringbuffer import FrameRingBuffer
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def test_latest_frame_wins_and_drops_are_counted():
+    ring = FrameRingBuffer((2, 2), np.uint16)
+    assert ring.write(np.full((2, 2), 1, dtype=np.uint16))  # reader idle: wake it up
+    assert not ring.write(
+        np.full((2, 2), 2, dtype=np.uint16)
+    )  # replaces unread frame 1
+    assert not ring.write(np.full((2, 2), 3, dtype=np.uint16))
+
+    with ring.read_latest() as (seq, frame):
+        assert seq == 3
+        assert (frame == 3).all()
+    with ring.read_latest() as (seq, frame):
+        assert seq == 3
+        assert frame is None
+
+    assert ring.stats() == {"written": 3, "read": 1, "dropped": 2}
+    assert ring.write(np.full((2, 2), 4, dtype=np.uint16))
+
+
+def test_slots_are_reused_in_place():
+    ring = FrameRingBuffer((4,), np.uint8, slots=3)
+    seen = set()
+    for i in range(6):
+        slot, buffer = ring.acquire()
+        buffer[:] = i
+        seen.add(buffer.__array_interface__["data"][0])
+        ring.publish(slot)
+    assert len(seen) == 3
+
+
+def test_writer_never_touches_slot_being_read():
+    ring = FrameRingBuffer((1,), np.int64)
+    ring.write(np.array([7]))
+    with ring.read_latest() as (_, frame):
+        for i in range(10):
+            ring.write(np.array([i]))
+        assert frame[0] == 7
+    seq, frame = ring.copy_latest()
+    assert seq == 11 and frame[0] == 9
+
+
+def test_abort_and_single_writer():
+    ring = FrameRingBuffer((1,), np.uint8)
+    slot, _ = ring.acquire()
+    with pytest.raises(RuntimeError):
+        ring.acquire()
+    ring.abort(slot)
+    assert ring.sequence == 0
+    with pytest.raises(ValueError):
+        FrameRingBuffer((1,), slots=2)
+
+
+def test_concurrent_reader_sees_increasing_sequences():
+    ring = FrameRingBuffer((64,), np.int64)
+    done = threading.Event()
+    sequences = []
+
+    def reader():
+        while not done.is_set():
+            with ring.read_latest() as (seq, frame):
+                if frame is not None:
+                    # a torn frame would mix values from two writes
+                    assert (frame == frame[0]).all()
+                    sequences.append(seq)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    for i in range(2000):
+        ring.write(np.full(64, i))
+    done.set()
+    thread.join()
+
+    assert sequences == sorted(set(sequences))
+    stats = ring.stats()
+    assert stats["written"] == 2000
+    assert stats["read"] + stats["dropped"] in (2000, 1999)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from o3dgui.pointcloud import DepthProjector
+from o3dgui.replay import default_intrinsics, synthetic_frames
+from o3dgui.roi import RegionOfInterest, parse_box, parse_window
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def _frame(width=64, height=48):
+    return next(synthetic_frames(width, height))
+
+
+def test_parse():
+    assert parse_window("1,2,30,40") == (1, 2, 30, 40)
+    np.testing.assert_array_equal(
+        parse_box("-1,-1,0.5,1,1,2"), [[-1, -1, 0.5], [1, 1, 2]]
+    )
+    with pytest.raises(ValueError):
+        parse_window("1,2")
+    with pytest.raises(ValueError):
+        RegionOfInterest(box=[[1, 0, 0], [0, 1, 1]])
+    with pytest.raises(ValueError):
+        RegionOfInterest(step=0)
+
+
+def test_crop_is_a_strided_view():
+    frame = _frame()
+    roi = RegionOfInterest((8, 4, 33, 20), step=(2, 3))
+    cropped = roi.bind(default_intrinsics(64, 48))
+    depth = roi.crop(frame["depth"])
+    assert np.shares_memory(depth, frame["depth"])
+    np.testing.assert_array_equal(depth, frame["depth"][4:24:3, 8:41:2])
+    assert (cropped.width, cropped.height) == depth.shape[::-1] == (17, 7)
+
+    with pytest.raises(RuntimeError):
+        RegionOfInterest().crop(frame["depth"])
+    with pytest.raises(ValueError):
+        RegionOfInterest((100, 100, 5, 5)).bind(default_intrinsics(64, 48))
+
+
+def test_roi_projection_matches_full_frame():
+    frame = _frame()
+    intrinsics = default_intrinsics(64, 48)
+    box = [[-0.3, -0.2, 0.5], [0.2, 0.3, 2.5]]
+    roi = RegionOfInterest((5, 3, 50, 40), box, step=2)
+    projector = DepthProjector.from_intrinsics(roi.bind(intrinsics), bounds=roi.bounds)
+    points, colors = projector.project(
+        roi.crop(frame["depth"]), roi.crop(frame["color"])
+    )
+
+    # Same pixels from the full frame, filtered after the fact
+    full = DepthProjector.from_intrinsics(intrinsics)
+    xyz = np.empty((48, 64, 3), np.float32)
+    np.multiply(full._rays, frame["depth"][..., np.newaxis], out=xyz)
+    keep = np.zeros((48, 64), bool)
+    keep[3:43:2, 5:55:2] = True
+    keep &= frame["depth"] > 0
+    keep &= ((xyz >= np.float32(box[0])) & (xyz <= np.float32(box[1]))).all(axis=-1)
+    assert 0 < len(points) < keep[3:43:2, 5:55:2].size
+    np.testing.assert_allclose(points, xyz[keep], rtol=1e-5)
+    np.testing.assert_allclose(colors, frame["color"][keep] / 255.0, rtol=1e-6)
+
+
+def test_box_tightens_the_pixel_window():
+    intrinsics = default_intrinsics(640, 480)
+    roi = RegionOfInterest(box=[[-0.1, -0.1, 1.0], [0.1, 0.1, 2.0]])
+    x0, y0, x1, y1 = roi.pixel_window(intrinsics)
+    assert 0 < x0 < intrinsics.ppx < x1 < 640 and 0 < y0 < intrinsics.ppy < y1 < 480
+    # The box corner nearest to the camera sets the extent
+    assert x1 - 1 >= intrinsics.fx * 0.1 + intrinsics.ppx
+    # Reaching the camera plane: the box could be anywhere in the image
+    assert RegionOfInterest(box=[[-0.1, -0.1, 0.0], [0.1, 0.1, 2.0]]).pixel_window(
+        intrinsics
+    ) == (0, 0, 640, 480)
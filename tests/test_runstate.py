@@ -0,0 +1,262 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from o3dgui.runstate import PAUSED, RUNNING, STOPPED, RunState
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def test_transitions():
+    state = RunState()
+    assert state.state == RUNNING
+    state.pause()
+    assert state.is_paused
+    assert not state.wait_until_running(timeout=0.001)
+    state.resume()
+    assert state.wait_until_running(timeout=0)
+    state.stop()
+    state.resume()
+    assert state.state == STOPPED
+    assert not state.wait_until_running()
+    with pytest.raises(ValueError):
+        RunState("sleeping")
+
+
+def test_paused_worker_is_idle_and_resumes_quickly():
+    state = RunState(PAUSED)
+    woke = []
+    iterations = [0]
+
+    def worker():
+        while state.wait_until_running():
+            woke.append(time.perf_counter())
+            iterations[0] += 1
+            state.pause()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+
+    cpu_start = time.process_time()
+    time.sleep(0.3)
+    cpu_paused = time.process_time() - cpu_start
+    assert iterations[0] == 0
+    # A spinning worker would burn the whole 0.3 s
+    assert cpu_paused < 0.05
+
+    latencies = []
+    for _ in range(20):
+        count = len(woke)
+        resumed = time.perf_counter()
+        state.resume()
+        while len(woke) == count:
+            time.sleep(0)
+        latencies.append(woke[-1] - resumed)
+        while not state.is_paused:
+            time.sleep(0)
+    state.stop()
+    thread.join(timeout=1)
+
+    assert not thread.is_alive()
+    latencies.sort()
+    assert latencies[len(latencies) // 2] < 0.005
+
+
+class _CountingCapture:
+    """Stands in for a camera: counts the frames the worker asks for"""
+
+    def __init__(self, shape=(4, 4, 3)):
+        self.shape = shape
+        self.reads = 0
+
+    def isOpened(self):
+        return True
+
+    def read(self, image=None):
+        self.reads += 1
+        if image is None or image.shape != self.shape:
+            image = np.empty(self.shape, np.uint8)
+        image.fill(self.reads % 256)
+        return True, image
+
+    def grab(self):
+        return True
+
+    def release(self):
+        pass
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def test_video_worker_stops_reading_while_paused():
+    pytest.importorskip("cv2")
+    pytest.importorskip("PySide6")
+    pytest.importorskip("pyrealsense2")
+    from video_worker_thread import VideoWorkerThread
+
+    state = {
+        "video_thread_is_running": True,
+        "video_is_pausing": False,
+        "video_is_recording": False,
+    }
+    parent = SimpleNamespace(params={"state": state})
+    worker = VideoWorkerThread(parent, "synthetic", fps=200, frame_size=(4, 4))
+    worker.PAUSE_POLL = 0.01
+    capture = worker.video_capture = _CountingCapture()
+    # Drive the loop on a plain thread, without a Qt event loop
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    try:
+        assert _wait_for(lambda: capture.reads >= 5)
+
+        # Through the GUI helpers
+        worker.pauseVideo()
+        assert _wait_for(lambda: worker.run_state.is_paused)
+        time.sleep(0.05)  # let a read that was in flight finish
+        reads = capture.reads
+        time.sleep(0.3)
+        assert capture.reads == reads
+        worker.resumeVideo()
+        assert _wait_for(lambda: capture.reads >= reads + 5)
+
+        # Flags flipped directly: picked up within PAUSE_POLL
+        state["video_is_pausing"] = True
+        assert _wait_for(lambda: worker.run_state.is_paused)
+        time.sleep(0.05)
+        reads = capture.reads
+        time.sleep(0.3)
+        assert capture.reads == reads
+        state["video_is_pausing"] = False
+        assert _wait_for(lambda: capture.reads >= reads + 5)
+    finally:
+        worker.stopVideo()
+        thread.join(timeout=2)
+    assert not thread.is_alive()
+    assert worker.run_state.is_stopped
+
+
+def test_video_worker_swaps_recorders_while_recording(tmp_path):
+    pytest.importorskip("cv2")
+    pytest.importorskip("PySide6")
+    pytest.importorskip("pyrealsense2")
+    from video_worker_thread import VideoWorkerThread
+
+    state = {
+        "video_thread_is_running": True,
+        "video_is_pausing": False,
+        "video_is_recording": True,
+    }
+    parent = SimpleNamespace(params={"state": state})
+    worker = VideoWorkerThread(parent, "synthetic", fps=500, frame_size=(4, 4))
+    capture = worker.video_capture = _CountingCapture()
+    errors = []
+
+    def run():
+        try:
+            worker.run()
+        except Exception as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    try:
+        assert _wait_for(lambda: capture.reads >= 5)
+        # The GUI thread restarts the recording under the running loop
+        for i in range(20):
+            worker.initializeRecorder(str(tmp_path / f"take{i}.o3draw"))
+            time.sleep(0.005)
+            worker.stopRecording()
+    finally:
+        worker.stopVideo()
+        thread.join(timeout=2)
+    worker.stopRecording()
+    assert not thread.is_alive()
+    assert errors == []
+
+
+def test_video_worker_swaps_depth_recorders_while_recording(tmp_path):
+    pytest.importorskip("cv2")
+    pytest.importorskip("PySide6")
+    pytest.importorskip("pyrealsense2")
+    from video_worker_thread import VideoWorkerThread
+
+    state = {
+        "video_thread_is_running": True,
+        "video_is_pausing": False,
+        "video_is_recording": True,
+    }
+    parent = SimpleNamespace(params={"state": state})
+    # Synthetic replay frames carry depth, so a depth recorder runs too
+    worker = VideoWorkerThread(parent, "synthetic", fps=500, frame_size=(32, 24))
+    errors = []
+
+    def run():
+        try:
+            worker.run()
+        except Exception as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    try:
+        assert _wait_for(lambda: getattr(worker, "frame", None) is not None)
+        for i in range(20):
+            worker.initializeRecorder(str(tmp_path / f"take{i}.o3draw"))
+            assert worker.depth_recorder is not None
+            time.sleep(0.005)
+            worker.stopRecording()
+    finally:
+        worker.stopVideo()
+        thread.join(timeout=2)
+    worker.stopRecording()
+    assert not thread.is_alive()
+    assert errors == []
+
+
+def test_video_worker_records_at_the_captured_size(tmp_path):
+    pytest.importorskip("cv2")
+    pytest.importorskip("PySide6")
+    pytest.importorskip("pyrealsense2")
+    from o3dgui.rawformat import RawRecordingReader
+    from video_worker_thread import VideoWorkerThread
+
+    state = {
+        "video_thread_is_running": True,
+        "video_is_pausing": False,
+        "video_is_recording": False,
+    }
+    parent = SimpleNamespace(params={"state": state})
+    # The file plays at 4x4 whatever frame_size says
+    worker = VideoWorkerThread(parent, "synthetic", fps=200, frame_size=(64, 48))
+    capture = worker.video_capture = _CountingCapture(shape=(4, 4, 3))
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    path = str(tmp_path / "take.o3draw")
+    try:
+        assert _wait_for(lambda: capture.reads >= 2)
+        worker.initializeRecorder(path)
+        state["video_is_recording"] = True
+        reads = capture.reads
+        assert _wait_for(lambda: capture.reads >= reads + 5)
+        state["video_is_recording"] = False
+        assert _wait_for(lambda: worker.recorder is None)
+    finally:
+        worker.stopVideo()
+        thread.join(timeout=2)
+    worker.stopRecording()
+
+    with RawRecordingReader(path) as reader:
+        assert reader.streams["color"][0] == (4, 4, 3)
+        assert len(reader) >= 5
@@ -0,0 +1,39 @@
+from o3dgui.scheduler import UpdateScheduler
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def test_pending_update_is_merged_and_runs_latest_data():
+    queue = []
+    shown = []
+    scheduler = UpdateScheduler(queue.append)
+
+    assert scheduler.submit("color_preview", shown.append, 1)
+    assert not scheduler.submit("color_preview", shown.append, 2)
+    assert not scheduler.submit("color_preview", shown.append, 3)
+    assert scheduler.submit("depth_preview", shown.append, "d")
+    assert len(queue) == 2
+    assert sorted(scheduler.pending()) == ["color_preview", "depth_preview"]
+
+    for func in queue:
+        func()
+    assert shown == [3, "d"]
+    assert scheduler.pending() == []
+    assert scheduler.merged == 2
+    assert scheduler.stats()["color_preview"] == {"posted": 1, "merged": 2, "run": 1}
+
+
+def test_backlog_stays_bounded_under_load():
+    queue = []
+    scheduler = UpdateScheduler(queue.append)
+    keys = ["color_preview", "depth_preview", "cloud_preview", "main_scene"]
+
+    for frame in range(1000):
+        for key in keys:
+            scheduler.submit(key, lambda data: None, frame)
+        if frame % 100 == 0:  # the GUI thread only gets to run now and then
+            while queue:
+                queue.pop(0)()
+        assert len(queue) <= len(keys)
@@ -0,0 +1,77 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from o3dgui.captureproc import CaptureProcess
+from o3dgui.sharedring import SharedFrameRing
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+STREAMS = {"color": ((4, 6, 3), "u1"), "points": ((10, 3), "f4")}
+
+
+@pytest.fixture
+def rings():
+    lock, event = multiprocessing.Lock(), multiprocessing.Event()
+    writer = SharedFrameRing.create(STREAMS, lock, event)
+    reader = SharedFrameRing.attach(writer.name, STREAMS, lock, event)
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def test_frames_cross_the_shared_block(rings):
+    writer, reader = rings
+    with reader.read_latest() as (_, views, _):
+        assert views is None
+
+    slot, out = writer.acquire()
+    out["color"][:] = 7
+    out["points"][:4] = np.arange(12).reshape(4, 3)
+    writer.publish(slot, meta=4)
+
+    assert reader.wait(0)
+    with reader.read_latest() as (sequence, views, count):
+        assert sequence == 1 and count == 4
+        assert (views["color"] == 7).all()
+        np.testing.assert_array_equal(
+            views["points"][:count], np.arange(12).reshape(4, 3)
+        )
+    assert not reader.has_unread()
+
+
+def test_latest_wins_and_reader_slot_is_never_reused(rings):
+    writer, reader = rings
+    for value in range(3):
+        slot, out = writer.acquire()
+        out["color"][:] = value
+        writer.publish(slot)
+
+    with reader.read_latest() as (sequence, views, _):
+        assert sequence == 3 and (views["color"] == 2).all()
+        # The writer keeps going while the reader holds its slot
+        for value in range(10, 20):
+            slot, out = writer.acquire()
+            out["color"][:] = value
+            writer.publish(slot)
+        assert (views["color"] == 2).all()
+    assert writer.stats() == {"written": 13, "read": 1, "dropped": 11}
+
+
+def test_capture_process_synthetic():
+    process = CaptureProcess("synthetic", fps=200)
+    with process:
+        assert process.info["intrinsics"]["width"] == 640
+        seen = []
+        for sequence, views, count in process.frames(timeout=5.0):
+            assert views["color"].shape == (480, 640, 3)
+            assert 0 < count <= 640 * 480
+            assert np.isfinite(views["points"][:count]).all()
+            seen.append(sequence)
+            if len(seen) == 3:
+                break
+    assert seen == sorted(seen)
+    assert process.ring is None
@@ -0,0 +1,128 @@
+import struct
+import threading
+import zlib
+
+import numpy as np
+import pytest
+
+from o3dgui.snapshot import (
+    ImageWriter,
+    clip_range,
+    cv2,
+    encode_png,
+    orbit_poses,
+    write_image,
+)
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def _decode_png(data):
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    offset, chunks = 8, {}
+    while offset < len(data):
+        (length,) = struct.unpack(">I", data[offset : offset + 4])
+        kind = data[offset + 4 : offset + 8]
+        body = data[offset + 8 : offset + 8 + length]
+        assert struct.unpack(">I", data[offset + 8 + length : offset + 12 + length])[
+            0
+        ] == zlib.crc32(kind + body)
+        chunks[kind] = body
+        offset += 12 + length
+    width, height, depth, color_type = struct.unpack(">IIBB", chunks[b"IHDR"][:10])
+    channels = {0: 1, 2: 3, 6: 4}[color_type]
+    rows = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), np.uint8).reshape(height, -1)
+    assert depth == 8 and not rows[:, 0].any()
+    return rows[:, 1:].reshape((height, width, channels)).squeeze()
+
+
+def _read_png(path):
+    if cv2 is not None:
+        return cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB)
+    with open(path, "rb") as file:
+        return _decode_png(file.read())
+
+
+def test_encode_png_round_trip():
+    rng = np.random.default_rng(0)
+    for shape in ((5, 7), (5, 7, 3), (5, 7, 4)):
+        image = rng.integers(0, 256, shape, dtype=np.uint8)
+        np.testing.assert_array_equal(_decode_png(encode_png(image)), image)
+    with pytest.raises(ValueError):
+        encode_png(np.zeros((2, 2), np.uint16))
+    with pytest.raises(ValueError):
+        encode_png(np.zeros((2, 2, 2), np.uint8))
+
+
+def test_orbit_poses():
+    center = np.array([1.0, 2.0, 3.0])
+    poses = orbit_poses(center, 2.0, 8, elevation=30.0)
+    assert len(poses) == 8
+    for pose in poses:
+        offset = pose.eye - center
+        assert np.linalg.norm(offset) == pytest.approx(2.0)
+        # 30 degrees towards "up", which is -y by default
+        assert -offset[1] == pytest.approx(1.0)
+        np.testing.assert_array_equal(pose.center, center)
+    assert poses[0].eye[2] < center[2]
+    np.testing.assert_allclose(
+        poses[4].eye - center, (poses[0].eye - center) * [-1, 1, -1], atol=1e-12
+    )
+
+
+def test_clip_range():
+    near, far = clip_range(np.zeros(3), np.array([2.0, 0.0, 0.0]), [0.0, 0.0, 5.0])
+    assert (near, far) == pytest.approx((4.0, 6.0))
+    # Inside the box: the near plane stays positive
+    near, far = clip_range(np.zeros(3), np.full(3, 10.0), [0.0, 0.0, 1.0])
+    assert 0 < near < far
+
+
+def test_image_writer(tmp_path):
+    images = [np.full((4, 6, 3), i, np.uint8) for i in range(6)]
+    paths = [str(tmp_path / f"{i}.png") for i in range(6)]
+    with ImageWriter(workers=2, max_pending=2) as writer:
+        futures = [writer.submit(path, image) for path, image in zip(paths, images)]
+    assert [future.result() for future in futures] == paths
+    for path, image in zip(paths, images):
+        np.testing.assert_array_equal(_read_png(path), image)
+
+    write_image(str(tmp_path / "raw.npy"), images[1])
+    np.testing.assert_array_equal(np.load(tmp_path / "raw.npy"), images[1])
+
+
+def test_image_writer_bounds_pending_images(tmp_path, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(
+        "o3dgui.snapshot.write_image",
+        lambda path, image, level: release.wait() and path,
+    )
+    writer = ImageWriter(workers=1, max_pending=1)
+    writer.submit("a", None)
+    blocked = threading.Thread(target=writer.submit, args=("b", None))
+    blocked.start()
+    blocked.join(0.1)
+    assert blocked.is_alive()
+    release.set()
+    blocked.join(1.0)
+    assert not blocked.is_alive()
+    writer.close()
+
+
+def test_render_batch_headless(tmp_path):
+    pytest.importorskip("open3d")
+    from o3dgui.snapshot import SnapshotRenderer
+
+    rng = np.random.default_rng(0)
+    renderer = SnapshotRenderer(64, 48)
+    renderer.set_points(
+        rng.random((1000, 3), dtype=np.float32), rng.random((1000, 3), dtype=np.float32)
+    )
+    poses = orbit_poses(np.full(3, 0.5), 3.0, 3)
+    paths = [str(tmp_path / f"{i}.png") for i in range(3)]
+    with ImageWriter(workers=2) as writer:
+        futures = renderer.render_batch(poses, paths, writer)
+    for future in futures:
+        assert _read_png(future.result()).shape == (48, 64, 3)
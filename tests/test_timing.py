@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from o3dgui.timing import LatencyMonitor, StageTimer
+
+__author__ = "akiragishinichi"
+__copyright__ = "akiragishinichi"
+__license__ = "MIT"
+
+
+def test_percentiles_over_ring_window():
+    timer = StageTimer("capture", size=100)
+    for i in range(250):
+        # the first 150 samples fall out of the ring
+        timer.record((1 if i < 150 else 2) * 1_000_000, end_ns=i * 10_000_000)
+    summary = timer.summary()
+    assert summary["count"] == 250
+    assert summary["p50_ms"] == pytest.approx(2.0)
+    assert summary["p99_ms"] == pytest.approx(2.0)
+    assert summary["fps"] == pytest.approx(100.0)
+    assert len(timer.samples()) == 100
+
+
+def test_measure_and_start_stop():
+    monitor = LatencyMonitor(size=8)
+    for _ in range(3):
+        with monitor.measure("pointcloud"):
+            time.sleep(0.002)
+    timer = monitor.stage("render")
+    timer.stop(timer.start())
+
+    snapshot = monitor.snapshot()
+    assert list(snapshot) == ["pointcloud", "render"]
+    assert snapshot["pointcloud"]["count"] == 3
+    assert snapshot["pointcloud"]["p50_ms"] >= 2.0
+    status = monitor.format_status()
+    assert status.startswith("pointcloud ") and " | render " in status
+
+
+def test_empty_stage():
+    summary = StageTimer("idle").summary()
+    assert summary == {
+        "count": 0,
+        "p50_ms": 0.0,
+        "p95_ms": 0.0,
+        "p99_ms": 0.0,
+        "fps": 0.0,
+    }